@@ -0,0 +1,70 @@
+"""Общее для бенчмарков: модули бота, временная база, заполнение, замеры.
+
+Бенчмарки запускаются из корня репозитория: python bench/<имя>.py --help
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Awaitable, Callable
+
+# Модули бота лежат в корне репозитория
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import COUNTRIES, GOALS, POSITIONS  # noqa: E402
+from database import Database, encode_goals, encode_positions  # noqa: E402
+
+
+@asynccontextmanager
+async def temp_database(**kwargs):
+    """Новая база во временной папке, удаляется вместе с ней.
+    Профилировщик SQL по умолчанию выключен: замеряется сама база"""
+    kwargs.setdefault('profile', False)
+    with tempfile.TemporaryDirectory(prefix='teamfinder-bench-') as tmp_dir:
+        db = Database(os.path.join(tmp_dir, 'bench.db'), **kwargs)
+        await db.connect()
+        await db.create_tables()
+        try:
+            yield db
+        finally:
+            await db.close()
+
+
+def seed_profiles(path: str, count: int, game: str = 'cs2', seed: int = 1):
+    """Пользователи 1..count со случайными анкетами в game.
+    Пишет напрямую через sqlite3, чтобы миллион анкет вставлялся за секунды"""
+    rnd = random.Random(seed)
+    countries = list(COUNTRIES)
+    db = sqlite3.connect(path)
+    with db:
+        db.executemany('INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)',
+                       ((user_id, f'user{user_id}') for user_id in range(1, count + 1)))
+        db.executemany('''
+            INSERT INTO profiles (user_id, game, country, positions_mask, goals_mask,
+                                  about_text, rating_sum, review_count, avg_rating)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (_random_profile(rnd, user_id, game, countries) for user_id in range(1, count + 1)))
+    db.close()
+
+
+def _random_profile(rnd: random.Random, user_id: int, game: str, countries: list) -> tuple:
+    reviews = rnd.choice([0, 0, 1, 3, 10, 30])
+    rating_sum = sum(rnd.randint(2, 5) for _ in range(reviews))
+    return (
+        user_id, game, rnd.choice(countries),
+        encode_positions(game, rnd.sample(POSITIONS[game], rnd.randint(1, 2))),
+        encode_goals(rnd.sample(GOALS, rnd.randint(1, 3))),
+        'Играю вечерами, ищу команду', rating_sum, reviews, rating_sum / reviews if reviews else 0,
+    )
+
+
+async def per_call(call: Callable[[int], Awaitable], count: int) -> float:
+    """Среднее время await call(i) в мс"""
+    started = time.perf_counter()
+    for i in range(count):
+        await call(i)
+    return (time.perf_counter() - started) / count * 1000
@@ -0,0 +1,56 @@
+"""Задержка одного запроса: новое соединение на вызов против пула Database.
+
+До user-001 каждый метод открывал aiosqlite.connect (поток, файл, схема)
+ради одного запроса. Здесь тот же запрос анкеты по user_id выполняется
+так и через пул; кэши Database обходятся, чтобы сравнивались соединения.
+
+    python bench/connection_pool.py
+    python bench/connection_pool.py --calls 5000 --concurrency 100
+"""
+import argparse
+import asyncio
+import time
+
+import aiosqlite
+
+from common import per_call, seed_profiles, temp_database
+
+QUERY = 'SELECT * FROM profiles WHERE user_id = ? AND game = ? AND is_active = 1'
+PROFILES = 1000
+
+
+async def main(args: argparse.Namespace):
+    async with temp_database() as db:
+        seed_profiles(db.db_path, PROFILES)
+
+        async def connect_per_call(i):
+            # Как методы Database до пула
+            async with aiosqlite.connect(db.db_path) as connection:
+                connection.row_factory = aiosqlite.Row
+                cursor = await connection.execute(QUERY, (i % PROFILES + 1, 'cs2'))
+                await cursor.fetchone()
+
+        async def pooled(i):
+            async with db._read() as connection:
+                async with connection.execute(QUERY, (i % PROFILES + 1, 'cs2')) as cursor:
+                    await cursor.fetchone()
+
+        async def concurrent(call):
+            """Среднее время на вызов при concurrency одновременных"""
+            started = time.perf_counter()
+            for offset in range(0, args.calls, args.concurrency):
+                await asyncio.gather(*(call(offset + i) for i in range(args.concurrency)))
+            return (time.perf_counter() - started) / args.calls * 1000
+
+        print(f"Запросов анкеты: {args.calls}, читателей в пуле: {db.readers}")
+        print(f"  соединение на вызов: {await per_call(connect_per_call, args.calls):.3f} мс/вызов, "
+              f"по {args.concurrency} одновременно {await concurrent(connect_per_call):.3f} мс/вызов")
+        print(f"  пул:                 {await per_call(pooled, args.calls):.3f} мс/вызов, "
+              f"по {args.concurrency} одновременно {await concurrent(pooled):.3f} мс/вызов")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
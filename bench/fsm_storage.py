@@ -0,0 +1,98 @@
+"""Задержка get/set состояния FSM: MemoryStorage против SQLiteStorage.
+
+SQLiteStorage замеряется с горячим кэшем (активные пользователи в памяти)
+и с холодным (кэш на одну запись: каждое чтение идет в БД). Запись
+в БД идет через очередь групповой записи и в замер не входит, кроме
+коммита пачки в конце; последняя строка - память при 100k пользователей.
+
+    python bench/fsm_storage.py
+    python bench/fsm_storage.py --calls 50000 --users 5000
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from common import temp_database
+from states import SearchState
+from storage import SQLiteStorage
+
+OPERATIONS = ('set_state', 'get_state', 'update_data', 'get_data')
+
+
+def key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+async def call(storage, operation: str, i: int, users: int):
+    storage_key = key(i % users + 1)
+    if operation == 'set_state':
+        await storage.set_state(storage_key, SearchState.viewing_profiles)
+    elif operation == 'get_state':
+        await storage.get_state(storage_key)
+    elif operation == 'update_data':
+        await storage.update_data(storage_key, {'search_game': 'dota2', 'current_profile_id': i})
+    else:
+        await storage.get_data(storage_key)
+
+
+async def measure(name: str, storage, args: argparse.Namespace, db=None):
+    timings = {}
+    for operation in OPERATIONS:
+        started = time.perf_counter()
+        for i in range(args.calls):
+            await call(storage, operation, i, args.users)
+        if db:
+            await db.flush()
+        timings[operation] = (time.perf_counter() - started) / args.calls * 1e6
+    print(f"  {name:<24}" + ''.join(f"{timings[operation]:>13.1f}" for operation in OPERATIONS))
+
+
+async def sqlite_storage_mib(users: int, maxsize: int) -> float:
+    """МиБ, занятые состояниями users пользователей при кэше на maxsize"""
+    async with temp_database() as db:
+        storage = SQLiteStorage(db, maxsize=maxsize)
+        tracemalloc.start()
+        for user_id in range(1, users + 1):
+            await storage.set_state(key(user_id), SearchState.viewing_profiles)
+            await storage.set_data(key(user_id), {'search_game': 'cs2'})
+        await db.flush()
+        used = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    return used / 2 ** 20
+
+
+async def memory_storage_mib(users: int) -> float:
+    """МиБ, занятые состояниями users пользователей в MemoryStorage"""
+    storage = MemoryStorage()
+    tracemalloc.start()
+    for user_id in range(1, users + 1):
+        await storage.set_state(key(user_id), SearchState.viewing_profiles)
+        await storage.set_data(key(user_id), {'search_game': 'cs2'})
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return used / 2 ** 20
+
+
+async def main(args: argparse.Namespace):
+    print(f"Вызовов на операцию: {args.calls}, пользователей: {args.users}, мкс на вызов")
+    print(f"  {'':<24}" + ''.join(f"{operation:>13}" for operation in OPERATIONS))
+    await measure('MemoryStorage', MemoryStorage(), args)
+    async with temp_database() as db:
+        await measure('SQLiteStorage, горячий', SQLiteStorage(db), args, db)
+        await measure('SQLiteStorage, холодный', SQLiteStorage(db, maxsize=1), args, db)
+
+    memory_users = 100_000
+    print(f"\nПамять на {memory_users} пользователей: MemoryStorage "
+          f"{await memory_storage_mib(memory_users):.1f} МиБ, SQLiteStorage с кэшем на 10000 "
+          f"{await sqlite_storage_mib(memory_users, 10_000):.1f} МиБ")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=1000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,79 @@
+"""Обработчики выбора позиций и целей (handle_position, handle_goal)
+с клавиатурами из кэша keyboards.py и с пересборкой на каждое нажатие.
+
+Без кэша клавиатура собирается заново, как до user-018, через исходную
+функцию под lru_cache (__wrapped__). Состояние - MemoryStorage, ответы
+Telegram - пустые заглушки: замеряется только работа обработчика.
+
+    python bench/keyboards.py
+    python bench/keyboards.py --calls 50000
+"""
+import argparse
+import asyncio
+import time
+from unittest import mock
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+import common  # noqa: F401  модули бота в sys.path
+import keyboards
+from config import GOALS, POSITIONS
+from handlers import profile
+
+
+class FakeMessage:
+    async def edit_reply_markup(self, reply_markup=None):
+        pass
+
+
+class FakeCallback:
+    def __init__(self, data: str):
+        self.data = data
+        self.message = FakeMessage()
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+
+def toggles(prefix: str, values: list) -> list:
+    """Нажатия: отметить все значения по очереди, затем снять"""
+    return ([FakeCallback(f'{prefix}_add:{value}') for value in values]
+            + [FakeCallback(f'{prefix}_remove:{value}') for value in values])
+
+
+def uncached_positions_kb(game, selected=None):
+    return keyboards._positions_kb.__wrapped__(game, frozenset(selected or []) & frozenset(POSITIONS.get(game, [])))
+
+
+def uncached_goals_kb(selected=None):
+    return keyboards._goals_kb.__wrapped__(frozenset(selected or []) & frozenset(GOALS))
+
+
+async def per_call_us(handler, callbacks: list, calls: int) -> float:
+    state = FSMContext(MemoryStorage(), StorageKey(bot_id=1, chat_id=1, user_id=1))
+    await state.update_data(game='dota2', positions=[], goals=[])
+    started = time.perf_counter()
+    for i in range(calls):
+        await handler(callbacks[i % len(callbacks)], state)
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+async def main(args: argparse.Namespace):
+    cases = (
+        ('handle_position', profile.handle_position, toggles('pos', POSITIONS['dota2'][:3]),
+         'get_positions_kb', uncached_positions_kb),
+        ('handle_goal', profile.handle_goal, toggles('goal', GOALS[:3]), 'get_goals_kb', uncached_goals_kb),
+    )
+    for name, handler, callbacks, keyboard, uncached in cases:
+        cached = await per_call_us(handler, callbacks, args.calls)
+        with mock.patch.object(profile, keyboard, uncached):
+            rebuilt = await per_call_us(handler, callbacks, args.calls)
+        print(f"{name:<16} пересборка {rebuilt:7.1f} мкс, кэш {cached:6.1f} мкс на нажатие")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=20000)
+    asyncio.run(main(parser.parse_args()))
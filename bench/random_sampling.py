@@ -0,0 +1,52 @@
+"""Выбор следующей анкеты: ORDER BY RANDOM() против случайной пробы profile_id.
+
+Старый запрос сортировал всех кандидатов на каждый свайп, и время росло
+с числом анкет; get_next_profile ищет от случайного profile_id по индексу.
+Время get_next_profile включает постановку просмотра в очередь записи.
+
+    python bench/random_sampling.py
+    python bench/random_sampling.py --sizes 10000 100000
+"""
+import argparse
+import asyncio
+import json
+
+from common import per_call, seed_profiles, temp_database
+
+# Прежний get_next_profile (до user-004), просмотренные - списком в параметре
+ORDER_BY_RANDOM = '''
+    SELECT p.*, u.username FROM profiles p
+    JOIN users u ON p.user_id = u.user_id
+    WHERE p.game = ? AND p.user_id != ? AND p.is_active = 1
+    AND p.user_id NOT IN (SELECT value FROM json_each(?))
+    ORDER BY RANDOM() LIMIT 1
+'''
+VIEWER_ID = 7
+
+
+async def run(size: int, swipes: int):
+    async with temp_database() as db:
+        seed_profiles(db.db_path, size)
+
+        async def order_by_random(_):
+            viewed = json.dumps(list(await db.get_viewed_ids(VIEWER_ID, 'cs2')))
+            async with db._read() as r:
+                async with r.execute(ORDER_BY_RANDOM, ('cs2', VIEWER_ID, viewed)) as cursor:
+                    await cursor.fetchone()
+
+        old = await per_call(order_by_random, max(3, swipes // 20))
+        new = await per_call(lambda _: db.get_next_profile(VIEWER_ID, 'cs2'), swipes)
+        print(f"{size:>9} анкет: ORDER BY RANDOM() {old:8.2f} мс, проба profile_id {new:6.2f} мс на свайп")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--swipes', type=int, default=300, help="свайпов одного зрителя на замер")
+    args = parser.parse_args()
+    for size in args.sizes:
+        asyncio.run(run(size, args.swipes))
+
+
+if __name__ == '__main__':
+    main()
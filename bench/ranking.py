@@ -0,0 +1,61 @@
+"""Пропускная способность ранжирования по совместимости (ranking.py).
+
+Замеряет загрузку индекса игры из БД, векторный подсчет оценок всех
+анкет для одного зрителя (score) и полный get_candidates с исключением
+просмотренных и выбором лучших.
+
+    python bench/ranking.py
+    python bench/ranking.py --sizes 10000 100000 1000000
+"""
+import argparse
+import asyncio
+import time
+
+from common import seed_profiles, temp_database
+from ranking import CompatibilityRanker
+
+VIEWER_ID = 1
+
+
+def median_ms(timings: list) -> float:
+    return sorted(timings)[len(timings) // 2] * 1000
+
+
+async def run(size: int, repeats: int):
+    async with temp_database() as db:
+        seed_profiles(db.db_path, size, game='dota2')
+        ranker = CompatibilityRanker(db)
+
+        started = time.perf_counter()
+        index = await ranker._index('dota2')
+        load = (time.perf_counter() - started) * 1000
+        viewer = await db.get_profile(VIEWER_ID, 'dota2')
+
+        scores = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            ranker.score(index, 'dota2', viewer)
+            scores.append(time.perf_counter() - started)
+
+        candidates = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            await ranker.get_candidates(VIEWER_ID, 'dota2', 20)
+            candidates.append(time.perf_counter() - started)
+
+    score = median_ms(scores)
+    print(f"{size:>9} анкет: индекс {load:7.0f} мс, score {score:7.2f} мс "
+          f"({size / score / 1000:5.1f} млн анкет/с), get_candidates(20) {median_ms(candidates):7.2f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--repeats', type=int, default=50)
+    args = parser.parse_args()
+    for size in args.sizes:
+        asyncio.run(run(size, args.repeats))
+
+
+if __name__ == '__main__':
+    main()
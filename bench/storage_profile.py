@@ -0,0 +1,76 @@
+"""Чтение и запись одновременно под смешанной нагрузкой свайпов:
+журнал отката SQLite по умолчанию против профиля DB_PRAGMAS (WAL).
+
+Свайперы берут анкету (get_next_profile) и лайкают ее (add_like), читатели
+в это же время листают входящие лайки случайных игроков (get_incoming_likes).
+В режиме журнала отката коммит блокирует чтение, в WAL - нет. Групповая
+запись делает коммиты редкими; --no-write-batching коммитит каждую операцию.
+
+    python bench/storage_profile.py
+    python bench/storage_profile.py --no-write-batching
+    python bench/storage_profile.py --seconds 10 --swipers 16 --readers 16
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from common import seed_profiles, temp_database
+from config import DB_PRAGMAS
+
+PROFILES = 5000
+PROFILES_BY_NAME = {
+    # Как до user-002: PRAGMA не задавались, кроме ожидания блокировки
+    'журнал отката': {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'busy_timeout': 5000},
+    'DB_PRAGMAS': DB_PRAGMAS,
+}
+
+
+def p95(values: list) -> float:
+    values = sorted(values)
+    return values[int(0.95 * len(values))] * 1000 if values else 0.0
+
+
+async def run(name: str, pragmas: dict, args: argparse.Namespace):
+    batching = {'write_delay': 0, 'write_queue_size': 1} if args.no_write_batching else {}
+    async with temp_database(pragmas=pragmas, **batching) as db:
+        seed_profiles(db.db_path, PROFILES)
+        stop = time.perf_counter() + args.seconds
+        swipes, reads = [], []
+
+        async def swiper(viewer_id: int):
+            while time.perf_counter() < stop:
+                started = time.perf_counter()
+                profile = await db.get_next_profile(viewer_id, 'cs2')
+                if profile:
+                    await db.add_like(viewer_id, profile['user_id'], 'cs2')
+                swipes.append(time.perf_counter() - started)
+
+        async def reader(seed: int):
+            rnd = random.Random(seed)
+            while time.perf_counter() < stop:
+                started = time.perf_counter()
+                await db.get_incoming_likes(rnd.randint(1, PROFILES), limit=20)
+                reads.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(swiper(viewer_id) for viewer_id in range(1, args.swipers + 1)),
+                             *(reader(seed) for seed in range(args.readers)))
+
+    print(f"  {name:<14}{len(swipes) / args.seconds:>8.0f} свайпов/с, p95 {p95(swipes):6.1f} мс"
+          f"{len(reads) / args.seconds:>8.0f} чтений/с, p95 {p95(reads):6.1f} мс")
+
+
+async def main(args: argparse.Namespace):
+    print(f"Свайперов: {args.swipers}, читателей: {args.readers}, {args.seconds} с на профиль, "
+          f"групповая запись: {'нет' if args.no_write_batching else 'да'}")
+    for name, pragmas in PROFILES_BY_NAME.items():
+        await run(name, pragmas, args)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--swipers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--no-write-batching', action='store_true', help="коммит на каждую операцию записи")
+    asyncio.run(main(parser.parse_args()))
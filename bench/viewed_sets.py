@@ -0,0 +1,156 @@
+"""Просмотренные анкеты: строка на просмотр (viewed_profiles) против
+упакованных частей по диапазонам id (viewed_chunks).
+
+Диск: одни и те же просмотры в старой таблице и после миграции,
+размер таблиц и индексов по dbstat после VACUUM. Время: запись одного
+просмотра (с коммитом), чтение множества зрителя и сброс при n просмотров.
+
+    python bench/viewed_sets.py
+    python bench/viewed_sets.py --viewers 1000 --views 500 --sizes 1000 10000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from array import array
+
+from common import Database, per_call, temp_database
+
+# Схема до user-006
+LEGACY_TABLE = '''
+    CREATE TABLE viewed_profiles (
+        view_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        viewer_id INTEGER,
+        viewed_id INTEGER,
+        game TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(viewer_id, viewed_id, game)
+    )
+'''
+MAX_USER_ID = 1_000_000
+VIEWER_ID = 1
+
+
+def table_sizes(path: str) -> dict:
+    """Байты на диске по таблицам и индексам после VACUUM"""
+    db = sqlite3.connect(path)
+    db.execute('VACUUM')
+    sizes = dict(db.execute('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name'))
+    db.close()
+    return sizes
+
+
+async def migrate(path: str, rnd: random.Random, viewers: int, views: int):
+    """Старая таблица с просмотрами и ее перенос в create_tables,
+    как при первом запуске новой версии"""
+    legacy = sqlite3.connect(path)
+    with legacy:
+        legacy.execute(LEGACY_TABLE)
+        legacy.executemany(
+            "INSERT INTO viewed_profiles (viewer_id, viewed_id, game) VALUES (?, ?, 'cs2')",
+            ((viewer_id, viewed_id) for viewer_id in range(1, viewers + 1)
+             for viewed_id in rnd.sample(range(1, MAX_USER_ID), views))
+        )
+    legacy.close()
+    before = table_sizes(path)
+
+    started = time.perf_counter()
+    db = Database(path, profile=False)
+    await db.connect()
+    await db.create_tables()
+    await db.close()
+    return before, table_sizes(path), time.perf_counter() - started
+
+
+async def compare_disk(viewers: int, views: int):
+    rnd = random.Random(1)
+    with tempfile.TemporaryDirectory(prefix='teamfinder-bench-') as tmp_dir:
+        path = os.path.join(tmp_dir, 'legacy.db')
+        before, after, migration = await migrate(path, rnd, viewers, views)
+
+    total = viewers * views
+    old = sum(size for name, size in before.items() if 'viewed_profiles' in name)
+    new = after.get('viewed_chunks', 0)
+    print(f"{viewers} зрителей по {views} просмотров ({total} всего), миграция {migration:.1f} с")
+    for name, size in sorted(before.items()):
+        if 'viewed_profiles' in name:
+            print(f"  {name:<40}{size / 2 ** 20:8.1f} МиБ")
+    print(f"  viewed_profiles с индексами: {old / 2 ** 20:.1f} МиБ, {old / total:.1f} байт на просмотр")
+    print(f"  viewed_chunks:               {new / 2 ** 20:.1f} МиБ, {new / total:.1f} байт на просмотр"
+          f" (в {old / new:.0f} раз меньше)")
+    # В памяти множество зрителя (get_viewed_ids) - array('q'), а не set[int]
+    ids = rnd.sample(range(1, MAX_USER_ID), views)
+    as_set = set(ids)
+    set_bytes = sys.getsizeof(as_set) + sum(sys.getsizeof(value) for value in as_set)
+    print(f"  в памяти на зрителя: array {sys.getsizeof(array('q', sorted(ids))) / 1024:.0f} КиБ,"
+          f" set[int] {set_bytes / 1024:.0f} КиБ")
+
+
+async def compare_latency(size: int, samples: int):
+    """Обе схемы в одной базе через соединения Database: старая - как до
+    user-006, с коммитом на каждый просмотр"""
+    rnd = random.Random(size)
+    viewed = rnd.sample(range(1, MAX_USER_ID), size + samples)
+    async with temp_database() as db:
+        async with db._write() as w:
+            await w.execute(LEGACY_TABLE)
+            await w.executemany("INSERT INTO viewed_profiles (viewer_id, viewed_id, game) VALUES (?, ?, 'cs2')",
+                                [(VIEWER_ID, viewed_id) for viewed_id in viewed[:size]])
+        for viewed_id in viewed[:size]:
+            await db.mark_viewed(VIEWER_ID, viewed_id, 'cs2')
+        await db.flush()
+
+        async def legacy_write(i):
+            async with db._write() as w:
+                await w.execute("INSERT OR IGNORE INTO viewed_profiles (viewer_id, viewed_id, game) "
+                                "VALUES (?, ?, 'cs2')", (VIEWER_ID, viewed[size + i]))
+
+        async def write(i):
+            await db.mark_viewed(VIEWER_ID, viewed[size + i], 'cs2')
+            await db.flush()
+
+        async def legacy_read(_):
+            async with db._read() as r:
+                async with r.execute("SELECT viewed_id FROM viewed_profiles WHERE viewer_id = ? AND game = 'cs2'",
+                                     (VIEWER_ID,)) as cursor:
+                    await cursor.fetchall()
+
+        async def legacy_reset(_):
+            async with db._write() as w:
+                await w.execute("DELETE FROM viewed_profiles WHERE viewer_id = ? AND game = 'cs2'", (VIEWER_ID,))
+
+        old_write, new_write = await per_call(legacy_write, samples), await per_call(write, samples)
+        old_read = await per_call(legacy_read, samples)
+        new_read = await per_call(lambda _: db.get_viewed_ids(VIEWER_ID, 'cs2'), samples)
+        async with db._read() as r:
+            async with r.execute('SELECT COUNT(*) FROM viewed_chunks WHERE viewer_id = ?', (VIEWER_ID,)) as cursor:
+                chunks = (await cursor.fetchone())[0]
+        # Сброс теперь удаляет все части зрителя, а не одну строку
+        old_reset = await per_call(legacy_reset, 1)
+        new_reset = await per_call(lambda _: db.reset_viewed_profiles(VIEWER_ID, 'cs2'), 1)
+
+    print(f"{size + samples:>7} просмотров, частей {chunks:>3}: запись {old_write:.3f} -> {new_write:.3f} мс, "
+          f"чтение {old_read:.3f} -> {new_read:.3f} мс, сброс {old_reset:.2f} -> {new_reset:.2f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--viewers', type=int, default=2000)
+    parser.add_argument('--views', type=int, default=500, help="просмотров на зрителя для сравнения диска")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 30_000],
+                        help="просмотров у зрителя для замеров времени")
+    parser.add_argument('--samples', type=int, default=200)
+    args = parser.parse_args()
+
+    asyncio.run(compare_disk(args.viewers, args.views))
+    print("\nстрока на просмотр -> части viewed_chunks:")
+    for size in args.sizes:
+        asyncio.run(compare_latency(size, args.samples))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,29 @@
 import asyncio
+import ipaddress
 import logging
+import signal
+from contextlib import suppress
+from typing import Optional, Tuple
+
+from aiohttp import web
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
-from config import BOT_TOKEN
+from config import (
+    BOT_TOKEN, SEARCH_MODE, BOT_MODE, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT,
+    WEBHOOK_SECRET, WEBHOOK_BACKGROUND, METRICS_HOST, METRICS_PORT
+)
 from database import Database
+from feed import CandidateFeed
+from cards import ProfileCards
+from outbox import Outbox
+from notifications import MatchNotifier
+from metrics import Metrics
+from storage import SQLiteStorage
+from ranking import CompatibilityRanker
 
 # Импортируем обработчики
-from handlers import start, profile, search, matches
+from handlers import start, profile, search, matches, admin
 
 # Настройка логирования
 logging.basicConfig(
@@ -17,28 +33,165 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-async def main():
-    # Инициализация бота и диспетчера
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
+def is_loopback(host: str) -> bool:
+    """Адрес доступен только с этой машины"""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
 
-    # Инициализация базы данных
-    db = Database()
-    await db.create_tables()
+
+class WebhookHandler(SimpleRequestHandler):
+    """SimpleRequestHandler, который при остановке дожидается обновлений,
+    принятых в фоне (handle_in_background): иначе shutdown() закроет
+    уведомления, Outbox и базу посреди их обработки"""
+
+    async def close(self):
+        # Сессию бота закрывает shutdown() после уведомлений и Outbox
+        await self.drain()
+
+    async def drain(self):
+        """Ждет фоновые задачи обработки, в том числе начатые во время ожидания"""
+        while self._background_feed_update_tasks:
+            await asyncio.gather(*self._background_feed_update_tasks, return_exceptions=True)
+
+
+def create_webhook_app(dp: Dispatcher, bot: Bot, secret: Optional[str] = WEBHOOK_SECRET,
+                       background: bool = WEBHOOK_BACKGROUND) -> Tuple[web.Application, WebhookHandler]:
+    """Приложение aiohttp с вебхуком на WEBHOOK_PATH.
+    Общее для run_webhook, тестов и нагрузочного теста (loadtest.py --mode webhook)"""
+    app = web.Application()
+    # handle_in_background: Telegram сразу получает ответ, а обновления
+    # обрабатываются параллельно отдельными задачами
+    handler = WebhookHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=background,
+        secret_token=secret or None
+    )
+    handler.register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    return app, handler
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """Прием обновлений aiohttp-сервером до SIGINT/SIGTERM"""
+    # Без секрета любой, кто достучится до порта, может прислать поддельное
+    # обновление, в том числе от имени ADMIN_ID
+    if not WEBHOOK_SECRET and not is_loopback(WEBHOOK_HOST):
+        raise RuntimeError(
+            f"WEBHOOK_SECRET не задан, а вебхук слушает {WEBHOOK_HOST}: "
+            "задайте секрет или WEBHOOK_HOST=127.0.0.1"
+        )
+
+    app, handler = create_webhook_app(dp, bot)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    logger.info("Вебхук слушает %s:%d%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+
+    if not WEBHOOK_SECRET:
+        logger.warning("WEBHOOK_SECRET не задан: запросы к вебхуку не проверяются (только локальный адрес)")
+
+    # Без WEBHOOK_URL сервер только принимает POST (локальная проверка)
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            WEBHOOK_URL + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+
+    try:
+        await stop.wait()
+    finally:
+        # Остановка сервера ждет обработку в фоне (WebhookHandler.close),
+        # drain - для запросов, дочитанных уже после этого
+        await runner.cleanup()
+        await handler.drain()
+
+
+def create_dispatcher(bot: Bot, db: Database, outbox: Optional[Outbox] = None,
+                      metrics: Optional[Metrics] = None) -> Dispatcher:
+    """Диспетчер со всеми роутерами и зависимостями обработчиков.
+    Общий для запуска бота и нагрузочного теста (loadtest.py)"""
+    ranker = CompatibilityRanker(db) if SEARCH_MODE == 'ranked' else None
+    feed = CandidateFeed(db, ranker=ranker)
+    cards = ProfileCards(db)
+    # Состояния FSM хранятся в той же базе и переживают перезапуск
+    storage = SQLiteStorage(db)
+    outbox = outbox or Outbox()
+    notifier = MatchNotifier(bot, db)
+
+    # db, feed, cards, outbox и notifier передаются в обработчики как аргументы
+    dp = Dispatcher(storage=storage, db=db, feed=feed, cards=cards, outbox=outbox, notifier=notifier)
+    if metrics:
+        metrics.setup(dp, bot)
+    # Все запросы к Bot API проходят через лимиты отправки (после замера метрик)
+    bot.session.middleware(outbox)
 
     # Регистрация роутеров
     dp.include_router(start.router)
     dp.include_router(profile.router)
     dp.include_router(search.router)
     dp.include_router(matches.router)
+    dp.include_router(admin.router)
+    return dp
+
+
+async def shutdown(dp: Dispatcher, bot: Bot):
+    """Дописывает уведомления, запросы и отложенные записи и закрывает все"""
+    await dp['notifier'].close()
+    await dp['outbox'].close()
+    await bot.session.close()
+    await dp['feed'].close()
+    await dp.storage.close()
+    # Дописывает очередь отложенных записей перед выходом
+    await dp['db'].close()
+
+
+async def main():
+    # Инициализация базы данных: один пул соединений на весь процесс
+    db = Database()
+    await db.connect()
+    await db.create_tables()
+
+    # Рейтинги ведутся инкрементально; сверяем их с отзывами при старте
+    mismatches = await db.check_rating_aggregates(fix=True)
+    if mismatches:
+        logger.warning("Исправлены рейтинги %d анкет", len(mismatches))
+
+    # Инициализация бота и диспетчера
+    bot = Bot(token=BOT_TOKEN)
+    metrics = Metrics() if METRICS_PORT else None
+    dp = create_dispatcher(bot, db, metrics=metrics)
+
+    metrics_runner = None
+    if metrics:
+        metrics_runner = await metrics.serve(METRICS_HOST, METRICS_PORT)
+        logger.info("Метрики: http://%s:%d/metrics", METRICS_HOST, METRICS_PORT)
 
     # Запуск бота
     logger.info("Бот запущен")
 
     try:
-        await dp.start_polling(bot)
+        if BOT_MODE == 'webhook':
+            await run_webhook(dp, bot)
+        else:
+            # Зарегистрированный ранее вебхук не дает работать getUpdates
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
     finally:
-        await bot.session.close()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await shutdown(dp, bot)
 
 
 if __name__ == "__main__":
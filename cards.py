@@ -0,0 +1,84 @@
+from typing import Optional, Dict, NamedTuple
+
+from aiogram.types import Message, InlineKeyboardMarkup
+
+from cache import LRUCache
+from config import GAMES, CARD_CACHE_SIZE, CARD_CACHE_TTL
+from database import Database
+
+
+class Card(NamedTuple):
+    """Готовая карточка анкеты: HTML-текст и file_id скриншота"""
+    text: str
+    photo: Optional[str]
+
+
+def render_card(profile: Dict, title: str, links: bool = False) -> Card:
+    """Карточка анкеты с заголовком title; links - добавить ссылки на профили"""
+    text = title
+
+    if profile.get('country'):
+        text += f"🌍 Страна: {profile['country']}\n"
+
+    if profile.get('positions'):
+        text += f"🎯 Позиции: {', '.join(profile['positions'])}\n"
+
+    if profile.get('goals'):
+        text += f"🎮 Цели: {', '.join(profile['goals'])}\n"
+
+    if links:
+        if profile.get('steam_link'):
+            text += f"📎 Steam: {profile['steam_link']}\n"
+
+        if profile.get('faceit_link'):
+            text += f"📎 FaceIT: {profile['faceit_link']}\n"
+
+        if profile.get('dotabuff_link'):
+            text += f"📎 Dotabuff: {profile['dotabuff_link']}\n"
+
+    if (profile.get('avg_rating') or 0) > 0:
+        text += f"⭐ Рейтинг: {profile['avg_rating']:.1f} ({profile['review_count']} отзывов)\n"
+
+    if profile.get('about_text'):
+        text += f"\n📝 О себе:\n{profile['about_text']}\n"
+
+    return Card(text, profile.get('rating_screenshot'))
+
+
+async def send_card(message: Message, card: Card, reply_markup: Optional[InlineKeyboardMarkup] = None):
+    """Отправляет карточку фото с подписью или текстом, если скриншота нет"""
+    if card.photo:
+        await message.answer_photo(
+            photo=card.photo,
+            caption=card.text,
+            reply_markup=reply_markup,
+            parse_mode="HTML"
+        )
+    else:
+        await message.answer(
+            card.text,
+            reply_markup=reply_markup,
+            parse_mode="HTML"
+        )
+
+
+class ProfileCards:
+    """Карточки анкет для поиска: одна отрисовка на анкету, сколько бы
+    зрителей ее ни смотрели. Сбрасывается при изменении анкеты или рейтинга"""
+
+    def __init__(self, db: Database, maxsize: int = CARD_CACHE_SIZE, ttl: float = CARD_CACHE_TTL):
+        self.cache = LRUCache(maxsize, ttl)
+        db.add_profile_listener(self.invalidate)
+
+    def get(self, profile: Dict) -> Card:
+        key = (profile['user_id'], profile['game'])
+        card = self.cache.get(key)
+        if card is None:
+            title = f"🎮 <b>{GAMES.get(profile['game'])}</b>\n"
+            title += f"👤 <b>{profile['username']}</b>\n\n"
+            card = render_card(profile, title)
+            self.cache.set(key, card)
+        return card
+
+    def invalidate(self, user_id: int, game: str):
+        self.cache.invalidate((user_id, game))
@@ -7,6 +7,86 @@ load_dotenv()
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 ADMIN_ID = int(os.getenv('ADMIN_ID', 0))
 
+# Получение обновлений: polling - long polling, webhook - aiohttp-сервер
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # внешний адрес без пути; пусто - вебхук не регистрируется
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8080))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')  # заголовок X-Telegram-Bot-Api-Secret-Token; обязателен, если WEBHOOK_HOST не локальный
+WEBHOOK_BACKGROUND = os.getenv('WEBHOOK_BACKGROUND', '1') == '1'  # ответ Telegram до обработки
+
+# Лимиты исходящих сообщений (outbox.py), запросов в секунду
+OUTBOX_GLOBAL_RATE = float(os.getenv('OUTBOX_GLOBAL_RATE', 30))  # на весь бот
+OUTBOX_CHAT_RATE = float(os.getenv('OUTBOX_CHAT_RATE', 1))  # на личный чат
+OUTBOX_CHAT_BURST = int(os.getenv('OUTBOX_CHAT_BURST', 3))  # подряд в один чат
+OUTBOX_GROUP_RATE = float(os.getenv('OUTBOX_GROUP_RATE', 20 / 60))  # на группу
+OUTBOX_MAX_RETRIES = int(os.getenv('OUTBOX_MAX_RETRIES', 3))  # повторов после 429
+
+# Уведомления о мэтчах: накопленные за NOTIFY_BATCH_DELAY секунд уходят одним сообщением
+NOTIFY_BATCH_DELAY = float(os.getenv('NOTIFY_BATCH_DELAY', 5))
+NOTIFY_DIGEST_SIZE = int(os.getenv('NOTIFY_DIGEST_SIZE', 10))  # мэтчей в списке сводки
+
+# Метрики Prometheus (metrics.py) на http://METRICS_HOST:METRICS_PORT/metrics; 0 - выключены
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+
+# База данных
+DB_PATH = os.getenv('DB_PATH', 'teamfinder.db')
+DB_READERS = int(os.getenv('DB_READERS', 4))
+
+# Профиль хранения SQLite, применяется к каждому соединению при открытии
+DB_PRAGMAS = {
+    'journal_mode': os.getenv('DB_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('DB_SYNCHRONOUS', 'NORMAL'),
+    'mmap_size': int(os.getenv('DB_MMAP_SIZE', 256 * 1024 * 1024)),
+    'cache_size': int(os.getenv('DB_CACHE_SIZE', -64 * 1024)),  # < 0 - в КиБ
+    'temp_store': os.getenv('DB_TEMP_STORE', 'MEMORY'),
+    'busy_timeout': int(os.getenv('DB_BUSY_TIMEOUT', 5000)),  # мс
+}
+
+# Профилирование SQL (profiler.py): запросы дольше DB_SLOW_QUERY_MS пишутся
+# в лог с планом выполнения, /slow показывает администратору самые дорогие
+DB_PROFILE = os.getenv('DB_PROFILE', '1') == '1'
+DB_SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', 100))
+SLOW_QUERY_TOP = int(os.getenv('SLOW_QUERY_TOP', 10))
+
+# Групповая запись лайков, просмотров и жалоб
+WRITE_BATCH_DELAY = float(os.getenv('WRITE_BATCH_DELAY', 0.05))  # с
+WRITE_QUEUE_SIZE = int(os.getenv('WRITE_QUEUE_SIZE', 1000))
+
+# Кэш анкет в памяти процесса
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', 10000))
+PROFILE_CACHE_TTL = float(os.getenv('PROFILE_CACHE_TTL', 300))  # с
+USER_GAMES_CACHE_SIZE = int(os.getenv('USER_GAMES_CACHE_SIZE', 100000))
+USER_GAMES_CACHE_TTL = float(os.getenv('USER_GAMES_CACHE_TTL', 3600))  # с
+CARD_CACHE_SIZE = int(os.getenv('CARD_CACHE_SIZE', 10000))  # готовые карточки для поиска
+CARD_CACHE_TTL = float(os.getenv('CARD_CACHE_TTL', 3600))  # с
+
+# Состояния FSM: в памяти только недавно активные пользователи, остальные в БД
+FSM_CACHE_SIZE = int(os.getenv('FSM_CACHE_SIZE', 100000))
+FSM_CACHE_TTL = float(os.getenv('FSM_CACHE_TTL', 1800))  # с
+
+# Лента поиска: буфер кандидатов на каждого зрителя
+FEED_BATCH_SIZE = int(os.getenv('FEED_BATCH_SIZE', 20))
+FEED_LOW_WATERMARK = int(os.getenv('FEED_LOW_WATERMARK', 5))  # дозагрузка в фоне
+FEED_MAX_VIEWERS = int(os.getenv('FEED_MAX_VIEWERS', 10000))
+
+# Списки мэтчей и лайков: записей на странице
+LIST_PAGE_SIZE = int(os.getenv('LIST_PAGE_SIZE', 8))
+
+# Порядок анкет в поиске: random - случайный, ranked - по совместимости
+SEARCH_MODE = os.getenv('SEARCH_MODE', 'random')
+
+# Веса слагаемых оценки совместимости (см. ranking.py), каждое в [0, 1]
+RANKING_WEIGHTS = {
+    'positions': float(os.getenv('RANKING_WEIGHT_POSITIONS', 3)),  # закрывает недостающие роли
+    'goals': float(os.getenv('RANKING_WEIGHT_GOALS', 2)),  # общие цели
+    'country': float(os.getenv('RANKING_WEIGHT_COUNTRY', 1.5)),  # та же страна или регион
+    'rating': float(os.getenv('RANKING_WEIGHT_RATING', 1)),  # рейтинг с поправкой на число отзывов
+    'random': float(os.getenv('RANKING_WEIGHT_RANDOM', 0.3)),  # разброс при равных оценках
+}
+
 # Игры
 GAMES = {
     'cs2': 'Counter-Strike 2',
@@ -41,7 +121,17 @@ COUNTRIES = {
     'Азербайджан': '🇦🇿',
 }
 
-# Позиции/роли
+# Регионы стран: анкеты из одного региона считаются соседними при ранжировании
+COUNTRY_REGIONS = {
+    'СНГ': ['Россия', 'Беларусь', 'Казахстан', 'Узбекистан', 'Грузия', 'Армения', 'Азербайджан'],
+    'Европа': ['Германия', 'Франция', 'Италия', 'Испания', 'Польша', 'Турция', 'Великобритания'],
+    'Азия': ['Китай', 'Япония', 'Южная Корея', 'Индия'],
+    'Америка': ['США', 'Канада', 'Бразилия', 'Аргентина', 'Мексика'],
+    'Океания': ['Австралия'],
+}
+
+# Позиции/роли. Индекс в списке - номер бита в БД (profiles.positions_mask):
+# новые значения только дописывать в конец, не переставлять и не удалять
 POSITIONS = {
     'cs2': ['Support (Поддержка)',
             'Sniper(Снайпер)',
@@ -55,14 +145,16 @@ POSITIONS = {
               'Hard Support']
 }
 
-# Цели
+# Цели. Как и позиции, хранятся битами по индексу (profiles.goals_mask)
 GOALS = [
     'Паблики',
     'Премьер',
     'Соревновательный',
     'FACEIT',
     'Турниры',
-    'Общение'
+    'Общение',
+    # Цель из первой версии бота: стоит у анкет, сохраненных тогда
+    'Рейтинговые игры'
 ]
 
 # Причины жалоб
@@ -1,15 +1,348 @@
+import asyncio
 import aiosqlite
 import json
-from typing import Optional, List, Dict, Any
+import logging
+import random
+import sys
+from array import array
+from bisect import bisect_left
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Optional, List, Dict, Any, Iterable, Callable, Awaitable, Set, Tuple
 from datetime import datetime
 
+from cache import LRUCache
+from metrics import timed
+from profiler import QueryProfiler
+from config import (
+    DB_PATH, DB_READERS, DB_PRAGMAS, DB_PROFILE, WRITE_BATCH_DELAY, WRITE_QUEUE_SIZE,
+    PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL, USER_GAMES_CACHE_SIZE, USER_GAMES_CACHE_TTL,
+    POSITIONS, GOALS
+)
+
+logger = logging.getLogger(__name__)
+
+
+# Просмотренные user_id хранятся отсортированными упакованными int64
+# (little-endian): 8 байт на анкету вместо строки с индексом на каждый просмотр.
+# Множество разбито на части по диапазонам id (как листья B-дерева):
+# часть хранит id от своей нижней границы first_id до границы следующей,
+# у первой части граница 0. Просмотр переписывает одну часть, не больше
+# _VIEWED_CHUNK_SIZE id; переполненная часть делится пополам
+_VIEWED_CHUNK_SIZE = 512
+
+
+def _pack_ids(ids: array) -> bytes:
+    if sys.byteorder == 'big':
+        ids = array('q', ids)
+        ids.byteswap()
+    return ids.tobytes()
+
+
+def _unpack_ids(blob: bytes) -> array:
+    ids = array('q')
+    ids.frombytes(blob)
+    if sys.byteorder == 'big':
+        ids.byteswap()
+    return ids
+
+
+def _split_ids(viewer_id: int, game: str, first_id: int, ids: array) -> List[Tuple]:
+    """Строки viewed_chunks для отсортированных id части с границей first_id:
+    одна строка или, если id больше _VIEWED_CHUNK_SIZE, заполненные наполовину"""
+    if len(ids) <= _VIEWED_CHUNK_SIZE:
+        return [(viewer_id, game, first_id, _pack_ids(ids))]
+    step = _VIEWED_CHUNK_SIZE // 2
+    return [
+        (viewer_id, game, first_id if start == 0 else ids[start], _pack_ids(ids[start:start + step]))
+        for start in range(0, len(ids), step)
+    ]
+
+
+def _contains(ids: array, value: int) -> bool:
+    position = bisect_left(ids, value)
+    return position < len(ids) and ids[position] == value
+
+
+# Позиции и цели хранятся битовыми масками: номер бита - индекс значения
+# в config.POSITIONS[game] / config.GOALS
+_POSITION_NAMES = {game: tuple(positions) for game, positions in POSITIONS.items()}
+_GOAL_NAMES = tuple(GOALS)
+
+
+def _to_mask(names: Tuple[str, ...], values: Iterable[str]) -> int:
+    mask = 0
+    for value in values:
+        if value in names:
+            mask |= 1 << names.index(value)
+    return mask
+
+
+@lru_cache(maxsize=None)
+def _from_mask(names: Tuple[str, ...], mask: int) -> Tuple[str, ...]:
+    return tuple(name for bit, name in enumerate(names) if mask & (1 << bit))
+
+
+def encode_positions(game: str, positions: Iterable[str]) -> int:
+    return _to_mask(_POSITION_NAMES.get(game, ()), positions)
+
+
+def decode_positions(game: str, mask: int) -> List[str]:
+    return list(_from_mask(_POSITION_NAMES.get(game, ()), mask or 0))
+
+
+def encode_goals(goals: Iterable[str]) -> int:
+    return _to_mask(_GOAL_NAMES, goals)
+
+
+def decode_goals(mask: int) -> List[str]:
+    return list(_from_mask(_GOAL_NAMES, mask or 0))
+
+
+def _search_filters(game: str, filters: Optional[Dict]) -> Tuple[str, tuple]:
+    """SQL-условия фильтров поиска: страна, любая из позиций,
+    любая из целей, минимальный рейтинг"""
+    if not filters:
+        return '', ()
+
+    conditions, params = [], []
+    if filters.get('country'):
+        conditions.append('AND p.country = ?')
+        params.append(filters['country'])
+    positions = encode_positions(game, filters.get('positions', []))
+    if positions:
+        conditions.append('AND p.positions_mask & ? != 0')
+        params.append(positions)
+    goals = encode_goals(filters.get('goals', []))
+    if goals:
+        conditions.append('AND p.goals_mask & ? != 0')
+        params.append(goals)
+    if filters.get('min_rating'):
+        conditions.append('AND p.avg_rating >= ?')
+        params.append(filters['min_rating'])
+    return ' '.join(conditions), tuple(params)
+
+
+def _profile_from_row(row: aiosqlite.Row) -> Dict:
+    profile = dict(row)
+    profile['positions'] = decode_positions(profile['game'], profile['positions_mask'])
+    profile['goals'] = decode_goals(profile['goals_mask'])
+    return profile
+
+
+def _log_write_error(future: asyncio.Future):
+    if not future.cancelled() and future.exception():
+        logger.error("Отложенная запись не удалась", exc_info=future.exception())
+
 
 class Database:
-    def __init__(self, db_path: str = "teamfinder.db"):
+    def __init__(self, db_path: str = DB_PATH, readers: int = DB_READERS,
+                 pragmas: Dict[str, Any] = None, write_delay: float = WRITE_BATCH_DELAY,
+                 write_queue_size: int = WRITE_QUEUE_SIZE, profile: bool = DB_PROFILE):
         self.db_path = db_path
+        self.readers = readers
+        self.pragmas = DB_PRAGMAS if pragmas is None else pragmas
+        self.write_delay = write_delay
+        self.write_queue_size = write_queue_size
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+        self._idle: deque = deque()
+        self._waiters: deque = deque()
+        self._connections: List[aiosqlite.Connection] = []
+        self._profile_listeners: List[Callable[[int, str], None]] = []
+        # Время и планы всех запросов (None - профилирование выключено)
+        self.profiler = QueryProfiler() if profile else None
+        # (user_id, game) -> строка анкеты с username (None - анкеты нет)
+        self.profile_cache = LRUCache(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL)
+        # user_id -> игры с активными анкетами, для выбора меню в обработчиках
+        self.games_cache = LRUCache(USER_GAMES_CACHE_SIZE, USER_GAMES_CACHE_TTL)
+
+        # Отложенная запись (лайки, просмотры, жалобы): операции копятся
+        # и коммитятся пачкой не позже чем через write_delay секунд
+        self._pending: List[Tuple[Callable[[aiosqlite.Connection], Awaitable], asyncio.Future]] = []
+        self._pending_users: Set[int] = set()
+        self._flushing_users: Set[int] = set()
+        self._pending_views: Dict[Tuple[int, str], Set[int]] = {}
+        self._pending_fsm: Dict[str, list] = {}
+        self._write_event = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+
+    async def _open(self) -> aiosqlite.Connection:
+        db = await aiosqlite.connect(self.db_path)
+        db.row_factory = aiosqlite.Row
+        for name, value in self.pragmas.items():
+            await db.execute(f'PRAGMA {name} = {value}')
+        if self.profiler:
+            db = self.profiler.wrap(db)
+        self._connections.append(db)
+        return db
+
+    async def connect(self):
+        """Открывает одно соединение для записи и пул соединений для чтения"""
+        self._writer = await self._open()
+        for _ in range(self.readers):
+            self._idle.append(await self._open())
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        """Дописывает отложенные операции и закрывает все соединения пула"""
+        if self._flusher:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+
+        async with self._write_lock:
+            for db in self._connections:
+                await db.close()
+            self._connections.clear()
+            self._writer = None
+            self._idle.clear()
+
+    async def _acquire(self) -> aiosqlite.Connection:
+        # Очередь ожидающих строго FIFO: иначе корутина, только что вернувшая
+        # соединение, сразу забирает его снова и остальные голодают
+        if self._idle and not self._waiters:
+            return self._idle.pop()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release(waiter.result())
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+
+    def _release(self, db: aiosqlite.Connection):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(db)
+                return
+        self._idle.append(db)
+
+    @asynccontextmanager
+    async def _read(self):
+        """Берет соединение для чтения из пула (ждет, если все заняты)
+
+        Курсоры, дочитанные не до конца (fetchone), нужно закрывать:
+        незавершенный запрос держит снимок WAL, и следующий пользователь
+        соединения увидит устаревшие данные.
+        """
+        with timed('db'):
+            db = await self._acquire()
+            try:
+                yield db
+            finally:
+                self._release(db)
+
+    @asynccontextmanager
+    async def _write(self):
+        """Единственное соединение для записи; весь блок - одна транзакция.
+        BEGIN IMMEDIATE сразу берет блокировку записи, поэтому чтение внутри
+        блока не может устареть из-за записи другого процесса"""
+        with timed('db'):
+            async with self._write_lock:
+                await self._writer.execute('BEGIN IMMEDIATE')
+                try:
+                    yield self._writer
+                    await self._writer.commit()
+                except BaseException:
+                    await self._writer.rollback()
+                    raise
+
+    async def _enqueue(self, operation: Callable[[aiosqlite.Connection], Awaitable],
+                       *user_ids: int) -> asyncio.Future:
+        """Ставит операцию в очередь групповой записи.
+        user_ids - чьи чтения должны видеть эту запись (см. _sync)"""
+        if len(self._pending) >= self.write_queue_size:
+            await self.flush()
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((operation, future))
+        self._pending_users.update(user_ids)
+        self._write_event.set()
+        return future
+
+    async def _sync(self, user_id: int):
+        """Дописывает очередь, если в ней есть записи пользователя"""
+        if user_id in self._pending_users or user_id in self._flushing_users:
+            await self.flush()
+
+    async def flush(self):
+        """Коммитит все накопленные операции одной транзакцией.
+        Пачка пишется в отдельной задаче под shield: в ней записи всех
+        пользователей, и отмена вызвавшей flush задачи (например, подгрузки
+        ленты) не должна откатывать ее и оставлять чужие операции без ответа"""
+        with timed('db'):
+            await asyncio.shield(self._flush())
+
+    async def _flush(self):
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            self._flushing_users, self._pending_users = self._pending_users, set()
+            # Новые просмотры после этой точки пойдут уже в следующую пачку
+            self._pending_views = {}
+            self._pending_fsm = {}
+            self._write_event.clear()
+            if not batch:
+                return
+
+            results = []
+            try:
+                async with self._write() as db:
+                    for operation, future in batch:
+                        # Ошибка одной операции не откатывает остальные
+                        await db.execute('SAVEPOINT operation')
+                        try:
+                            results.append((future, await operation(db), None))
+                        except Exception as e:
+                            await db.execute('ROLLBACK TO operation')
+                            results.append((future, None, e))
+                        await db.execute('RELEASE operation')
+            except Exception as e:
+                results = [(future, None, e) for _, future in batch]
+            except BaseException:
+                # Отмена самой записи (остановка цикла событий): ожидающие
+                # операций получают отмену, а не висят вечно
+                for _, future in batch:
+                    future.cancel()
+                raise
+            finally:
+                self._flushing_users = set()
+
+            for future, result, error in results:
+                if future.done():
+                    continue
+                if error:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+    async def _flush_loop(self):
+        while True:
+            await self._write_event.wait()
+            await asyncio.sleep(self.write_delay)
+            try:
+                # flush под shield: остановка цикла в close() не прерывает начатую пачку
+                await self.flush()
+            except Exception:
+                logger.exception("Не удалось записать пачку операций")
+
+    def add_profile_listener(self, listener: Callable[[int, str], None]):
+        """Подписка на изменения анкеты (user_id, game): сохранение, рейтинг"""
+        self._profile_listeners.append(listener)
+
+    def _profile_changed(self, user_id: int, game: str):
+        self.profile_cache.invalidate((user_id, game))
+        for listener in self._profile_listeners:
+            listener(user_id, game)
 
     async def create_tables(self):
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             # Таблица пользователей
             await db.execute('''
                 CREATE TABLE IF NOT EXISTS users (
@@ -29,12 +362,13 @@ class Database:
                     faceit_link TEXT,
                     dotabuff_link TEXT,
                     country TEXT,
-                    positions TEXT,
-                    goals TEXT,
+                    positions_mask INTEGER DEFAULT 0,
+                    goals_mask INTEGER DEFAULT 0,
                     about_text TEXT,
                     rating_screenshot TEXT,
                     avg_rating REAL DEFAULT 0,
                     review_count INTEGER DEFAULT 0,
+                    rating_sum INTEGER DEFAULT 0,
                     is_active BOOLEAN DEFAULT 1,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY (user_id) REFERENCES users(user_id),
@@ -93,30 +427,97 @@ class Database:
                 )
             ''')
 
-            # Таблица просмотренных анкет
+            # Состояния FSM (см. storage.py): ключ aiogram, данные в JSON.
+            # Пустые состояния не хранятся
             await db.execute('''
-                CREATE TABLE IF NOT EXISTS viewed_profiles (
-                    view_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                CREATE TABLE IF NOT EXISTS fsm_states (
+                    key TEXT PRIMARY KEY,
+                    state TEXT,
+                    data TEXT,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                ) WITHOUT ROWID
+            ''')
+
+            # Просмотренные анкеты: множество user_id на (зритель, игра),
+            # упакованное частями по диапазонам id (см. _pack_ids)
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS viewed_chunks (
                     viewer_id INTEGER,
-                    viewed_id INTEGER,
                     game TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(viewer_id, viewed_id, game)
-                )
+                    first_id INTEGER,
+                    viewed_ids BLOB,
+                    PRIMARY KEY (viewer_id, game, first_id)
+                ) WITHOUT ROWID
+            ''')
+
+            await self._migrate_viewed_profiles(db)
+            await self._migrate_viewed_sets(db)
+
+            # Битовые маски вместо JSON-списков позиций и целей
+            if await self._add_column(db, 'profiles', 'positions_mask', 'INTEGER DEFAULT 0'):
+                await self._add_column(db, 'profiles', 'goals_mask', 'INTEGER DEFAULT 0')
+                await self._migrate_profile_masks(db)
+
+            # Сумма оценок для инкрементального рейтинга (см. add_review)
+            if await self._add_column(db, 'profiles', 'rating_sum', 'INTEGER DEFAULT 0'):
+                await self._check_rating_aggregates(db, fix=True)
+
+            # Индексы под запросы поиска, лайков, мэтчей и отзывов.
+            # Поиск по (user_id, game) и (from_user_id, to_user_id, game)
+            # уже покрыт индексами UNIQUE-ограничений.
+
+            # Лента: только активные анкеты выбранной игры в порядке
+            # profile_id - по нему get_candidates делает случайный поиск.
+            # Колонки фильтров (см. _search_filters) хвостом индекса: условия
+            # по ним проверяются в индексе, без чтения строк таблицы
+            await db.execute('DROP INDEX IF EXISTS idx_profiles_active_game')
+            await db.execute('''
+                CREATE INDEX IF NOT EXISTS idx_profiles_search
+                ON profiles (game, profile_id, positions_mask, goals_mask, avg_rating)
+                WHERE is_active = 1
+            ''')
+
+            # То же для поиска с фильтром по стране
+            await db.execute('''
+                CREATE INDEX IF NOT EXISTS idx_profiles_search_country
+                ON profiles (game, country, profile_id, positions_mask, goals_mask, avg_rating)
+                WHERE is_active = 1
+            ''')
+
+            # Входящие лайки и мэтчи в порядке страниц (дата, id):
+            # id - rowid, он и так последний столбец индекса
+            await db.execute('DROP INDEX IF EXISTS idx_likes_to_user')
+            await db.execute('''
+                CREATE INDEX IF NOT EXISTS idx_likes_to_user_date
+                ON likes (to_user_id, timestamp)
             ''')
 
-            await db.commit()
+            # По индексу на каждую сторону мэтча (см. get_matches)
+            await db.execute('DROP INDEX IF EXISTS idx_matches_user2')
+            await db.execute('''
+                CREATE INDEX IF NOT EXISTS idx_matches_user1_date
+                ON matches (user1_id, match_date)
+            ''')
+            await db.execute('''
+                CREATE INDEX IF NOT EXISTS idx_matches_user2_date
+                ON matches (user2_id, match_date)
+            ''')
+
+            # Сверка рейтингов: покрывающий индекс для SUM/COUNT по отзывам
+            await db.execute('''
+                CREATE INDEX IF NOT EXISTS idx_reviews_to_user
+                ON reviews (to_user_id, game, rating)
+            ''')
 
     async def add_user(self, user_id: int, username: str):
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute(
                 'INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)',
                 (user_id, username)
             )
-            await db.commit()
 
     async def create_or_update_profile(self, user_id: int, game: str, data: Dict[str, Any]):
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             # Проверяем существование профиля
             cursor = await db.execute(
                 'SELECT profile_id FROM profiles WHERE user_id = ? AND game = ?',
@@ -132,8 +533,8 @@ class Database:
                         faceit_link = ?,
                         dotabuff_link = ?,
                         country = ?,
-                        positions = ?,
-                        goals = ?,
+                        positions_mask = ?,
+                        goals_mask = ?,
                         about_text = ?,
                         rating_screenshot = ?
                     WHERE user_id = ? AND game = ?
@@ -142,8 +543,8 @@ class Database:
                     data.get('faceit_link'),
                     data.get('dotabuff_link'),
                     data.get('country'),
-                    json.dumps(data.get('positions', [])),
-                    json.dumps(data.get('goals', [])),
+                    encode_positions(game, data.get('positions', [])),
+                    encode_goals(data.get('goals', [])),
                     data.get('about_text'),
                     data.get('rating_screenshot'),
                     user_id,
@@ -154,7 +555,7 @@ class Database:
                 await db.execute('''
                     INSERT INTO profiles (
                         user_id, game, steam_link, faceit_link, 
-                        dotabuff_link, country, positions, goals, 
+                        dotabuff_link, country, positions_mask, goals_mask,
                         about_text, rating_screenshot
                     ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 ''', (
@@ -164,210 +565,580 @@ class Database:
                     data.get('faceit_link'),
                     data.get('dotabuff_link'),
                     data.get('country'),
-                    json.dumps(data.get('positions', [])),
-                    json.dumps(data.get('goals', [])),
+                    encode_positions(game, data.get('positions', [])),
+                    encode_goals(data.get('goals', [])),
                     data.get('about_text'),
                     data.get('rating_screenshot')
                 ))
 
-            await db.commit()
+        # Набор игр меняется только при сохранении анкеты, не при отзывах
+        self.games_cache.invalidate(user_id)
+        self._profile_changed(user_id, game)
 
     async def get_profile(self, user_id: int, game: str) -> Optional[Dict]:
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute('''
-                SELECT p.*, u.username 
-                FROM profiles p
-                JOIN users u ON p.user_id = u.user_id
-                WHERE p.user_id = ? AND p.game = ? AND p.is_active = 1
-            ''', (user_id, game))
-            row = await cursor.fetchone()
-
-            if row:
-                profile = dict(row)
-                profile['positions'] = json.loads(profile['positions']) if profile['positions'] else []
-                profile['goals'] = json.loads(profile['goals']) if profile['goals'] else []
-                return profile
-            return None
+        profile = (await self._get_profiles([(user_id, game)]))[(user_id, game)]
+        if profile and profile['is_active']:
+            return dict(profile)
+        return None
+
+    async def get_profiles(self, user_ids: Iterable[int], game: str) -> List[Dict]:
+        """Активные анкеты игры в порядке user_ids (отсутствующие пропускаются)"""
+        keys = [(user_id, game) for user_id in user_ids]
+        profiles = await self._get_profiles(keys)
+        return [dict(profiles[key]) for key in keys if profiles[key] and profiles[key]['is_active']]
+
+    async def _get_profiles(self, keys: List[Tuple[int, str]]) -> Dict[Tuple[int, str], Optional[Dict]]:
+        """Анкеты (с неактивными) по ключам (user_id, game): из кэша,
+        недостающие - одним запросом"""
+        profiles = {}
+        missing = []
+        for key in keys:
+            profile = self.profile_cache.get(key, default=False)
+            if profile is False:
+                missing.append(key)
+            else:
+                profiles[key] = profile
+
+        if not missing:
+            return profiles
+
+        generation = self.profile_cache.generation
+        loaded = dict.fromkeys(missing)
+        # Запрос на игру: для (user_id, game) IN ((?, ?), ...) SQLite
+        # не использует индекс и читает всю таблицу
+        by_game = defaultdict(list)
+        for user_id, game in missing:
+            by_game[game].append(user_id)
+        async with self._read() as db:
+            for game, user_ids in by_game.items():
+                for start in range(0, len(user_ids), 900):
+                    chunk = user_ids[start:start + 900]
+                    cursor = await db.execute(f'''
+                        SELECT p.*, u.username
+                        FROM profiles p
+                        JOIN users u ON p.user_id = u.user_id
+                        WHERE p.game = ? AND p.user_id IN ({', '.join(['?'] * len(chunk))})
+                    ''', [game, *chunk])
+
+                    for row in await cursor.fetchall():
+                        profile = _profile_from_row(row)
+                        loaded[(profile['user_id'], profile['game'])] = profile
+
+        for key, profile in loaded.items():
+            self.profile_cache.set(key, profile, generation)
+        profiles.update(loaded)
+        return profiles
+
+    async def _add_column(self, db: aiosqlite.Connection, table: str, column: str, definition: str) -> bool:
+        """Добавляет колонку в существующую таблицу; True, если ее не было"""
+        cursor = await db.execute(f'PRAGMA table_info({table})')
+        if column in [row['name'] for row in await cursor.fetchall()]:
+            return False
+        await db.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+        return True
+
+    async def _migrate_profile_masks(self, db: aiosqlite.Connection):
+        """Заполняет маски из JSON-колонок positions/goals старой схемы.
+        Сами колонки остаются в таблице, но больше не читаются и не пишутся"""
+        cursor = await db.execute('PRAGMA table_info(profiles)')
+        if 'positions' not in [row['name'] for row in await cursor.fetchall()]:
+            return
+
+        # Старые анкеты могли сохранить значения до переименования
+        # ("IGL" вместо "IGL (Капитан) "): сравниваем текст до скобки
+        def normalize(value: str) -> str:
+            return value.split('(')[0].strip().casefold()
+
+        def to_mask(names: Tuple[str, ...], values: List[str]) -> int:
+            known = {normalize(name): name for name in names}
+            matched = [known[normalize(value)] for value in values if normalize(value) in known]
+            unknown.update(value for value in values if normalize(value) not in known)
+            return _to_mask(names, matched)
+
+        unknown = set()
+        updates = []
+        async with db.execute('SELECT profile_id, game, positions, goals FROM profiles') as cursor:
+            async for profile_id, game, positions, goals in cursor:
+                updates.append((
+                    to_mask(_POSITION_NAMES.get(game, ()), json.loads(positions) if positions else []),
+                    to_mask(_GOAL_NAMES, json.loads(goals) if goals else []),
+                    profile_id
+                ))
+
+        await db.executemany(
+            'UPDATE profiles SET positions_mask = ?, goals_mask = ? WHERE profile_id = ?',
+            updates
+        )
+        if unknown:
+            logger.warning("Значения позиций/целей не найдены в config и пропущены: %s", sorted(unknown))
 
-    async def get_next_profile(self, viewer_id: int, game: str) -> Optional[Dict]:
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-
-            # Получаем непросмотренные профили
-            cursor = await db.execute('''
-                SELECT p.*, u.username
-                FROM profiles p
-                JOIN users u ON p.user_id = u.user_id
-                WHERE p.game = ? 
-                AND p.user_id != ?
-                AND p.is_active = 1
-                AND p.user_id NOT IN (
-                    SELECT viewed_id FROM viewed_profiles 
-                    WHERE viewer_id = ? AND game = ?
+    async def _migrate_viewed_profiles(self, db: aiosqlite.Connection):
+        """Переносит построчную таблицу viewed_profiles в viewed_chunks"""
+        cursor = await db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'viewed_profiles'"
+        )
+        if not await cursor.fetchone():
+            return
+
+        cursor = await db.execute(
+            'SELECT viewer_id, game, viewed_id FROM viewed_profiles ORDER BY viewer_id, game, viewed_id'
+        )
+        chunks = []
+        key, ids = None, array('q')
+        async for viewer_id, game, viewed_id in cursor:
+            if (viewer_id, game) != key:
+                if key:
+                    chunks += _split_ids(*key, 0, ids)
+                key, ids = (viewer_id, game), array('q')
+            ids.append(viewed_id)
+        if key:
+            chunks += _split_ids(*key, 0, ids)
+
+        await db.executemany(
+            'INSERT OR REPLACE INTO viewed_chunks (viewer_id, game, first_id, viewed_ids) VALUES (?, ?, ?, ?)',
+            chunks
+        )
+        await db.execute('DROP TABLE viewed_profiles')
+
+    async def _migrate_viewed_sets(self, db: aiosqlite.Connection):
+        """Делит множества из viewed_sets (одна строка на зрителя) на части"""
+        cursor = await db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'viewed_sets'"
+        )
+        if not await cursor.fetchone():
+            return
+
+        chunks = []
+        async for viewer_id, game, blob in await db.execute('SELECT viewer_id, game, viewed_ids FROM viewed_sets'):
+            chunks += _split_ids(viewer_id, game, 0, _unpack_ids(blob))
+        await db.executemany(
+            'INSERT OR REPLACE INTO viewed_chunks (viewer_id, game, first_id, viewed_ids) VALUES (?, ?, ?, ?)',
+            chunks
+        )
+        await db.execute('DROP TABLE viewed_sets')
+
+    async def _get_viewed_ids(self, db: aiosqlite.Connection, viewer_id: int, game: str) -> array:
+        # Части не пересекаются, поэтому по порядку границ дают отсортированный массив
+        async with db.execute(
+            'SELECT viewed_ids FROM viewed_chunks WHERE viewer_id = ? AND game = ? ORDER BY first_id',
+            (viewer_id, game)
+        ) as cursor:
+            chunks = [row[0] for row in await cursor.fetchall()]
+        return _unpack_ids(b''.join(chunks))
+
+    async def get_viewed_ids(self, viewer_id: int, game: str) -> array:
+        """Отсортированные user_id просмотренных зрителем анкет"""
+        await self._sync(viewer_id)
+        async with self._read() as db:
+            return await self._get_viewed_ids(db, viewer_id, game)
+
+    async def get_ranking_rows(self, game: str, user_ids: Optional[Iterable[int]] = None) -> List[Tuple]:
+        """Поля анкет для ранжирования (см. ranking.py): все активные анкеты
+        игры или, если заданы user_ids, эти анкеты вместе с неактивными"""
+        columns = 'user_id, country, positions_mask, goals_mask, rating_sum, review_count, is_active'
+        async with self._read() as db:
+            if user_ids is None:
+                cursor = await db.execute(
+                    f'SELECT {columns} FROM profiles WHERE game = ? AND is_active = 1', (game,)
                 )
-                ORDER BY RANDOM()
-                LIMIT 1
-            ''', (game, viewer_id, viewer_id, game))
+                return [tuple(row) for row in await cursor.fetchall()]
 
-            row = await cursor.fetchone()
-            if row:
-                profile = dict(row)
-                profile['positions'] = json.loads(profile['positions']) if profile['positions'] else []
-                profile['goals'] = json.loads(profile['goals']) if profile['goals'] else []
+            user_ids = list(user_ids)
+            rows = []
+            for start in range(0, len(user_ids), 900):
+                chunk = user_ids[start:start + 900]
+                cursor = await db.execute(f'''
+                    SELECT {columns} FROM profiles
+                    WHERE game = ? AND user_id IN ({', '.join('?' * len(chunk))})
+                ''', (game, *chunk))
+                rows += [tuple(row) for row in await cursor.fetchall()]
+            return rows
 
-                # Помечаем как просмотренный
-                await db.execute('''
-                    INSERT OR IGNORE INTO viewed_profiles (viewer_id, viewed_id, game)
-                    VALUES (?, ?, ?)
-                ''', (viewer_id, profile['user_id'], game))
-                await db.commit()
+    async def get_candidates(self, viewer_id: int, game: str, limit: int,
+                             exclude: Iterable[int] = (), filters: Optional[Dict] = None) -> List[Dict]:
+        """Случайная выборка до limit непросмотренных активных анкет игры,
+        подходящих под фильтры поиска (см. _search_filters)"""
+        await self._sync(viewer_id)
+        exclude = set(exclude)
+        filter_sql, filter_params = _search_filters(game, filters)
+        rows = []
+        async with self._read() as db:
+            # Границы profile_id среди активных анкет игры (два поиска по индексу)
+            async with db.execute('''
+                SELECT
+                    (SELECT MIN(profile_id) FROM profiles WHERE game = ? AND is_active = 1),
+                    (SELECT MAX(profile_id) FROM profiles WHERE game = ? AND is_active = 1)
+            ''', (game, game)) as cursor:
+                low, high = await cursor.fetchone()
+            if low is None:
+                return []
+
+            viewed = await self._get_viewed_ids(db, viewer_id, game)
+
+            # Вместо ORDER BY RANDOM() по всем кандидатам: случайная точка
+            # в диапазоне profile_id и первые непросмотренные анкеты после нее,
+            # а если их не хватило - с начала диапазона.
+            # Просмотренные отсеиваются по упакованному множеству, поэтому
+            # строки читаются порциями до набора limit штук
+            pivot = random.randint(low, high)
+            for condition in ('p.profile_id >= ?', 'p.profile_id < ?'):
+                async with db.execute(f'''
+                    SELECT p.*, u.username
+                    FROM profiles p
+                    JOIN users u ON p.user_id = u.user_id
+                    WHERE p.game = ?
+                    AND p.is_active = 1
+                    AND {condition}
+                    AND p.user_id != ?
+                    {filter_sql}
+                    ORDER BY p.profile_id
+                ''', (game, pivot, viewer_id, *filter_params)) as cursor:
+                    while len(rows) < limit:
+                        chunk = await cursor.fetchmany(limit * 2)
+                        if not chunk:
+                            break
+                        rows += [
+                            row for row in chunk
+                            if row['user_id'] not in exclude and not _contains(viewed, row['user_id'])
+                        ]
+
+                if len(rows) >= limit:
+                    break
+
+        profiles = [_profile_from_row(row) for row in rows[:limit]]
+
+        # Выборка идет подряд по profile_id, перемешиваем порядок показа
+        random.shuffle(profiles)
+        return profiles
+
+    async def mark_viewed(self, viewer_id: int, viewed_id: int, game: str):
+        """Отложенная запись просмотра; просмотры зрителя из одной пачки
+        объединяются в одну перезапись его множества"""
+        key = (viewer_id, game)
+        views = self._pending_views.get(key)
+        if views is not None:
+            views.add(viewed_id)
+            return
+
+        views = self._pending_views[key] = {viewed_id}
+        future = await self._enqueue(lambda db: self._write_views(db, viewer_id, game, views), viewer_id)
+        future.add_done_callback(_log_write_error)
+
+    async def _write_views(self, db: aiosqlite.Connection, viewer_id: int, game: str, views: Set[int]):
+        # Читаются и переписываются только части, в диапазон которых попали
+        # новые просмотры: граница first_id -> отсортированные id части
+        chunks: Dict[int, array] = {}
+        for viewed_id in sorted(views):
+            async with db.execute('''
+                SELECT first_id, viewed_ids FROM viewed_chunks
+                WHERE viewer_id = ? AND game = ? AND first_id <= ?
+                ORDER BY first_id DESC LIMIT 1
+            ''', (viewer_id, game, viewed_id)) as cursor:
+                row = await cursor.fetchone()
+
+            first_id = row[0] if row else 0
+            chunk = chunks.get(first_id)
+            if chunk is None:
+                chunk = chunks[first_id] = _unpack_ids(row[1]) if row else array('q')
+            position = bisect_left(chunk, viewed_id)
+            if position == len(chunk) or chunk[position] != viewed_id:
+                chunk.insert(position, viewed_id)
+
+        # Делятся только после всех вставок: иначе границы в БД и в chunks разойдутся
+        await db.executemany('''
+            INSERT OR REPLACE INTO viewed_chunks (viewer_id, game, first_id, viewed_ids)
+            VALUES (?, ?, ?, ?)
+        ''', [row for first_id, chunk in chunks.items() for row in _split_ids(viewer_id, game, first_id, chunk)])
 
-                return profile
+    async def get_next_profile(self, viewer_id: int, game: str, filters: Optional[Dict] = None) -> Optional[Dict]:
+        candidates = await self.get_candidates(viewer_id, game, 1, filters=filters)
+        if not candidates:
             return None
 
+        profile = candidates[0]
+        # Помечаем как просмотренный
+        await self.mark_viewed(viewer_id, profile['user_id'], game)
+        return profile
+
     async def add_like(self, from_user_id: int, to_user_id: int, game: str) -> bool:
-        """Добавляет лайк и возвращает True если это мэтч"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Добавляем лайк
-            await db.execute('''
-                INSERT OR IGNORE INTO likes (from_user_id, to_user_id, game)
-                VALUES (?, ?, ?)
-            ''', (from_user_id, to_user_id, game))
+        """Добавляет лайк и возвращает True, если он создал новый мэтч.
+        Лайк, проверка встречного лайка и мэтч - одна транзакция, поэтому
+        одновременные взаимные лайки не теряют мэтч.
+        Запись идет через очередь групповой записи"""
+        future = await self._enqueue(
+            lambda db: self._add_like(db, from_user_id, to_user_id, game), from_user_id
+        )
+        with timed('db'):
+            return await future
 
-            # Проверяем взаимный лайк
-            cursor = await db.execute('''
-                SELECT * FROM likes 
-                WHERE from_user_id = ? AND to_user_id = ? AND game = ?
-            ''', (to_user_id, from_user_id, game))
+    async def _add_like(self, db: aiosqlite.Connection, from_user_id: int, to_user_id: int, game: str) -> bool:
+        # Добавляем лайк
+        await db.execute('''
+            INSERT OR IGNORE INTO likes (from_user_id, to_user_id, game)
+            VALUES (?, ?, ?)
+        ''', (from_user_id, to_user_id, game))
 
+        # Проверяем взаимный лайк
+        async with db.execute('''
+            SELECT 1 FROM likes 
+            WHERE from_user_id = ? AND to_user_id = ? AND game = ?
+        ''', (to_user_id, from_user_id, game)) as cursor:
             mutual_like = await cursor.fetchone()
 
-            if mutual_like:
-                # Создаем мэтч
-                user1_id = min(from_user_id, to_user_id)
-                user2_id = max(from_user_id, to_user_id)
+        if not mutual_like:
+            return False
 
-                await db.execute('''
-                    INSERT OR IGNORE INTO matches (user1_id, user2_id, game)
-                    VALUES (?, ?, ?)
-                ''', (user1_id, user2_id, game))
+        # Создаем мэтч; RETURNING пуст, если мэтч уже был
+        user1_id = min(from_user_id, to_user_id)
+        user2_id = max(from_user_id, to_user_id)
 
-                await db.commit()
-                return True
+        async with db.execute('''
+            INSERT OR IGNORE INTO matches (user1_id, user2_id, game)
+            VALUES (?, ?, ?)
+            RETURNING match_id
+        ''', (user1_id, user2_id, game)) as cursor:
+            created = await cursor.fetchone()
 
-            await db.commit()
-            return False
+        return created is not None
+
+    async def get_matches(self, user_id: int, game: Optional[str] = None, limit: Optional[int] = None,
+                          after: Optional[int] = None, before: Optional[int] = None) -> List[Dict]:
+        """Мэтчи по анкетам пользователя (или одной игре), сначала новые.
+        Постранично по ключу (match_date, match_id): after - match_id последнего
+        мэтча предыдущей страницы, before - первого мэтча следующей.
+        Анкеты собеседников берутся из кэша анкет"""
+        await self._sync(user_id)
+        # Ветка на каждую сторону мэтча: обе идут по своему индексу
+        # (user*_id, match_date) в нужном порядке, и LIMIT останавливает
+        # слияние на последней показанной строке
+        branch = f'''
+            SELECT m.match_id, m.{{other}} AS matched_user_id, m.game, m.match_date
+            FROM matches m
+            WHERE m.{{me}} = ? {'AND m.game = ?' if game else ''}
+            {self._keyset('matches', 'm', 'match_date', 'match_id', after, before)}
+            AND EXISTS (
+                SELECT 1 FROM profiles me
+                WHERE me.user_id = m.{{me}} AND me.game = m.game AND me.is_active = 1
+            )
+        '''
+        params = (user_id,) + ((game,) if game else ()) + tuple(value for value in (after, before) if value)
+        order = 'ASC' if before else 'DESC'
+
+        async with self._read() as db:
+            cursor = await db.execute(f'''
+                {branch.format(me='user1_id', other='user2_id')}
+                UNION ALL
+                {branch.format(me='user2_id', other='user1_id')}
+                ORDER BY match_date {order}, match_id {order}
+                {'LIMIT ?' if limit else ''}
+            ''', params * 2 + ((limit,) if limit else ()))
+            rows = [dict(row) for row in await cursor.fetchall()]
+
+        if before:
+            rows.reverse()
+        profiles = await self._get_profiles([(row['matched_user_id'], row['game']) for row in rows])
 
-    async def get_matches(self, user_id: int, game: str) -> List[Dict]:
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-
-            cursor = await db.execute('''
-                SELECT 
-                    CASE 
-                        WHEN m.user1_id = ? THEN m.user2_id
-                        ELSE m.user1_id
-                    END as matched_user_id,
-                    m.match_date,
-                    u.username,
-                    p.*
-                FROM matches m
-                JOIN users u ON u.user_id = 
-                    CASE 
-                        WHEN m.user1_id = ? THEN m.user2_id
-                        ELSE m.user1_id
-                    END
-                JOIN profiles p ON p.user_id = u.user_id AND p.game = m.game
-                WHERE (m.user1_id = ? OR m.user2_id = ?) AND m.game = ?
-                ORDER BY m.match_date DESC
-            ''', (user_id, user_id, user_id, user_id, game))
-
-            matches = []
-            for row in await cursor.fetchall():
-                match = dict(row)
-                match['positions'] = json.loads(match['positions']) if match['positions'] else []
-                match['goals'] = json.loads(match['goals']) if match['goals'] else []
-                matches.append(match)
-
-            return matches
-
-    async def get_incoming_likes(self, user_id: int, game: str) -> List[Dict]:
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-
-            cursor = await db.execute('''
-                SELECT l.*, u.username, p.*
+        matches = []
+        for row in rows:
+            profile = profiles[(row['matched_user_id'], row['game'])]
+            if profile:
+                matches.append({**profile, **row})
+
+        return matches
+
+    async def get_incoming_likes(self, user_id: int, game: Optional[str] = None, limit: Optional[int] = None,
+                                 after: Optional[int] = None, before: Optional[int] = None) -> List[Dict]:
+        """Входящие лайки без ответа, сначала новые; постранично
+        по ключу (timestamp, like_id), как get_matches"""
+        game_filter = 'AND l.game = ?' if game else ''
+        params = (user_id,) + ((game,) if game else ()) + tuple(value for value in (after, before) if value)
+        order = 'ASC' if before else 'DESC'
+        await self._sync(user_id)
+
+        async with self._read() as db:
+            cursor = await db.execute(f'''
+                SELECT l.*
                 FROM likes l
-                JOIN users u ON u.user_id = l.from_user_id
-                JOIN profiles p ON p.user_id = l.from_user_id AND p.game = l.game
-                WHERE l.to_user_id = ? AND l.game = ?
+                WHERE l.to_user_id = ? {game_filter}
+                {self._keyset('likes', 'l', 'timestamp', 'like_id', after, before)}
+                AND EXISTS (
+                    SELECT 1 FROM profiles me
+                    WHERE me.user_id = l.to_user_id AND me.game = l.game AND me.is_active = 1
+                )
                 AND NOT EXISTS (
                     SELECT 1 FROM likes 
-                    WHERE from_user_id = ? AND to_user_id = l.from_user_id AND game = ?
+                    WHERE from_user_id = l.to_user_id AND to_user_id = l.from_user_id AND game = l.game
                 )
-                ORDER BY l.timestamp DESC
-            ''', (user_id, game, user_id, game))
+                ORDER BY l.timestamp {order}, l.like_id {order}
+                {'LIMIT ?' if limit else ''}
+            ''', params + ((limit,) if limit else ()))
+            rows = [dict(row) for row in await cursor.fetchall()]
+
+        if before:
+            rows.reverse()
+        profiles = await self._get_profiles([(row['from_user_id'], row['game']) for row in rows])
 
-            likes = []
-            for row in await cursor.fetchall():
-                like = dict(row)
-                like['positions'] = json.loads(like['positions']) if like['positions'] else []
-                like['goals'] = json.loads(like['goals']) if like['goals'] else []
-                likes.append(like)
+        likes = []
+        for row in rows:
+            profile = profiles[(row['from_user_id'], row['game'])]
+            if profile:
+                likes.append({**row, **profile})
 
-            return likes
+        return likes
+
+    @staticmethod
+    def _keyset(table: str, alias: str, date_column: str, id_column: str,
+                after: Optional[int], before: Optional[int]) -> str:
+        """Условие страницы: строки до (after) или после (before)
+        строки-курсора в порядке (дата, id) по убыванию"""
+        if not (after or before):
+            return ''
+        return f'''
+            AND ({alias}.{date_column}, {alias}.{id_column}) {'<' if after else '>'} (
+                SELECT {date_column}, {id_column} FROM {table} WHERE {id_column} = ?
+            )
+        '''
 
     async def add_review(self, from_user_id: int, to_user_id: int, game: str, rating: int, comment: str = None):
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
+            # Прежняя оценка этого автора, если отзыв заменяется
+            async with db.execute('''
+                SELECT rating FROM reviews
+                WHERE from_user_id = ? AND to_user_id = ? AND game = ?
+            ''', (from_user_id, to_user_id, game)) as cursor:
+                previous = await cursor.fetchone()
+
             # Добавляем отзыв
             await db.execute('''
                 INSERT OR REPLACE INTO reviews (from_user_id, to_user_id, game, rating, comment)
                 VALUES (?, ?, ?, ?, ?)
             ''', (from_user_id, to_user_id, game, rating, comment))
 
-            # Обновляем средний рейтинг
-            cursor = await db.execute('''
-                SELECT AVG(rating) as avg_rating, COUNT(*) as count
-                FROM reviews
-                WHERE to_user_id = ? AND game = ?
-            ''', (to_user_id, game))
-
-            result = await cursor.fetchone()
-            avg_rating = result[0] if result[0] else 0
-            review_count = result[1] if result[1] else 0
-
+            # Обновляем рейтинг без пересчета по всем отзывам:
+            # новая оценка минус замененная, счетчик растет только для нового отзыва
+            delta = rating - (previous[0] if previous else 0)
+            added = 0 if previous else 1
             await db.execute('''
                 UPDATE profiles 
-                SET avg_rating = ?, review_count = ?
+                SET rating_sum = rating_sum + ?,
+                    review_count = review_count + ?,
+                    avg_rating = CAST(rating_sum + ? AS REAL) / (review_count + ?)
+                WHERE user_id = ? AND game = ?
+            ''', (delta, added, delta, added, to_user_id, game))
+
+        self._profile_changed(to_user_id, game)
+
+    async def check_rating_aggregates(self, fix: bool = False) -> List[Dict]:
+        """Сверяет rating_sum/review_count анкет с отзывами одним запросом.
+        Возвращает расхождения; при fix=True исправляет их"""
+        async with self._write() as db:
+            mismatches = await self._check_rating_aggregates(db, fix)
+
+        if fix:
+            for mismatch in mismatches:
+                self._profile_changed(mismatch['user_id'], mismatch['game'])
+        return mismatches
+
+    async def _check_rating_aggregates(self, db: aiosqlite.Connection, fix: bool) -> List[Dict]:
+        cursor = await db.execute('''
+            SELECT p.user_id, p.game,
+                   p.rating_sum, p.review_count,
+                   COALESCE(r.total, 0) AS expected_sum,
+                   COALESCE(r.count, 0) AS expected_count
+            FROM profiles p
+            LEFT JOIN (
+                SELECT to_user_id, game, SUM(rating) AS total, COUNT(*) AS count
+                FROM reviews
+                GROUP BY to_user_id, game
+            ) r ON r.to_user_id = p.user_id AND r.game = p.game
+            WHERE p.rating_sum IS NOT COALESCE(r.total, 0)
+            OR p.review_count IS NOT COALESCE(r.count, 0)
+        ''')
+        mismatches = [dict(row) for row in await cursor.fetchall()]
+
+        if fix and mismatches:
+            await db.executemany('''
+                UPDATE profiles
+                SET rating_sum = ?,
+                    review_count = ?,
+                    avg_rating = CASE WHEN ? > 0 THEN CAST(? AS REAL) / ? ELSE 0 END
                 WHERE user_id = ? AND game = ?
-            ''', (avg_rating, review_count, to_user_id, game))
+            ''', [
+                (m['expected_sum'], m['expected_count'], m['expected_count'],
+                 m['expected_sum'], m['expected_count'], m['user_id'], m['game'])
+                for m in mismatches
+            ])
 
-            await db.commit()
+        return mismatches
 
     async def add_report(self, from_user_id: int, reported_user_id: int, game: str, reason: str, comment: str = None):
-        async with aiosqlite.connect(self.db_path) as db:
+        """Отложенная запись жалобы"""
+        async def insert(db: aiosqlite.Connection):
             await db.execute('''
                 INSERT INTO reports (from_user_id, reported_user_id, game, reason, comment)
                 VALUES (?, ?, ?, ?, ?)
             ''', (from_user_id, reported_user_id, game, reason, comment))
-            await db.commit()
+
+        future = await self._enqueue(insert, from_user_id)
+        future.add_done_callback(_log_write_error)
 
     async def reset_viewed_profiles(self, user_id: int, game: str):
-        """Сбрасывает просмотренные анкеты для повторного просмотра"""
-        async with aiosqlite.connect(self.db_path) as db:
+        """Сбрасывает просмотренные анкеты для повторного просмотра:
+        удаляет все части множества зрителя (по одной на ~256-512 id)"""
+        await self._sync(user_id)
+        async with self._write() as db:
             await db.execute(
-                'DELETE FROM viewed_profiles WHERE viewer_id = ? AND game = ?',
+                'DELETE FROM viewed_chunks WHERE viewer_id = ? AND game = ?',
                 (user_id, game)
             )
-            await db.commit()
+
+    async def get_fsm_record(self, key: str, user_id: int) -> Tuple[Optional[str], Dict[str, Any]]:
+        """Состояние и данные FSM по ключу хранилища"""
+        await self._sync(user_id)
+        async with self._read() as db:
+            async with db.execute('SELECT state, data FROM fsm_states WHERE key = ?', (key,)) as cursor:
+                row = await cursor.fetchone()
+        if not row:
+            return None, {}
+        return row[0], json.loads(row[1]) if row[1] else {}
+
+    async def save_fsm_record(self, key: str, user_id: int, state: Optional[str], data: Dict[str, Any]):
+        """Отложенная запись состояния FSM; записи одного ключа
+        из одной пачки объединяются в последнюю"""
+        record = [state, json.dumps(data, ensure_ascii=False) if data else None]
+        pending = self._pending_fsm.get(key)
+        if pending is not None:
+            pending[:] = record
+            return
+
+        self._pending_fsm[key] = record
+        future = await self._enqueue(lambda db: self._write_fsm(db, key, record), user_id)
+        future.add_done_callback(_log_write_error)
+
+    async def _write_fsm(self, db: aiosqlite.Connection, key: str, record: list):
+        state, data = record
+        if state is None and data is None:
+            await db.execute('DELETE FROM fsm_states WHERE key = ?', (key,))
+            return
+
+        await db.execute('''
+            INSERT OR REPLACE INTO fsm_states (key, state, data, updated_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ''', (key, state, data))
 
     async def get_user_games(self, user_id: int) -> List[str]:
         """Получает список игр, для которых у пользователя есть профили"""
-        async with aiosqlite.connect(self.db_path) as db:
+        games = self.games_cache.get(user_id)
+        if games is not None:
+            return list(games)
+
+        generation = self.games_cache.generation
+        async with self._read() as db:
             cursor = await db.execute(
-                'SELECT game FROM profiles WHERE user_id = ? AND is_active = 1',
+                'SELECT game FROM profiles WHERE user_id = ? AND is_active = 1 ORDER BY game',
                 (user_id,)
             )
-            games = [row[0] for row in await cursor.fetchall()]
-            return games
\ No newline at end of file
+            games = tuple(row[0] for row in await cursor.fetchall())
+
+        self.games_cache.set(user_id, games, generation)
+        return list(games)
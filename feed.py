@@ -0,0 +1,169 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Optional, Dict, Tuple, Set
+
+from config import FEED_BATCH_SIZE, FEED_LOW_WATERMARK, FEED_MAX_VIEWERS
+from database import Database
+from ranking import CompatibilityRanker
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+
+class CandidateFeed:
+    """Лента поиска: кандидаты загружаются пачками и отдаются из памяти"""
+
+    def __init__(self, db: Database, batch_size: int = FEED_BATCH_SIZE,
+                 low_watermark: int = FEED_LOW_WATERMARK, max_viewers: int = FEED_MAX_VIEWERS,
+                 ranker: Optional[CompatibilityRanker] = None):
+        self.db = db
+        # Источник кандидатов: по совместимости, если задан ranker, иначе случайные
+        self.ranker = ranker
+        self.batch_size = batch_size
+        self.low_watermark = low_watermark
+        self.max_viewers = max_viewers
+        # (viewer_id, game) -> очередь анкет, самые давние зрители первыми
+        self._buffers: OrderedDict[Tuple[int, str], deque] = OrderedDict()
+        # (user_id, game) анкеты -> зрители, в чьих буферах она стоит
+        self._viewers: Dict[Tuple[int, str], Set[Tuple[int, str]]] = {}
+        self._refills: Dict[Tuple[int, str], asyncio.Task] = {}
+        # Показанные анкеты, чей просмотр еще записывается в БД
+        self._marking: Dict[Tuple[int, str], Set[int]] = {}
+        # Счетчик изменений анкет: загрузка пачки запоминает его при старте
+        # и отбрасывает только анкеты, измененные после этого
+        self._version = 0
+        self._started: Dict[asyncio.Task, int] = {}
+        # (user_id, game) -> номер изменения, по возрастанию номеров
+        self._changed: OrderedDict[Tuple[int, str], int] = OrderedDict()
+        # Фильтры, под которые набран буфер зрителя
+        self._filters: Dict[Tuple[int, str], Optional[Dict]] = {}
+
+        db.add_profile_listener(self.invalidate)
+
+    async def next(self, viewer_id: int, game: str, filters: Optional[Dict] = None) -> Optional[Dict]:
+        """Следующая анкета для зрителя; помечает ее просмотренной.
+        Смена фильтров сбрасывает набранный буфер"""
+        key = (viewer_id, game)
+        if self._filters.get(key) != filters:
+            self._drop(key)
+            self._filters[key] = filters
+        buffer = self._buffer(key)
+
+        if not buffer:
+            # Пачка грузится отдельной задачей: ее ожидание - время БД обработчика
+            with timed('db'):
+                await asyncio.shield(self._schedule_refill(key))
+            buffer = self._buffer(key)
+
+        if not buffer:
+            return None
+
+        profile = buffer.popleft()
+        self._unindex(key, profile['user_id'])
+        marking = self._marking.setdefault(key, set())
+        marking.add(profile['user_id'])
+        try:
+            await self.db.mark_viewed(viewer_id, profile['user_id'], game)
+        finally:
+            marking.discard(profile['user_id'])
+            if not marking and self._marking.get(key) is marking:
+                del self._marking[key]
+
+        if len(buffer) <= self.low_watermark:
+            self._schedule_refill(key)
+        return profile
+
+    async def reset(self, viewer_id: int, game: str):
+        """Сбрасывает просмотренные анкеты и буфер зрителя"""
+        key = (viewer_id, game)
+        self._drop(key)
+        await self.db.reset_viewed_profiles(viewer_id, game)
+
+    def invalidate(self, user_id: int, game: str):
+        """Убирает измененную анкету из всех буферов"""
+        for key in self._viewers.pop((user_id, game), ()):
+            for profile in self._buffers.get(key, ()):
+                if profile['user_id'] == user_id:
+                    self._buffers[key].remove(profile)
+                    break
+
+        if self._started:
+            self._version += 1
+            self._changed[(user_id, game)] = self._version
+            self._changed.move_to_end((user_id, game))
+
+    async def close(self):
+        for task in self._refills.values():
+            task.cancel()
+        await asyncio.gather(*self._refills.values(), return_exceptions=True)
+        self._refills.clear()
+        self._buffers.clear()
+        self._viewers.clear()
+        self._filters.clear()
+
+    def _drop(self, key: Tuple[int, str]):
+        task = self._refills.pop(key, None)
+        if task:
+            task.cancel()
+        self._forget(key, self._buffers.pop(key, ()))
+
+    def _buffer(self, key: Tuple[int, str]) -> deque:
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = deque()
+            if len(self._buffers) > self.max_viewers:
+                evicted, profiles = self._buffers.popitem(last=False)
+                self._forget(evicted, profiles)
+                self._filters.pop(evicted, None)
+        else:
+            self._buffers.move_to_end(key)
+        return buffer
+
+    def _unindex(self, key: Tuple[int, str], user_id: int):
+        viewers = self._viewers.get((user_id, key[1]))
+        if viewers is not None:
+            viewers.discard(key)
+            if not viewers:
+                del self._viewers[(user_id, key[1])]
+
+    def _forget(self, key: Tuple[int, str], profiles):
+        """Убирает из индекса анкеты удаленного буфера"""
+        for profile in profiles:
+            self._unindex(key, profile['user_id'])
+
+    def _schedule_refill(self, key: Tuple[int, str]) -> asyncio.Task:
+        task = self._refills.get(key)
+        if task is None:
+            task = self._refills[key] = asyncio.create_task(self._refill(key))
+        return task
+
+    async def _refill(self, key: Tuple[int, str]):
+        viewer_id, game = key
+        started = self._started[asyncio.current_task()] = self._version
+        try:
+            # Уже стоящие в очереди и еще не записанные в просмотренные
+            exclude = {profile['user_id'] for profile in self._buffer(key)}
+            exclude |= self._marking.get(key, set())
+            source = self.ranker or self.db
+            profiles = await source.get_candidates(
+                viewer_id, game, self.batch_size, exclude=exclude, filters=self._filters.get(key)
+            )
+            # Анкеты, измененные пока шел запрос, могли прийти устаревшими
+            profiles = [
+                profile for profile in profiles
+                if self._changed.get((profile['user_id'], game), 0) <= started
+            ]
+            self._buffer(key).extend(profiles)
+            for profile in profiles:
+                self._viewers.setdefault((profile['user_id'], game), set()).add(key)
+        except Exception:
+            logger.exception("Не удалось загрузить анкеты для ленты %s", key)
+        finally:
+            if self._refills.get(key) is asyncio.current_task():
+                del self._refills[key]
+            del self._started[asyncio.current_task()]
+            # Изменения старше самой давней идущей загрузки больше не нужны
+            oldest = min(self._started.values(), default=self._version)
+            while self._changed and next(iter(self._changed.values())) <= oldest:
+                self._changed.popitem(last=False)
@@ -0,0 +1,40 @@
+from aiogram import Router, F
+from aiogram.types import Message
+from aiogram.filters import Command, CommandObject
+from database import Database
+from config import ADMIN_ID, SLOW_QUERY_TOP
+
+router = Router()
+# Команды только для администратора; при ADMIN_ID = 0 роутер ничего не принимает
+router.message.filter(F.from_user.id == ADMIN_ID)
+
+
+@router.message(Command("slow"))
+async def show_slow_queries(message: Message, command: CommandObject, db: Database):
+    """/slow [N] - самые дорогие SQL-запросы по суммарному времени"""
+    if not db.profiler:
+        await message.answer("Профилирование запросов выключено (DB_PROFILE=0)")
+        return
+
+    limit = int(command.args) if command.args and command.args.isdigit() else SLOW_QUERY_TOP
+    top = db.profiler.top(limit)
+    if not top:
+        await message.answer("Запросов пока не было")
+        return
+
+    text = f"🐢 Топ-{len(top)} запросов по времени:\n\n"
+    for i, stats in enumerate(top, 1):
+        sites = ', '.join(sorted(stats.sites, key=stats.sites.get, reverse=True)[:3])
+        text += (
+            f"{i}. {stats.total * 1000:.0f} мс всего, {stats.count} раз, "
+            f"среднее {stats.total / stats.count * 1000:.2f} мс, макс {stats.max * 1000:.2f} мс, "
+            f"строк {stats.rows}\n"
+            f"   {sites}\n"
+            f"   {stats.sql[:300]}\n"
+        )
+        if stats.plan:
+            text += f"   план: {'; '.join(stats.plan)[:200]}\n"
+        text += "\n"
+
+    # Ограничение Telegram на длину сообщения
+    await message.answer(text[:4096])
@@ -3,48 +3,61 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from database import Database
 from keyboards import *
-from states import ReviewState
-from config import GAMES
+from states import ReviewState, clear_state
+from config import GAMES, LIST_PAGE_SIZE
 
 router = Router()
-db = Database()
 
 
-@router.message(F.text == "💞 Мэтчи")
-async def show_matches(message: Message, state: FSMContext):
-    user_id = message.from_user.id
-    games = await db.get_user_games(user_id)
-
-    if not games:
-        await message.answer("У вас пока нет анкет")
-        return
-
-    all_matches = []
-    for game in games:
-        matches = await db.get_matches(user_id, game)
-        for match in matches:
-            match['game'] = game
-            all_matches.append(match)
-
-    if not all_matches:
-        await message.answer(
-            "💔 У вас пока нет мэтчей\n\n"
-            "Продолжайте искать тиммейтов в разделе Поиск!"
-        )
-        return
+def _page(rows: list, before: bool):
+    """Отрезает лишнюю строку, запрошенную сверх LIST_PAGE_SIZE:
+    она лишь показывает, что в этом направлении есть еще записи"""
+    more = len(rows) > LIST_PAGE_SIZE
+    if before:
+        return rows[-LIST_PAGE_SIZE:], more
+    return rows[:LIST_PAGE_SIZE], more
+
+
+def _add_page_buttons(builder: InlineKeyboardBuilder, prefix: str, first_id: int, last_id: int,
+                      offset: int, has_prev: bool, has_next: bool):
+    """Кнопки листания: курсор - id крайней записи и номер первой записи страницы"""
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton(
+            text="⬅️ Назад", callback_data=f"{prefix}:prev:{first_id}:{offset}"
+        ))
+    if has_next:
+        buttons.append(InlineKeyboardButton(
+            text="Вперед ➡️", callback_data=f"{prefix}:next:{last_id}:{offset}"
+        ))
+    if buttons:
+        builder.row(*buttons)
+
+
+async def _matches_page(db: Database, user_id: int, after: int = None, before: int = None,
+                        offset: int = 0):
+    """Текст и кнопки одной страницы мэтчей (None, если мэтчей нет)"""
+    rows = await db.get_matches(user_id, limit=LIST_PAGE_SIZE + 1, after=after, before=before)
+    matches, more = _page(rows, bool(before))
+    if not matches:
+        return None, None
 
     text = "💞 <b>Ваши мэтчи:</b>\n\n"
 
-    for i, match in enumerate(all_matches, 1):
+    for i, match in enumerate(matches, offset + 1):
         game_name = GAMES.get(match['game'])
         text += f"{i}. <b>{match['username']}</b> ({game_name})\n"
 
         if match.get('about_text'):
             # Показываем Discord или другие контакты из описания
             lines = match['about_text'].split('\n')
-            for line in lines:
-                if any(word in line.lower() for word in ['discord', 'telegram', 'steam', 'контакт']):
-                    text += f"   📞 {line}\n"
+            contacts = [
+                line for line in lines
+                if any(word in line.lower() for word in ['discord', 'telegram', 'steam', 'контакт'])
+            ]
+            # Не больше двух коротких строк: страница должна влезть в сообщение (4096)
+            for line in contacts[:2]:
+                text += f"   📞 {line[:200]}\n"
 
         text += "\n"
 
@@ -52,18 +65,74 @@ async def show_matches(message: Message, state: FSMContext):
 
     # Добавляем кнопки для отзывов
     builder = InlineKeyboardBuilder()
-    for i, match in enumerate(all_matches):
+    for match in matches:
         builder.button(
             text=f"⭐ Оставить отзыв {match['username']}",
             callback_data=f"review:{match['user_id']}:{match['game']}"
         )
     builder.adjust(1)
+    _add_page_buttons(
+        builder, "matches_page", matches[0]['match_id'], matches[-1]['match_id'], offset,
+        has_prev=bool(after) or (bool(before) and more), has_next=bool(before) or more
+    )
+    return text, builder.as_markup()
+
+
+async def _likes_page(db: Database, user_id: int, after: int = None, before: int = None,
+                      offset: int = 0):
+    """Текст и кнопки одной страницы входящих лайков (None, если лайков нет)"""
+    rows = await db.get_incoming_likes(user_id, limit=LIST_PAGE_SIZE + 1, after=after, before=before)
+    likes, more = _page(rows, bool(before))
+    if not likes:
+        return None, None
+
+    text = "❤️ <b>Вас лайкнули:</b>\n\n"
+
+    for i, like in enumerate(likes, offset + 1):
+        game_name = GAMES.get(like['game'])
+        text += f"{i}. <b>{like['username']}</b> ({game_name})\n"
+
+        if like.get('positions'):
+            text += f"   🎯 {', '.join(like['positions'])}\n"
+
+        if like.get('goals'):
+            text += f"   🎮 {', '.join(like['goals'])}\n"
+
+        text += "\n"
+
+    text += "💡 Лайкните их в ответ в разделе Поиск, чтобы создать мэтч!"
+
+    builder = InlineKeyboardBuilder()
+    _add_page_buttons(
+        builder, "likes_page", likes[0]['like_id'], likes[-1]['like_id'], offset,
+        has_prev=bool(after) or (bool(before) and more), has_next=bool(before) or more
+    )
+    return text, builder.as_markup()
+
+
+@router.message(F.text == "💞 Мэтчи")
+async def show_matches(message: Message, state: FSMContext, db: Database):
+    user_id = message.from_user.id
+    games = await db.get_user_games(user_id)
 
-    await message.answer(text, reply_markup=builder.as_markup(), parse_mode="HTML")
+    if not games:
+        await message.answer("У вас пока нет анкет")
+        return
+
+    text, markup = await _matches_page(db, user_id)
+
+    if not text:
+        await message.answer(
+            "💔 У вас пока нет мэтчей\n\n"
+            "Продолжайте искать тиммейтов в разделе Поиск!"
+        )
+        return
+
+    await message.answer(text, reply_markup=markup, parse_mode="HTML")
 
 
 @router.message(F.text == "❤️ Лайки")
-async def show_likes(message: Message):
+async def show_likes(message: Message, db: Database):
     user_id = message.from_user.id
     games = await db.get_user_games(user_id)
 
@@ -71,37 +140,36 @@ async def show_likes(message: Message):
         await message.answer("У вас пока нет анкет")
         return
 
-    all_likes = []
-    for game in games:
-        likes = await db.get_incoming_likes(user_id, game)
-        for like in likes:
-            like['game'] = game
-            all_likes.append(like)
+    text, markup = await _likes_page(db, user_id)
 
-    if not all_likes:
+    if not text:
         await message.answer(
             "💔 Вас пока никто не лайкнул\n\n"
             "Не расстраивайтесь, продолжайте искать!"
         )
         return
 
-    text = "❤️ <b>Вас лайкнули:</b>\n\n"
+    await message.answer(text, reply_markup=markup, parse_mode="HTML")
 
-    for i, like in enumerate(all_likes, 1):
-        game_name = GAMES.get(like['game'])
-        text += f"{i}. <b>{like['username']}</b> ({game_name})\n"
 
-        if like.get('positions'):
-            text += f"   🎯 {', '.join(like['positions'])}\n"
-
-        if like.get('goals'):
-            text += f"   🎮 {', '.join(like['goals'])}\n"
+@router.callback_query(F.data.startswith("matches_page:") | F.data.startswith("likes_page:"))
+async def turn_page(callback: CallbackQuery, db: Database):
+    kind, direction, cursor, offset = callback.data.split(":")
+    cursor, offset = int(cursor), int(offset)
+    if direction == "next":
+        page = dict(after=cursor, offset=offset + LIST_PAGE_SIZE)
+    else:
+        page = dict(before=cursor, offset=max(offset - LIST_PAGE_SIZE, 0))
 
-        text += "\n"
-
-    text += "💡 Лайкните их в ответ в разделе Поиск, чтобы создать мэтч!"
+    render = _matches_page if kind == "matches_page" else _likes_page
+    text, markup = await render(db, callback.from_user.id, **page)
 
-    await message.answer(text, parse_mode="HTML")
+    if text:
+        await callback.message.edit_text(text, reply_markup=markup, parse_mode="HTML")
+        await callback.answer()
+    else:
+        # Записи страницы исчезли (лайк взаимный, анкета удалена)
+        await callback.answer("Список изменился, откройте его заново")
 
 
 @router.callback_query(F.data.startswith("review:"))
@@ -135,7 +203,7 @@ async def handle_rating(callback: CallbackQuery, state: FSMContext):
 
 
 @router.message(ReviewState.entering_comment)
-async def process_review_comment(message: Message, state: FSMContext):
+async def process_review_comment(message: Message, state: FSMContext, db: Database):
     data = await state.get_data()
     from_user_id = message.from_user.id
     to_user_id = data.get('review_to_user')
@@ -150,7 +218,7 @@ async def process_review_comment(message: Message, state: FSMContext):
         "✅ Отзыв успешно добавлен!\n"
         "Спасибо за вашу оценку."
     )
-    await state.clear()
+    await clear_state(state)
 
 
 @router.message(F.text == "⭐ Отзывы")
@@ -3,12 +3,13 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from database import Database
 from keyboards import *
-from states import ProfileCreation
+from states import ProfileCreation, clear_state
+from cards import render_card, send_card
+from outbox import Outbox
 from config import GAMES, POSITIONS
 import re
 
 router = Router()
-db = Database()
 
 
 @router.callback_query(ProfileCreation.choosing_game, F.data.startswith("game:"))
@@ -205,7 +206,7 @@ async def handle_goal(callback: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(ProfileCreation.choosing_goals, F.data == "goals_done")
-async def goals_done(callback: CallbackQuery, state: FSMContext):
+async def goals_done(callback: CallbackQuery, state: FSMContext, outbox: Outbox):
     await callback.message.answer(
         "✍️ Расскажите о себе:\n\n"
         "Например:\n"
@@ -215,7 +216,7 @@ async def goals_done(callback: CallbackQuery, state: FSMContext):
         "• Discord или другие контакты для связи\n\n"
         "Отправьте текст сообщением:"
     )
-    await callback.message.delete()
+    outbox.post(callback.message.delete())
     await state.set_state(ProfileCreation.entering_about)
     await callback.answer()
 
@@ -245,48 +246,14 @@ async def show_profile_preview(message: Message, state: FSMContext):
     data = await state.get_data()
     game_name = GAMES.get(data.get('game'))
 
-    text = f"📋 <b>Ваша анкета для {game_name}</b>\n\n"
-
-    if data.get('country'):
-        text += f"🌍 Страна: {data['country']}\n"
-
-    if data.get('positions'):
-        text += f"🎯 Позиции: {', '.join(data['positions'])}\n"
-
-    if data.get('goals'):
-        text += f"🎮 Цели: {', '.join(data['goals'])}\n"
-
-    if data.get('steam_link'):
-        text += f"📎 Steam: {data['steam_link']}\n"
-
-    if data.get('faceit_link'):
-        text += f"📎 FaceIT: {data['faceit_link']}\n"
-
-    if data.get('dotabuff_link'):
-        text += f"📎 Dotabuff: {data['dotabuff_link']}\n"
-
-    if data.get('about_text'):
-        text += f"\n📝 О себе:\n{data['about_text']}\n"
-
-    if data.get('rating_screenshot'):
-        await message.answer_photo(
-            photo=data['rating_screenshot'],
-            caption=text,
-            reply_markup=get_profile_confirm_kb(),
-            parse_mode="HTML"
-        )
-    else:
-        await message.answer(
-            text,
-            reply_markup=get_profile_confirm_kb(),
-            parse_mode="HTML"
-        )
+    card = render_card(data, f"📋 <b>Ваша анкета для {game_name}</b>\n\n", links=True)
+    await send_card(message, card, reply_markup=get_profile_confirm_kb())
 
     await state.set_state(ProfileCreation.confirming)
 
 
 @router.callback_query(ProfileCreation.confirming, F.data == "profile_save")
-async def save_profile(callback: CallbackQuery, state: FSMContext):
+async def save_profile(callback: CallbackQuery, state: FSMContext, db: Database, outbox: Outbox):
     data = await state.get_data()
     user_id = callback.from_user.id
     game = data.get('game')
@@ -303,14 +270,14 @@ async def save_profile(callback: CallbackQuery, state: FSMContext):
         reply_markup=get_main_menu_kb(has_profile=True)
     )
 
-    await callback.message.delete()
-    await state.clear()
+    outbox.post(callback.message.delete())
+    await clear_state(state)
     await callback.answer()
 
 
 @router.callback_query(ProfileCreation.confirming, F.data == "profile_cancel")
-async def cancel_profile(callback: CallbackQuery, state: FSMContext):
-    await state.clear()
+async def cancel_profile(callback: CallbackQuery, state: FSMContext, db: Database, outbox: Outbox):
+    await clear_state(state)
 
     user_id = callback.from_user.id
     games = await db.get_user_games(user_id)
@@ -319,12 +286,12 @@ async def cancel_profile(callback: CallbackQuery, state: FSMContext):
         "❌ Создание анкеты отменено",
         reply_markup=get_main_menu_kb(has_profile=bool(games))
     )
-    await callback.message.delete()
+    outbox.post(callback.message.delete())
     await callback.answer()
 
 
 @router.message(F.text == "📋 Моя анкета")
-async def show_my_profile(message: Message, state: FSMContext):
+async def show_my_profile(message: Message, state: FSMContext, db: Database):
     user_id = message.from_user.id
     games = await db.get_user_games(user_id)
 
@@ -345,28 +312,5 @@ async def show_my_profile(message: Message, state: FSMContext):
 
         if profile:
             game_name = GAMES.get(game)
-            text = f"📋 <b>Ваша анкета для {game_name}</b>\n\n"
-
-            if profile.get('country'):
-                text += f"🌍 Страна: {profile['country']}\n"
-
-            if profile.get('positions'):
-                text += f"🎯 Позиции: {', '.join(profile['positions'])}\n"
-
-            if profile.get('goals'):
-                text += f"🎮 Цели: {', '.join(profile['goals'])}\n"
-
-            if profile.get('avg_rating') > 0:
-                text += f"⭐ Рейтинг: {profile['avg_rating']:.1f} ({profile['review_count']} отзывов)\n"
-
-            if profile.get('about_text'):
-                text += f"\n📝 О себе:\n{profile['about_text']}\n"
-
-            if profile.get('rating_screenshot'):
-                await message.answer_photo(
-                    photo=profile['rating_screenshot'],
-                    caption=text,
-                    parse_mode="HTML"
-                )
-            else:
-                await message.answer(text, parse_mode="HTML")
\ No newline at end of file
+            card = render_card(profile, f"📋 <b>Ваша анкета для {game_name}</b>\n\n")
+            await send_card(message, card)
\ No newline at end of file
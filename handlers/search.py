@@ -2,16 +2,19 @@ from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from database import Database
+from feed import CandidateFeed
+from cards import ProfileCards, send_card
+from outbox import Outbox
+from notifications import MatchNotifier
 from keyboards import *
 from states import SearchState, ReportState
-from config import GAMES
+from config import POSITIONS, GOALS
 
 router = Router()
-db = Database()
 
 
 @router.message(F.text == "🔍 Поиск")
-async def start_search(message: Message, state: FSMContext):
+async def start_search(message: Message, state: FSMContext, db: Database, feed: CandidateFeed, cards: ProfileCards):
     user_id = message.from_user.id
     games = await db.get_user_games(user_id)
 
@@ -28,21 +31,48 @@ async def start_search(message: Message, state: FSMContext):
     else:
         game = games[0]
         await state.update_data(search_game=game)
-        await show_next_profile(message, state)
+        await show_next_profile(message, message.from_user.id, state, feed, cards)
 
 
-async def show_next_profile(message: Message, state: FSMContext):
-    """Показывает следующую анкету"""
+def get_search_filters(data: dict, game: str) -> dict:
+    """Фильтры поиска пользователя для игры (хранятся в данных состояния)"""
+    return data.get('search_filters', {}).get(game) or {}
+
+
+async def update_search_filters(state: FSMContext, game: str, **changes) -> dict:
+    data = await state.get_data()
+    all_filters = data.get('search_filters', {})
+    filters = {**all_filters.get(game, {}), **changes}
+    await state.update_data(search_filters={**all_filters, game: filters})
+    return filters
+
+
+def format_search_filters(filters: dict) -> str:
+    text = "⚙️ <b>Фильтры поиска</b>\n\n"
+    text += f"🌍 Страна: {filters.get('country') or 'любая'}\n"
+    text += f"🎯 Позиции: {', '.join(filters.get('positions', [])) or 'любые'}\n"
+    text += f"🎮 Цели: {', '.join(filters.get('goals', [])) or 'любые'}\n"
+    if filters.get('min_rating'):
+        text += f"⭐ Рейтинг: от {filters['min_rating']:g}\n"
+    else:
+        text += "⭐ Рейтинг: любой\n"
+    return text
+
+
+async def show_next_profile(message: Message, viewer_id: int, state: FSMContext, feed: CandidateFeed,
+                            cards: ProfileCards):
+    """Показывает следующую анкету. viewer_id передается явно: в кнопках
+    message - сообщение бота, и message.from_user - сам бот"""
     data = await state.get_data()
     game = data.get('search_game')
-    user_id = message.from_user.id
 
-    profile = await db.get_next_profile(user_id, game)
+    profile = await feed.next(viewer_id, game, get_search_filters(data, game) or None)
 
     if not profile:
-        # Предлагаем сбросить просмотренные
+        # Предлагаем сбросить просмотренные или изменить фильтры
         builder = InlineKeyboardBuilder()
         builder.button(text="🔄 Начать сначала", callback_data="reset_viewed")
+        builder.button(text="⚙️ Фильтры", callback_data="filters")
         builder.button(text="🏠 В меню", callback_data="to_menu")
 
         await message.answer(
@@ -55,46 +85,15 @@ async def show_next_profile(message: Message, state: FSMContext):
 
     await state.update_data(current_profile_id=profile['user_id'])
 
-    # Формируем текст анкеты
-    game_name = GAMES.get(game)
-    text = f"🎮 <b>{game_name}</b>\n"
-    text += f"👤 <b>{profile['username']}</b>\n\n"
-
-    if profile.get('country'):
-        text += f"🌍 Страна: {profile['country']}\n"
-
-    if profile.get('positions'):
-        text += f"🎯 Позиции: {', '.join(profile['positions'])}\n"
-
-    if profile.get('goals'):
-        text += f"🎮 Цели: {', '.join(profile['goals'])}\n"
-
-    if profile.get('avg_rating') > 0:
-        text += f"⭐ Рейтинг: {profile['avg_rating']:.1f} ({profile['review_count']} отзывов)\n"
-
-    if profile.get('about_text'):
-        text += f"\n📝 О себе:\n{profile['about_text']}\n"
-
     # Отправляем анкету
-    if profile.get('rating_screenshot'):
-        await message.answer_photo(
-            photo=profile['rating_screenshot'],
-            caption=text,
-            reply_markup=get_search_kb(),
-            parse_mode="HTML"
-        )
-    else:
-        await message.answer(
-            text,
-            reply_markup=get_search_kb(),
-            parse_mode="HTML"
-        )
+    await send_card(message, cards.get(profile), reply_markup=get_search_kb())
 
     await state.set_state(SearchState.viewing_profiles)
 
 
 @router.callback_query(SearchState.viewing_profiles, F.data == "like")
-async def handle_like(callback: CallbackQuery, state: FSMContext):
+async def handle_like(callback: CallbackQuery, state: FSMContext, db: Database, feed: CandidateFeed, cards: ProfileCards,
+                      outbox: Outbox, notifier: MatchNotifier):
     data = await state.get_data()
     from_user_id = callback.from_user.id
     to_user_id = data.get('current_profile_id')
@@ -104,20 +103,23 @@ async def handle_like(callback: CallbackQuery, state: FSMContext):
     is_match = await db.add_like(from_user_id, to_user_id, game)
 
     if is_match:
-        await callback.answer("💞 ЭТО МЭТЧ! Проверьте раздел 'Мэтчи'", show_alert=True)
+        # Обоим игрокам придет сообщение с мэтчем, в фоне
+        notifier.notify(from_user_id, to_user_id, game)
+        outbox.post(callback.answer("💞 ЭТО МЭТЧ! Проверьте раздел 'Мэтчи'", show_alert=True))
     else:
-        await callback.answer("❤️ Лайк отправлен!")
+        outbox.post(callback.answer("❤️ Лайк отправлен!"))
 
-    # Показываем следующую анкету
-    await callback.message.delete()
-    await show_next_profile(callback.message, state)
+    # Показываем следующую анкету, не дожидаясь удаления текущей
+    outbox.post(callback.message.delete())
+    await show_next_profile(callback.message, callback.from_user.id, state, feed, cards)
 
 
 @router.callback_query(SearchState.viewing_profiles, F.data == "dislike")
-async def handle_dislike(callback: CallbackQuery, state: FSMContext):
-    await callback.answer("👎")
-    await callback.message.delete()
-    await show_next_profile(callback.message, state)
+async def handle_dislike(callback: CallbackQuery, state: FSMContext, feed: CandidateFeed, cards: ProfileCards,
+                         outbox: Outbox):
+    outbox.post(callback.answer("👎"))
+    outbox.post(callback.message.delete())
+    await show_next_profile(callback.message, callback.from_user.id, state, feed, cards)
 
 
 @router.callback_query(SearchState.viewing_profiles, F.data == "report")
@@ -130,7 +132,8 @@ async def start_report(callback: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(ReportState.choosing_reason, F.data.startswith("report_reason:"))
-async def handle_report_reason(callback: CallbackQuery, state: FSMContext):
+async def handle_report_reason(callback: CallbackQuery, state: FSMContext, db: Database, feed: CandidateFeed,
+                               cards: ProfileCards, outbox: Outbox):
     reason = callback.data.split(":")[1]
     await state.update_data(report_reason=reason)
 
@@ -150,15 +153,15 @@ async def handle_report_reason(callback: CallbackQuery, state: FSMContext):
         await db.add_report(from_user_id, reported_user_id, game, reason)
 
         await callback.answer("🚩 Жалоба отправлена", show_alert=True)
-        await callback.message.delete()
-        await show_next_profile(callback.message, state)
+        outbox.post(callback.message.delete())
+        await show_next_profile(callback.message, callback.from_user.id, state, feed, cards)
         await state.set_state(SearchState.viewing_profiles)
 
     await callback.answer()
 
 
 @router.message(ReportState.entering_comment, F.text)
-async def process_report_comment(message: Message, state: FSMContext):
+async def process_report_comment(message: Message, state: FSMContext, db: Database, feed: CandidateFeed, cards: ProfileCards):
     data = await state.get_data()
     from_user_id = message.from_user.id
     reported_user_id = data.get('current_profile_id')
@@ -168,21 +171,22 @@ async def process_report_comment(message: Message, state: FSMContext):
     await db.add_report(from_user_id, reported_user_id, game, reason, message.text)
 
     await message.answer("🚩 Жалоба отправлена")
-    await show_next_profile(message, state)
+    await show_next_profile(message, message.from_user.id, state, feed, cards)
     await state.set_state(SearchState.viewing_profiles)
 
 
 @router.callback_query(F.data == "reset_viewed")
-async def reset_viewed(callback: CallbackQuery, state: FSMContext):
+async def reset_viewed(callback: CallbackQuery, state: FSMContext, feed: CandidateFeed, cards: ProfileCards,
+                       outbox: Outbox):
     user_id = callback.from_user.id
     data = await state.get_data()
     game = data.get('search_game')
 
-    await db.reset_viewed_profiles(user_id, game)
+    await feed.reset(user_id, game)
 
-    await callback.answer("🔄 Начинаем сначала!")
-    await callback.message.delete()
-    await show_next_profile(callback.message, state)
+    outbox.post(callback.answer("🔄 Начинаем сначала!"))
+    outbox.post(callback.message.delete())
+    await show_next_profile(callback.message, callback.from_user.id, state, feed, cards)
 
 
 @router.callback_query(ReportState.choosing_reason, F.data == "report_cancel")
@@ -193,4 +197,142 @@ async def cancel_report(callback: CallbackQuery, state: FSMContext):
     await callback.message.edit_reply_markup(
         reply_markup=get_search_kb()
     )
-    await callback.answer("Жалоба отменена")
\ No newline at end of file
+    await callback.answer("Жалоба отменена")
+
+
+@router.callback_query(F.data == "filters")
+async def show_filters(callback: CallbackQuery, state: FSMContext, outbox: Outbox):
+    data = await state.get_data()
+    game = data.get('search_game')
+    if not game:
+        await callback.answer("Сначала начните поиск")
+        return
+
+    text = format_search_filters(get_search_filters(data, game))
+    if await state.get_state() == SearchState.setting_filters:
+        # Возврат из выбора страны, позиций или целей
+        await callback.message.edit_text(text, reply_markup=get_filters_kb(), parse_mode="HTML")
+    else:
+        outbox.post(callback.message.delete())
+        await callback.message.answer(text, reply_markup=get_filters_kb(), parse_mode="HTML")
+        await state.set_state(SearchState.setting_filters)
+    await callback.answer()
+
+
+@router.callback_query(SearchState.setting_filters, F.data.startswith("filter:"))
+async def choose_filter(callback: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    game = data.get('search_game')
+    filters = get_search_filters(data, game)
+    kind = callback.data.split(":")[1]
+
+    if kind == "country":
+        await callback.message.edit_text(
+            "🌍 Анкеты из какой страны показывать?",
+            reply_markup=get_filter_countries_kb(filters.get('country'))
+        )
+    elif kind == "positions":
+        await callback.message.edit_text(
+            "🎯 Какие позиции ищете?\n(подойдет анкета с любой из выбранных)",
+            reply_markup=get_filter_positions_kb(game, filters.get('positions', []))
+        )
+    elif kind == "goals":
+        await callback.message.edit_text(
+            "🎮 Какие цели ищете?\n(подойдет анкета с любой из выбранных)",
+            reply_markup=get_filter_goals_kb(filters.get('goals', []))
+        )
+    elif kind == "rating":
+        await callback.message.edit_text(
+            "⭐ Минимальный рейтинг анкеты:",
+            reply_markup=get_filter_rating_kb()
+        )
+    await callback.answer()
+
+
+@router.callback_query(SearchState.setting_filters, F.data.startswith("filter_country:"))
+async def set_country_filter(callback: CallbackQuery, state: FSMContext):
+    game = (await state.get_data()).get('search_game')
+    country = callback.data.split(":")[1]
+    filters = await update_search_filters(state, game, country=None if country == "none" else country)
+
+    await callback.message.edit_text(
+        format_search_filters(filters), reply_markup=get_filters_kb(), parse_mode="HTML"
+    )
+    await callback.answer()
+
+
+@router.callback_query(SearchState.setting_filters, F.data.startswith("filter_pos:"))
+async def toggle_position_filter(callback: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    game = data.get('search_game')
+    position = callback.data.split(":")[1]
+    if position not in POSITIONS.get(game, []):
+        await callback.answer()
+        return
+
+    positions = list(get_search_filters(data, game).get('positions', []))
+    if position in positions:
+        positions.remove(position)
+    else:
+        positions.append(position)
+    await update_search_filters(state, game, positions=positions)
+
+    await callback.message.edit_reply_markup(
+        reply_markup=get_filter_positions_kb(game, positions)
+    )
+    await callback.answer()
+
+
+@router.callback_query(SearchState.setting_filters, F.data.startswith("filter_goal:"))
+async def toggle_goal_filter(callback: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    game = data.get('search_game')
+    goal = callback.data.split(":")[1]
+    if goal not in GOALS:
+        await callback.answer()
+        return
+
+    goals = list(get_search_filters(data, game).get('goals', []))
+    if goal in goals:
+        goals.remove(goal)
+    else:
+        goals.append(goal)
+    await update_search_filters(state, game, goals=goals)
+
+    await callback.message.edit_reply_markup(
+        reply_markup=get_filter_goals_kb(goals)
+    )
+    await callback.answer()
+
+
+@router.callback_query(SearchState.setting_filters, F.data.startswith("filter_rating:"))
+async def set_rating_filter(callback: CallbackQuery, state: FSMContext):
+    game = (await state.get_data()).get('search_game')
+    filters = await update_search_filters(state, game, min_rating=float(callback.data.split(":")[1]))
+
+    await callback.message.edit_text(
+        format_search_filters(filters), reply_markup=get_filters_kb(), parse_mode="HTML"
+    )
+    await callback.answer()
+
+
+@router.callback_query(SearchState.setting_filters, F.data == "filters_reset")
+async def reset_filters(callback: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    game = data.get('search_game')
+    all_filters = dict(data.get('search_filters', {}))
+    all_filters.pop(game, None)
+    await state.update_data(search_filters=all_filters)
+
+    await callback.message.edit_text(
+        format_search_filters({}), reply_markup=get_filters_kb(), parse_mode="HTML"
+    )
+    await callback.answer("🗑 Фильтры сброшены")
+
+
+@router.callback_query(SearchState.setting_filters, F.data == "filters_done")
+async def filters_done(callback: CallbackQuery, state: FSMContext, feed: CandidateFeed, cards: ProfileCards,
+                       outbox: Outbox):
+    outbox.post(callback.message.delete())
+    outbox.post(callback.answer())
+    await show_next_profile(callback.message, callback.from_user.id, state, feed, cards)
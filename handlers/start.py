@@ -4,16 +4,15 @@ from aiogram.filters import CommandStart, Command
 from aiogram.fsm.context import FSMContext
 from database import Database
 from keyboards import get_main_menu_kb, get_games_kb
-from states import ProfileCreation
+from states import ProfileCreation, clear_state
 from config import GAMES
 
 router = Router()
-db = Database()
 
 
 @router.message(CommandStart())
-async def cmd_start(message: Message, state: FSMContext):
-    await state.clear()
+async def cmd_start(message: Message, state: FSMContext, db: Database):
+    await clear_state(state)
 
     user_id = message.from_user.id
     username = message.from_user.username or message.from_user.first_name
@@ -49,7 +48,7 @@ async def create_profile(message: Message, state: FSMContext):
 
 
 @router.message(F.text == "🎮 Сменить игру")
-async def change_game(message: Message, state: FSMContext):
+async def change_game(message: Message, state: FSMContext, db: Database):
     user_id = message.from_user.id
     games = await db.get_user_games(user_id)
 
@@ -63,8 +62,8 @@ async def change_game(message: Message, state: FSMContext):
 
 
 @router.callback_query(F.data == "to_menu")
-async def to_menu(callback: CallbackQuery, state: FSMContext):
-    await state.clear()
+async def to_menu(callback: CallbackQuery, state: FSMContext, db: Database):
+    await clear_state(state)
     user_id = callback.from_user.id
     games = await db.get_user_games(user_id)
 
@@ -1,9 +1,16 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
-from typing import List, Optional
+from functools import lru_cache
+from typing import List, Optional, FrozenSet
 from config import GAMES, COUNTRIES, POSITIONS, GOALS, REPORT_REASONS
 
+# Сборка разметки дорогая (сотни мкс на модели aiogram), а вариантов мало:
+# неизменные клавиатуры собираются один раз при импорте (см. конец файла),
+# клавиатуры выбора кэшируются по набору отмеченных кнопок.
+# Разметку из кэша нельзя изменять на месте
 
+
+@lru_cache(maxsize=None)
 def get_main_menu_kb(has_profile: bool = False) -> ReplyKeyboardMarkup:
     """Главное меню"""
     builder = ReplyKeyboardBuilder()
@@ -29,6 +36,7 @@ def get_main_menu_kb(has_profile: bool = False) -> ReplyKeyboardMarkup:
     return builder.as_markup(resize_keyboard=True)
 
 
+@lru_cache(maxsize=None)
 def get_games_kb() -> InlineKeyboardMarkup:
     """Выбор игры"""
     builder = InlineKeyboardBuilder()
@@ -38,6 +46,7 @@ def get_games_kb() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@lru_cache(maxsize=None)
 def get_skip_kb() -> InlineKeyboardMarkup:
     """Кнопка пропустить"""
     builder = InlineKeyboardBuilder()
@@ -45,6 +54,7 @@ def get_skip_kb() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@lru_cache(maxsize=None)
 def get_countries_kb() -> InlineKeyboardMarkup:
     """Выбор страны"""
     builder = InlineKeyboardBuilder()
@@ -57,7 +67,11 @@ def get_countries_kb() -> InlineKeyboardMarkup:
 
 def get_positions_kb(game: str, selected: List[str] = None) -> InlineKeyboardMarkup:
     """Выбор позиций/ролей"""
-    selected = selected or []
+    return _positions_kb(game, frozenset(selected or []) & frozenset(POSITIONS.get(game, [])))
+
+
+@lru_cache(maxsize=None)
+def _positions_kb(game: str, selected: FrozenSet[str]) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
 
     positions = POSITIONS.get(game, [])
@@ -83,7 +97,11 @@ def get_positions_kb(game: str, selected: List[str] = None) -> InlineKeyboardMar
 
 def get_goals_kb(selected: List[str] = None) -> InlineKeyboardMarkup:
     """Выбор целей"""
-    selected = selected or []
+    return _goals_kb(frozenset(selected or []) & frozenset(GOALS))
+
+
+@lru_cache(maxsize=None)
+def _goals_kb(selected: FrozenSet[str]) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
 
     for goal in GOALS:
@@ -102,6 +120,7 @@ def get_goals_kb(selected: List[str] = None) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@lru_cache(maxsize=None)
 def get_profile_confirm_kb() -> InlineKeyboardMarkup:
     """Подтверждение анкеты"""
     builder = InlineKeyboardBuilder()
@@ -115,6 +134,7 @@ def get_profile_confirm_kb() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@lru_cache(maxsize=None)
 def get_search_kb() -> InlineKeyboardMarkup:
     """Кнопки для поиска"""
     builder = InlineKeyboardBuilder()
@@ -123,7 +143,8 @@ def get_search_kb() -> InlineKeyboardMarkup:
         InlineKeyboardButton(text="👎 Дизлайк", callback_data="dislike")
     )
     builder.row(
-        InlineKeyboardButton(text="🚩 Жалоба", callback_data="report")
+        InlineKeyboardButton(text="🚩 Жалоба", callback_data="report"),
+        InlineKeyboardButton(text="⚙️ Фильтры", callback_data="filters")
     )
     builder.row(
         InlineKeyboardButton(text="🏠 В меню", callback_data="to_menu")
@@ -131,6 +152,89 @@ def get_search_kb() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@lru_cache(maxsize=None)
+def get_filters_kb() -> InlineKeyboardMarkup:
+    """Меню фильтров поиска"""
+    builder = InlineKeyboardBuilder()
+    builder.row(
+        InlineKeyboardButton(text="🌍 Страна", callback_data="filter:country"),
+        InlineKeyboardButton(text="🎯 Позиции", callback_data="filter:positions")
+    )
+    builder.row(
+        InlineKeyboardButton(text="🎮 Цели", callback_data="filter:goals"),
+        InlineKeyboardButton(text="⭐ Рейтинг", callback_data="filter:rating")
+    )
+    builder.row(
+        InlineKeyboardButton(text="🗑 Сбросить", callback_data="filters_reset"),
+        InlineKeyboardButton(text="🔍 Искать", callback_data="filters_done")
+    )
+    return builder.as_markup()
+
+
+def get_filter_countries_kb(selected: Optional[str] = None) -> InlineKeyboardMarkup:
+    """Фильтр по стране"""
+    return _filter_countries_kb(selected if selected in COUNTRIES else None)
+
+
+@lru_cache(maxsize=None)
+def _filter_countries_kb(selected: Optional[str]) -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    for country in COUNTRIES:
+        text = f"✅ {country}" if country == selected else country
+        builder.button(text=text, callback_data=f"filter_country:{country}")
+    builder.button(text="🌍 Любая", callback_data="filter_country:none")
+    builder.adjust(2)
+    return builder.as_markup()
+
+
+def get_filter_positions_kb(game: str, selected: List[str] = None) -> InlineKeyboardMarkup:
+    """Фильтр по позициям: подходит анкета с любой из выбранных"""
+    return _filter_positions_kb(game, frozenset(selected or []) & frozenset(POSITIONS.get(game, [])))
+
+
+@lru_cache(maxsize=None)
+def _filter_positions_kb(game: str, selected: FrozenSet[str]) -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    for position in POSITIONS.get(game, []):
+        text = f"✅ {position}" if position in selected else position
+        builder.button(text=text, callback_data=f"filter_pos:{position}")
+    builder.adjust(2)
+    builder.row(
+        InlineKeyboardButton(text="✔️ Готово", callback_data="filters")
+    )
+    return builder.as_markup()
+
+
+def get_filter_goals_kb(selected: List[str] = None) -> InlineKeyboardMarkup:
+    """Фильтр по целям: подходит анкета с любой из выбранных"""
+    return _filter_goals_kb(frozenset(selected or []) & frozenset(GOALS))
+
+
+@lru_cache(maxsize=None)
+def _filter_goals_kb(selected: FrozenSet[str]) -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    for goal in GOALS:
+        text = f"✅ {goal}" if goal in selected else goal
+        builder.button(text=text, callback_data=f"filter_goal:{goal}")
+    builder.adjust(2)
+    builder.row(
+        InlineKeyboardButton(text="✔️ Готово", callback_data="filters")
+    )
+    return builder.as_markup()
+
+
+@lru_cache(maxsize=None)
+def get_filter_rating_kb() -> InlineKeyboardMarkup:
+    """Фильтр по минимальному рейтингу"""
+    builder = InlineKeyboardBuilder()
+    for rating in (3, 4, 4.5):
+        builder.button(text=f"⭐ от {rating}", callback_data=f"filter_rating:{rating}")
+    builder.button(text="Любой", callback_data="filter_rating:0")
+    builder.adjust(1)
+    return builder.as_markup()
+
+
+@lru_cache(maxsize=None)
 def get_report_reasons_kb() -> InlineKeyboardMarkup:
     """Причины жалоб"""
     builder = InlineKeyboardBuilder()
@@ -143,6 +247,7 @@ def get_report_reasons_kb() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@lru_cache(maxsize=None)
 def get_rating_kb() -> InlineKeyboardMarkup:
     """Выбор рейтинга"""
     builder = InlineKeyboardBuilder()
@@ -152,8 +257,18 @@ def get_rating_kb() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@lru_cache(maxsize=None)
 def get_back_to_menu_kb() -> InlineKeyboardMarkup:
     """Кнопка возврата в меню"""
     builder = InlineKeyboardBuilder()
     builder.button(text="🏠 В главное меню", callback_data="to_menu")
-    return builder.as_markup()
\ No newline at end of file
+    return builder.as_markup()
+
+
+# Неизменные клавиатуры - сразу в кэш
+for _has_profile in (False, True):
+    get_main_menu_kb(_has_profile)
+for _keyboard in (get_games_kb, get_skip_kb, get_countries_kb, get_profile_confirm_kb, get_search_kb,
+                  get_filters_kb, get_filter_rating_kb, get_report_reasons_kb, get_rating_kb,
+                  get_back_to_menu_kb):
+    _keyboard()
@@ -0,0 +1,354 @@
+"""Нагрузочный тест бота без Telegram.
+
+Собирает настоящий диспетчер (bot.create_dispatcher) со всеми роутерами,
+вместо Bot API - сессия с заданной задержкой ответа. Виртуальные
+пользователи одновременно проходят /start, создание анкеты, поиск
+с лайками и дизлайками и просмотр мэтчей. В конце печатает пропускную
+способность и перцентили задержки по шагам и обработчикам.
+
+    python loadtest.py --users 2000 --swipes 30
+    python loadtest.py --users 500 --telegram-limits --max-p95 200
+    python loadtest.py --users 2000 --mode webhook
+    python loadtest.py --users 1000 --no-write-batching
+
+В режиме polling обновления передаются прямо в диспетчер, как это делает
+start_polling после getUpdates; в режиме webhook - POST-запросами
+к приложению aiohttp из bot.create_webhook_app через локальный порт.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from aiohttp import TCPConnector
+from aiohttp.test_utils import TestClient, TestServer
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.methods import GetMe, TelegramMethod
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+from bot import create_dispatcher, create_webhook_app, shutdown
+from config import COUNTRIES, GAMES, GOALS, POSITIONS, WEBHOOK_PATH
+from database import Database
+from metrics import Metrics
+from outbox import Outbox
+
+logger = logging.getLogger('loadtest')
+
+BOT_USER = User(id=123, is_bot=True, first_name='TeamFinder', username='teamfinder_bot')
+# Лимиты Outbox, которые никогда не срабатывают (inf дает nan в TokenBucket)
+_NO_LIMIT = 1e9
+_WEBHOOK_SECRET = 'loadtest'
+
+
+class FakeSession(BaseSession):
+    """Сессия бота, отвечающая вместо Telegram через latency секунд"""
+
+    def __init__(self, latency: float):
+        super().__init__()
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._message_id = 0
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None):
+        self.calls[type(method).__name__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if isinstance(method, GetMe):
+            return BOT_USER
+        if type(method).__name__ in ('SendMessage', 'SendPhoto'):
+            self._message_id += 1
+            return Message(message_id=self._message_id, date=datetime.now(),
+                           chat=Chat(id=method.chat_id, type='private'), from_user=BOT_USER, text='ok')
+        return True
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b''
+
+
+class LoadTest:
+    """Виртуальные пользователи и замеры времени feed_update по шагам"""
+
+    def __init__(self, dp: Dispatcher, bot: Bot, args: argparse.Namespace,
+                 client: Optional[TestClient] = None):
+        self.dp = dp
+        self.bot = bot
+        self.args = args
+        # Клиент вебхука: обновления отправляются POST-запросами
+        self.client = client
+        self.random = random.Random(args.seed)
+        # Шаг сценария -> задержки обновлений, с
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+        self.unhandled: Counter = Counter()
+        self.likes = 0
+        self._update_id = 0
+        self._message_id = 0
+        self._profiles_done = 0
+        # Свайпы начинаются, когда анкеты созданы у всех: иначе первым нечего смотреть
+        self._all_profiles = asyncio.Event()
+        self.phases: Dict[str, float] = {}
+
+    async def run(self):
+        started = time.perf_counter()
+        await asyncio.gather(*(self._user(i) for i in range(self.args.users)))
+        self.phases['swipes'] = time.perf_counter() - self.phases['profiles']
+        self.phases['profiles'] -= started
+        self.elapsed = time.perf_counter() - started
+
+    async def _user(self, index: int):
+        args = self.args
+        rnd = random.Random(f'{args.seed}:{index}')
+        user = User(id=10_000_000 + index, is_bot=False, first_name=f'Load{index}', username=f'load{index}')
+        if args.ramp_up:
+            await asyncio.sleep(args.ramp_up * index / args.users)
+
+        game = rnd.choice(list(GAMES))
+        await self._text(user, 'start', '/start')
+        await self._text(user, 'profile', '📝 Создать анкету')
+        await self._callback(user, 'profile', f'game:{game}')
+        await self._text(user, 'profile', f'https://steamcommunity.com/id/load{index}')
+        if game == 'cs2':
+            await self._text(user, 'profile', f'https://www.faceit.com/ru/players/load{index}')
+        else:
+            await self._text(user, 'profile', f'https://www.dotabuff.com/players/{index}')
+        await self._callback(user, 'profile', f'country:{rnd.choice(list(COUNTRIES))}')
+        for position in rnd.sample(POSITIONS[game], rnd.randint(1, 2)):
+            await self._callback(user, 'profile', f'pos_add:{position}')
+        await self._callback(user, 'profile', 'positions_done')
+        for goal in rnd.sample(GOALS, rnd.randint(1, 3)):
+            await self._callback(user, 'profile', f'goal_add:{goal}')
+        await self._callback(user, 'profile', 'goals_done')
+        await self._text(user, 'profile', 'Играю вечерами, ищу команду')
+        # Скриншот пропускается: будет превью анкеты
+        await self._callback(user, 'profile', 'skip')
+        await self._callback(user, 'profile', 'profile_save')
+
+        self._profiles_done += 1
+        if self._profiles_done == args.users:
+            self.phases['profiles'] = time.perf_counter()
+            self._all_profiles.set()
+        await self._all_profiles.wait()
+
+        await self._text(user, 'search', '🔍 Поиск')
+        for _ in range(args.swipes):
+            if rnd.random() < args.like_ratio:
+                self.likes += 1
+                await self._callback(user, 'like', 'like')
+            else:
+                await self._callback(user, 'dislike', 'dislike')
+        await self._text(user, 'matches', '💞 Мэтчи')
+
+    async def _text(self, user: User, step: str, text: str):
+        message = Message(message_id=self._next_message_id(), date=datetime.now(),
+                          chat=Chat(id=user.id, type='private'), from_user=user, text=text)
+        await self._feed(step, Update(update_id=self._next_update_id(), message=message))
+
+    async def _callback(self, user: User, step: str, data: str):
+        # Как в Telegram: сообщение с кнопкой отправлено ботом в чат пользователя
+        message = Message(message_id=self._next_message_id(), date=datetime.now(),
+                          chat=Chat(id=user.id, type='private'), from_user=BOT_USER, text='ok')
+        query = CallbackQuery(id=str(self._update_id + 1), from_user=user, chat_instance=str(user.id),
+                              message=message, data=data)
+        await self._feed(step, Update(update_id=self._next_update_id(), callback_query=query))
+
+    async def _feed(self, step: str, update: Update):
+        if self.args.think:
+            await asyncio.sleep(self.random.uniform(0, 2 * self.args.think))
+        started = time.perf_counter()
+        try:
+            result = await self._deliver(update)
+        except Exception:
+            self.errors[step] += 1
+            if sum(self.errors.values()) <= 3:
+                logger.exception("Ошибка на шаге %s", step)
+            return
+        finally:
+            self.latencies[step].append(time.perf_counter() - started)
+        if result is UNHANDLED:
+            self.unhandled[step] += 1
+
+    async def _deliver(self, update: Update):
+        if not self.client:
+            return await self.dp.feed_update(self.bot, update)
+        # Вебхук не сообщает, нашелся ли обработчик: UNHANDLED только в polling
+        response = await self.client.post(
+            WEBHOOK_PATH, data=update.model_dump_json(exclude_none=True),
+            headers={'Content-Type': 'application/json', 'X-Telegram-Bot-Api-Secret-Token': _WEBHOOK_SECRET}
+        )
+        await response.read()
+        if response.status != 200:
+            raise RuntimeError(f"вебхук ответил {response.status}")
+
+    def _next_update_id(self) -> int:
+        self._update_id += 1
+        return self._update_id
+
+    def _next_message_id(self) -> int:
+        self._message_id += 1
+        return self._message_id
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Квантиль q по отсортированному списку (ближайший ранг)"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'p50': percentile(values, 0.5) * 1000,
+        'p95': percentile(values, 0.95) * 1000,
+        'p99': percentile(values, 0.99) * 1000,
+        'max': (values[-1] if values else 0.0) * 1000,
+    }
+
+
+def report(test: LoadTest, session: FakeSession, metrics: Metrics, db: Database) -> Dict:
+    """Печатает итоги и возвращает их для --json"""
+    all_latencies = [value for values in test.latencies.values() for value in values]
+    total = summarize(all_latencies)
+    swipes = len(test.latencies['like']) + len(test.latencies['dislike'])
+    result = {
+        'mode': test.args.mode,
+        'write_batching': not test.args.no_write_batching,
+        'users': test.args.users,
+        'updates': total['count'],
+        'seconds': test.elapsed,
+        'updates_per_second': total['count'] / test.elapsed,
+        'swipes_per_second': swipes / test.phases['swipes'],
+        'latency_ms': total,
+        'steps': {step: summarize(values) for step, values in test.latencies.items()},
+        'errors': dict(test.errors),
+        'unhandled': dict(test.unhandled),
+        'api_calls': dict(session.calls),
+    }
+
+    print(f"\nРежим: {test.args.mode}, пользователей: {test.args.users}, обновлений: {total['count']}, "
+          f"время: {test.elapsed:.1f} с, {result['updates_per_second']:.0f} обновлений/с")
+    print(f"Анкеты: {test.phases['profiles']:.1f} с, свайпы и мэтчи: {test.phases['swipes']:.1f} с "
+          f"({result['swipes_per_second']:.0f} свайпов/с), лайков: {test.likes}, "
+          f"групповая запись: {'да' if result['write_batching'] else 'нет'}")
+    print(f"Ошибок: {sum(test.errors.values())} {dict(test.errors) or ''}, "
+          f"без обработчика: {sum(test.unhandled.values())} {dict(test.unhandled) or ''}")
+
+    print(f"\n{'шаг':<10}{'кол-во':>9}{'p50 мс':>9}{'p95 мс':>9}{'p99 мс':>9}{'max мс':>9}")
+    for step, stats in list(result['steps'].items()) + [('всего', total)]:
+        print(f"{step:<10}{stats['count']:>9}{stats['p50']:>9.1f}{stats['p95']:>9.1f}"
+              f"{stats['p99']:>9.1f}{stats['max']:>9.1f}")
+
+    # Разбивка из metrics.py: квантили с точностью до корзины гистограммы
+    print(f"\n{'обработчик':<32}{'кол-во':>8}{'p50':>8}{'p95':>8}{'БД p95':>8}{'API p95':>8}{'FSM p95':>8}  мс")
+    for handler, parts in sorted(metrics.handlers.items(), key=lambda item: -item[1]['total'].sum):
+        print(f"{handler:<32}{parts['total'].count:>8}{parts['total'].quantile(0.5) * 1000:>8.1f}"
+              f"{parts['total'].quantile(0.95) * 1000:>8.1f}{parts['db'].quantile(0.95) * 1000:>8.1f}"
+              f"{parts['api'].quantile(0.95) * 1000:>8.1f}{parts['fsm'].quantile(0.95) * 1000:>8.1f}")
+
+    print("\nЗапросы к Bot API: " + ', '.join(f"{name} {count}" for name, count in session.calls.most_common()))
+
+    if db.profiler:
+        print("\nСамые дорогие SQL-запросы:")
+        for stats in db.profiler.top(5):
+            print(f"  {stats.total * 1000:8.0f} мс {stats.count:>7} раз  {stats.sql[:100]}")
+    return result
+
+
+async def main(args: argparse.Namespace) -> int:
+    if args.db:
+        return await run_load_test(args, args.db)
+    # Временная база удаляется вместе с папкой, даже если тест упал
+    with tempfile.TemporaryDirectory(prefix='teamfinder-load-') as tmp_dir:
+        return await run_load_test(args, os.path.join(tmp_dir, 'load.db'))
+
+
+async def run_load_test(args: argparse.Namespace, path: str) -> int:
+    # Без групповой записи каждая операция очереди коммитится отдельно
+    db = Database(path, write_delay=0, write_queue_size=1) if args.no_write_batching else Database(path)
+    await db.connect()
+    await db.create_tables()
+
+    session = FakeSession(args.api_latency)
+    bot = Bot(token='123:loadtest', session=session)
+    outbox = None if args.telegram_limits else Outbox(
+        global_rate=_NO_LIMIT, chat_rate=_NO_LIMIT, chat_burst=_NO_LIMIT, group_rate=_NO_LIMIT
+    )
+    metrics = Metrics()
+    dp = create_dispatcher(bot, db, outbox=outbox, metrics=metrics)
+
+    client = None
+    if args.mode == 'webhook':
+        # Обработка до ответа: иначе следующее действие пользователя
+        # обгонит предыдущее, а замер покажет только прием запроса
+        app, _ = create_webhook_app(dp, bot, secret=_WEBHOOK_SECRET, background=False)
+        # Telegram держит не больше max_connections запросов к вебхуку
+        client = TestClient(TestServer(app, host='127.0.0.1'),
+                            connector=TCPConnector(limit=args.webhook_connections))
+        await client.start_server()
+
+    test = LoadTest(dp, bot, args, client)
+    try:
+        await test.run()
+    finally:
+        if client:
+            await client.close()
+        # Уведомления о мэтчах и отложенные записи тоже часть нагрузки
+        await shutdown(dp, bot)
+
+    result = report(test, session, metrics, db)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    failed = sum(test.errors.values()) > 0
+    if args.max_p95 and result['latency_ms']['p95'] > args.max_p95:
+        print(f"\np95 {result['latency_ms']['p95']:.1f} мс больше допустимых {args.max_p95:.1f} мс")
+        failed = True
+    return 1 if failed else 0
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест диспетчера без Telegram")
+    parser.add_argument('--users', type=int, default=1000, help="виртуальных пользователей")
+    parser.add_argument('--swipes', type=int, default=20, help="свайпов на пользователя")
+    parser.add_argument('--like-ratio', type=float, default=0.5, help="доля лайков среди свайпов")
+    parser.add_argument('--api-latency', type=float, default=0.03, help="ответ Bot API, с")
+    parser.add_argument('--think', type=float, default=0.0, help="средняя пауза пользователя между действиями, с")
+    parser.add_argument('--ramp-up', type=float, default=0.0, help="пользователи подключаются за столько секунд")
+    parser.add_argument('--telegram-limits', action='store_true',
+                        help="лимиты отправки Outbox из config (по умолчанию выключены)")
+    parser.add_argument('--mode', choices=('polling', 'webhook'), default='polling',
+                        help="доставка обновлений: прямо в диспетчер или POST на вебхук")
+    parser.add_argument('--webhook-connections', type=int, default=40,
+                        help="одновременных запросов к вебхуку (max_connections в setWebhook)")
+    parser.add_argument('--no-write-batching', action='store_true',
+                        help="коммит на каждый лайк и просмотр (WRITE_BATCH_DELAY=0, WRITE_QUEUE_SIZE=1)")
+    parser.add_argument('--db', help="файл базы (по умолчанию новая во временной папке)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help="сохранить итоги в файл")
+    parser.add_argument('--max-p95', type=float, default=0.0,
+                        help="код выхода 1, если общий p95 больше (мс)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    # bot.py включает INFO: на каждое обновление aiogram пишет строку в лог
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('aiogram.event').setLevel(logging.WARNING)
+    # Медленные запросы под нагрузкой есть всегда; сводка по ним - в конце отчета
+    logging.getLogger('profiler').setLevel(logging.ERROR)
+    sys.exit(asyncio.run(main(parse_args())))
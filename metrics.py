@@ -0,0 +1,206 @@
+import asyncio
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject, Update
+
+# Границы корзин гистограмм: ровно 0 (обработчик не ждал), затем
+# от 0.1 мс до ~90 с, каждая следующая на 19% больше
+_BOUNDS = [0.0] + [1e-4 * 2 ** (i / 4) for i in range(80)]
+_QUANTILES = (0.5, 0.95, 0.99)
+# Составляющие времени обработки; total - все время обновления
+_PARTS = ('total', 'db', 'api', 'fsm')
+
+
+class _Timings:
+    """Время, которое обрабатывающая обновление задача провела в ожидании"""
+
+    __slots__ = ('task', 'handler', 'active', 'db', 'api', 'fsm')
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.handler: Optional[str] = None
+        # Составляющая, которая сейчас замеряется (вложенные не считаются)
+        self.active: Optional[str] = None
+        self.db = 0.0
+        self.api = 0.0
+        self.fsm = 0.0
+
+
+_current: ContextVar[Optional[_Timings]] = ContextVar('metrics_timings', default=None)
+
+
+class timed:
+    """Засчитывает время блока обновлению, которое обрабатывает текущая задача:
+    part - 'db', 'api' или 'fsm'. Фоновые задачи, порожденные обработчиком,
+    не учитываются. Если метрики выключены, блок почти ничего не стоит
+    """
+
+    __slots__ = ('part', 'timings', 'started')
+
+    def __init__(self, part: str):
+        self.part = part
+        self.timings = None
+
+    def __enter__(self):
+        timings = _current.get()
+        if timings is not None and timings.active is None and timings.task is asyncio.current_task():
+            timings.active = self.part
+            self.timings = timings
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        timings = self.timings
+        if timings is not None:
+            setattr(timings, self.part, getattr(timings, self.part) + time.perf_counter() - self.started)
+            timings.active = None
+
+
+class Histogram:
+    """Гистограмма с логарифмическими корзинами; квантили - с точностью до корзины"""
+
+    __slots__ = ('buckets', 'count', 'sum')
+
+    def __init__(self):
+        self.buckets = [0] * (len(_BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.buckets[bisect_left(_BOUNDS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Верхняя граница корзины, в которую попал квантиль q"""
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return _BOUNDS[i] if i < len(_BOUNDS) else float('inf')
+        return 0.0
+
+
+class _ApiTimer(BaseRequestMiddleware):
+    """Время запросов к Bot API вместе с ожиданием лимитов Outbox"""
+
+    async def __call__(self, make_request, bot, method):
+        with timed('api'):
+            return await make_request(bot, method)
+
+
+class Metrics:
+    """Число обновлений по типам и время обработчиков (p50/p95/p99)
+    с разбивкой на ожидание БД, Bot API и хранилища FSM.
+    Отдает текст в формате Prometheus по HTTP.
+
+    Без setup() ничего не замеряется: блоки timed() в Database и
+    хранилище только проверяют contextvar
+    """
+
+    def __init__(self):
+        self.updates: Dict[str, int] = defaultdict(int)
+        self.errors: Dict[str, int] = defaultdict(int)
+        # Обработчик -> составляющая -> гистограмма
+        self.handlers: Dict[str, Dict[str, Histogram]] = {}
+        self._names: Dict[Callable, str] = {}
+
+    def setup(self, dp: Dispatcher, bot: Bot):
+        """Подключает замеры к диспетчеру и сессии бота. Сессию - до Outbox,
+        чтобы время API включало ожидание лимитов"""
+        dp.update.outer_middleware(self._on_update)
+        for observer in dp.observers.values():
+            if observer.event_name not in ('update', 'error'):
+                observer.middleware(self._on_handler)
+        bot.session.middleware(_ApiTimer())
+
+    async def serve(self, host: str, port: int) -> web.AppRunner:
+        """HTTP-сервер с /metrics; остановка - runner.cleanup()"""
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle_metrics)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        lines = [
+            '# HELP teamfinder_updates_total Обновления по типам',
+            '# TYPE teamfinder_updates_total counter',
+        ]
+        for event_type, count in sorted(self.updates.items()):
+            lines.append(f'teamfinder_updates_total{{type="{event_type}"}} {count}')
+
+        lines += [
+            '# HELP teamfinder_handler_errors_total Обновления, обработка которых упала',
+            '# TYPE teamfinder_handler_errors_total counter',
+        ]
+        for handler, count in sorted(self.errors.items()):
+            lines.append(f'teamfinder_handler_errors_total{{handler="{handler}"}} {count}')
+
+        lines += [
+            '# HELP teamfinder_handler_seconds Время обработки обновления (total) '
+            'и ожидание в нем БД, Bot API и FSM',
+            '# TYPE teamfinder_handler_seconds summary',
+        ]
+        for handler, parts in sorted(self.handlers.items()):
+            for part in _PARTS:
+                histogram = parts[part]
+                labels = f'handler="{handler}",part="{part}"'
+                for q in _QUANTILES:
+                    lines.append(f'teamfinder_handler_seconds{{{labels},quantile="{q}"}} {histogram.quantile(q):.6f}')
+                lines.append(f'teamfinder_handler_seconds_sum{{{labels}}} {histogram.sum:.6f}')
+                lines.append(f'teamfinder_handler_seconds_count{{{labels}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.render(), content_type='text/plain', charset='utf-8')
+
+    async def _on_update(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                         event: Update, data: Dict[str, Any]) -> Any:
+        self.updates[event.event_type] += 1
+        timings = _Timings(asyncio.current_task())
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.errors[timings.handler or 'unhandled'] += 1
+            raise
+        finally:
+            total = time.perf_counter() - started
+            _current.reset(token)
+            self._observe(timings, total)
+
+    async def _on_handler(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                          event: TelegramObject, data: Dict[str, Any]) -> Any:
+        timings = _current.get()
+        if timings is not None:
+            timings.handler = self._name(data['handler'].callback)
+        return await handler(event, data)
+
+    def _name(self, callback: Callable) -> str:
+        name = self._names.get(callback)
+        if name is None:
+            # handlers.search.handle_like -> search.handle_like
+            module = callback.__module__.rsplit('.', 1)[-1]
+            name = self._names[callback] = f'{module}.{callback.__name__}'
+        return name
+
+    def _observe(self, timings: _Timings, total: float):
+        parts = self.handlers.get(timings.handler or 'unhandled')
+        if parts is None:
+            parts = self.handlers[timings.handler or 'unhandled'] = {part: Histogram() for part in _PARTS}
+        parts['total'].observe(total)
+        parts['db'].observe(timings.db)
+        parts['api'].observe(timings.api)
+        parts['fsm'].observe(timings.fsm)
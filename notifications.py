@@ -0,0 +1,108 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+
+from config import GAMES, NOTIFY_BATCH_DELAY, NOTIFY_DIGEST_SIZE
+from database import Database
+from outbox import NOTIFICATION, send_priority
+
+logger = logging.getLogger(__name__)
+
+
+class MatchNotifier:
+    """Уведомления о новых мэтчах обоим игрокам.
+
+    notify() только запоминает событие; раз в batch_delay секунд мэтчи,
+    накопленные для каждого получателя, уходят одним сообщением в очереди
+    NOTIFICATION (см. outbox.py). Повторы одного мэтча в пачке схлопываются
+    """
+
+    def __init__(self, bot: Bot, db: Database, batch_delay: float = NOTIFY_BATCH_DELAY,
+                 digest_size: int = NOTIFY_DIGEST_SIZE):
+        self.bot = bot
+        self.db = db
+        self.batch_delay = batch_delay
+        self.digest_size = digest_size
+        # Получатель -> {(собеседник, игра): None}: упорядоченное множество
+        self._pending: Dict[int, Dict[Tuple[int, str], None]] = {}
+        self._event = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._sender: Optional[asyncio.Task] = None
+
+    def notify(self, user1_id: int, user2_id: int, game: str):
+        """Ставит уведомление о мэтче в очередь обоим игрокам"""
+        for recipient, other in ((user1_id, user2_id), (user2_id, user1_id)):
+            self._pending.setdefault(recipient, {})[(other, game)] = None
+
+        if self._sender is None or self._sender.done():
+            self._sender = asyncio.create_task(self._send_loop())
+        self._event.set()
+
+    async def flush(self):
+        """Отправляет все накопленные уведомления"""
+        async with self._flush_lock:
+            pending, self._pending = self._pending, {}
+            self._event.clear()
+            if pending:
+                await self._send_all(pending)
+
+    async def _send_all(self, pending: Dict[int, Dict[Tuple[int, str], None]]):
+        # Анкеты собеседников: один запрос на игру, остальное из кэша анкет
+        by_game = defaultdict(set)
+        for matches in pending.values():
+            for other, game in matches:
+                by_game[game].add(other)
+        profiles = {}
+        for game, user_ids in by_game.items():
+            for profile in await self.db.get_profiles(user_ids, game):
+                profiles[(profile['user_id'], game)] = profile
+
+        with send_priority(NOTIFICATION):
+            await asyncio.gather(*(
+                self._send(recipient, [profiles[key] for key in matches if key in profiles])
+                for recipient, matches in pending.items()
+            ))
+
+    async def close(self):
+        """Рассылает накопленное и останавливает фоновую отправку"""
+        if self._sender:
+            self._sender.cancel()
+            self._sender = None
+        await self.flush()
+
+    async def _send_loop(self):
+        while True:
+            await self._event.wait()
+            await asyncio.sleep(self.batch_delay)
+            try:
+                # shield: остановка цикла в close() не прерывает начатую рассылку
+                await asyncio.shield(self.flush())
+            except Exception:
+                logger.exception("Не удалось разослать уведомления о мэтчах")
+
+    async def _send(self, recipient: int, matches: List[Dict]):
+        if not matches:
+            # Анкета собеседника уже скрыта
+            return
+
+        if len(matches) == 1:
+            match = matches[0]
+            text = f"💞 Новый мэтч: <b>{match['username']}</b> ({GAMES.get(match['game'])})\n\n"
+        else:
+            text = f"💞 Новых мэтчей: {len(matches)}\n\n"
+            for match in matches[:self.digest_size]:
+                text += f"• <b>{match['username']}</b> ({GAMES.get(match['game'])})\n"
+            if len(matches) > self.digest_size:
+                text += f"...и еще {len(matches) - self.digest_size}\n"
+            text += "\n"
+        text += "Контакты - в разделе «💞 Мэтчи»"
+
+        try:
+            await self.bot.send_message(recipient, text, parse_mode="HTML")
+        except TelegramAPIError as e:
+            # Пользователь мог заблокировать бота
+            logger.info("Уведомление о мэтче для %d не доставлено: %s", recipient, e)
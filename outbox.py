@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Dict, Optional, Set
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+
+from config import (
+    OUTBOX_GLOBAL_RATE, OUTBOX_CHAT_RATE, OUTBOX_CHAT_BURST, OUTBOX_GROUP_RATE, OUTBOX_MAX_RETRIES
+)
+
+logger = logging.getLogger(__name__)
+
+# Очереди исходящих запросов, меньший номер обслуживается первым
+INTERACTIVE = 0  # ответы пользователю на его действие
+NOTIFICATION = 1  # уведомления о мэтчах и т.п.
+BROADCAST = 2  # рассылки администратора
+_LANES = 3
+
+# Очередь текущей задачи: обработчики - INTERACTIVE, рассылки задают свою (см. send_priority)
+_priority: ContextVar[int] = ContextVar('send_priority', default=INTERACTIVE)
+
+# Число хранимых лимитов чатов, после которого отбрасываются простаивающие
+_MAX_CHAT_BUCKETS = 10000
+
+# Методы, создающие сообщения: только они расходуют лимиты отправки.
+# Правка и удаление уже отправленных сообщений идут без очереди
+_SEND_PREFIXES = ('send', 'forward', 'copy')
+
+
+@contextmanager
+def send_priority(priority: int):
+    """Запросы к Bot API внутри блока встают в очередь priority"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """Не больше rate запросов в секунду, подряд - не больше capacity"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Через сколько секунд можно отправить запрос (0 - сейчас)"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, now: float, seconds: float):
+        """Следующий запрос - не раньше чем через seconds"""
+        self.wait_time(now)
+        self.tokens = min(self.tokens, 1) - seconds * self.rate
+
+    def idle(self, now: float) -> bool:
+        return self.wait_time(now) == 0 and self.tokens >= self.capacity
+
+
+class Outbox(BaseRequestMiddleware):
+    """Планировщик исходящих запросов к Bot API (middleware сессии бота).
+
+    Отправка сообщений (send*, forward*, copy*) ждет общего лимита бота
+    и лимита своего чата; из ожидающих первой идет очередь с меньшим
+    номером, внутри очереди чаты обслуживаются по кругу. На 429 чат
+    замолкает на retry_after, и запрос повторяется. Остальные запросы
+    (правка и удаление сообщений, answerCallbackQuery, getUpdates)
+    идут без ожидания
+    """
+
+    def __init__(self, global_rate: float = OUTBOX_GLOBAL_RATE, chat_rate: float = OUTBOX_CHAT_RATE,
+                 chat_burst: int = OUTBOX_CHAT_BURST, group_rate: float = OUTBOX_GROUP_RATE,
+                 max_retries: int = OUTBOX_MAX_RETRIES):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate, time.monotonic())
+        self._chats: Dict[int, TokenBucket] = {}
+        # По очереди на приоритет: chat_id -> ожидающие запросы чата
+        self._lanes = [OrderedDict() for _ in range(_LANES)]
+        self._waiting = 0
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        # Запросы, отправленные через post
+        self._posted: Set[asyncio.Task] = set()
+
+    async def __call__(self, make_request: NextRequestMiddlewareType[TelegramType], bot: Bot,
+                       method: TelegramMethod[TelegramType]) -> Response[TelegramType]:
+        chat_id = getattr(method, 'chat_id', None)
+        if not isinstance(chat_id, int) or not method.__api_method__.startswith(_SEND_PREFIXES):
+            return await make_request(bot, method)
+
+        priority = _priority.get()
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(chat_id, priority, retry=attempt > 0)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning("429 для чата %d: повтор через %d с", chat_id, e.retry_after)
+                now = time.monotonic()
+                self._bucket(chat_id, now).pause(now, e.retry_after)
+
+    def post(self, request: Awaitable):
+        """Отправляет запрос в фоне, не дожидаясь ответа Telegram
+        (удаление сообщений, ответы на нажатия кнопок). Ошибки пишутся в лог"""
+        task = asyncio.ensure_future(request)
+        self._posted.add(task)
+        task.add_done_callback(self._posted_done)
+
+    async def close(self):
+        """Дожидается запросов из post и останавливает планировщик"""
+        if self._posted:
+            await asyncio.gather(*self._posted, return_exceptions=True)
+        if self._worker:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+
+    def _posted_done(self, task: asyncio.Task):
+        self._posted.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.warning("Фоновый запрос к Bot API не выполнен: %r", task.exception())
+
+    def _bucket(self, chat_id: int, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= _MAX_CHAT_BUCKETS:
+                # Простаивающий лимит ничем не отличается от нового
+                for idle_id in [key for key, value in self._chats.items() if value.idle(now)]:
+                    del self._chats[idle_id]
+            # Отрицательный chat_id - группа или канал
+            rate = self.chat_rate if chat_id > 0 else self.group_rate
+            bucket = self._chats[chat_id] = TokenBucket(rate, self.chat_burst, now)
+        return bucket
+
+    async def _acquire(self, chat_id: int, priority: int, retry: bool = False):
+        """Ждет разрешения на запрос в чат"""
+        now = time.monotonic()
+        # Никто не ждет - очередь не нужна
+        if not self._waiting and not self._global.wait_time(now):
+            bucket = self._bucket(chat_id, now)
+            if not bucket.wait_time(now):
+                self._global.take()
+                bucket.take()
+                return
+
+        waiter = asyncio.get_running_loop().create_future()
+        lane = self._lanes[priority]
+        queue = lane.get(chat_id)
+        if queue is None:
+            queue = lane[chat_id] = deque()
+        # Повтор после 429 уходит раньше следующих сообщений чата
+        if retry:
+            queue.appendleft(waiter)
+        else:
+            queue.append(waiter)
+        self._waiting += 1
+
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        self._wakeup.set()
+        await waiter
+
+    async def _run(self):
+        while True:
+            delay = self._dispatch(time.monotonic())
+            self._wakeup.clear()
+            if delay is None:
+                await self._wakeup.wait()
+            else:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+
+    def _dispatch(self, now: float) -> Optional[float]:
+        """Выдает разрешения ожидающим; возвращает, через сколько секунд
+        появится следующее (None - ждать некого)"""
+        while self._waiting:
+            delay = self._global.wait_time(now)
+            if delay:
+                return delay
+
+            delay = None
+            for lane in self._lanes:
+                granted = False
+                empty = []
+                for chat_id, queue in lane.items():
+                    # Отмененные ожидания (обработчик прерван) пропускаются
+                    while queue and queue[0].done():
+                        queue.popleft()
+                        self._waiting -= 1
+                    if not queue:
+                        empty.append(chat_id)
+                        continue
+
+                    bucket = self._bucket(chat_id, now)
+                    chat_delay = bucket.wait_time(now)
+                    if chat_delay:
+                        delay = chat_delay if delay is None else min(delay, chat_delay)
+                        continue
+
+                    self._global.take()
+                    bucket.take()
+                    queue.popleft().set_result(None)
+                    self._waiting -= 1
+                    granted = True
+                    break
+
+                for empty_id in empty:
+                    del lane[empty_id]
+                if granted:
+                    # Следующим в этой очереди обслуживается другой чат
+                    if lane.get(chat_id):
+                        lane.move_to_end(chat_id)
+                    else:
+                        lane.pop(chat_id, None)
+                    break
+            else:
+                return delay
+        return None
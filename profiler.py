@@ -0,0 +1,215 @@
+import logging
+import re
+import sys
+import time
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional
+
+import aiosqlite
+
+from config import DB_SLOW_QUERY_MS
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql: str) -> str:
+    """Текст запроса без лишних пробелов; списки плейсхолдеров переменной
+    длины (IN (?, ?, ...)) сворачиваются, чтобы это был один запрос"""
+    sql = ' '.join(sql.split())
+    sql = re.sub(r'\(\?(?:, \?)+\)', '(?, ...)', sql)
+    return re.sub(r'(\(\?, \.\.\.\)|\(\?\))(?:, \1)+', r'\1, ...', sql)
+
+
+class QueryStats:
+    """Накопленная статистика одного запроса"""
+
+    __slots__ = ('sql', 'count', 'total', 'max', 'rows', 'sites', 'plan')
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        # Место вызова в Database -> число вызовов
+        self.sites: Dict[str, int] = {}
+        # EXPLAIN QUERY PLAN, снимается при первом медленном выполнении
+        self.plan: Optional[List[str]] = None
+
+
+class QueryProfiler:
+    """Время, число строк и место вызова каждого SQL-запроса Database.
+
+    Запросы дольше threshold (мс) пишутся в лог вместе с планом
+    выполнения. Статистика копится по тексту запроса за все время работы
+    """
+
+    def __init__(self, threshold: float = DB_SLOW_QUERY_MS):
+        self.threshold = threshold / 1000
+        self.stats: Dict[str, QueryStats] = {}
+
+    def wrap(self, connection: aiosqlite.Connection) -> '_ProfiledConnection':
+        return _ProfiledConnection(connection, self)
+
+    def top(self, limit: int) -> List[QueryStats]:
+        """Самые дорогие запросы по суммарному времени"""
+        return sorted(self.stats.values(), key=lambda stats: stats.total, reverse=True)[:limit]
+
+    def _start(self, sql: str, site: str) -> QueryStats:
+        key = normalize_sql(sql)
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = QueryStats(key)
+        stats.count += 1
+        stats.sites[site] = stats.sites.get(site, 0) + 1
+        return stats
+
+    async def _slow(self, cursor: '_ProfiledCursor'):
+        stats = cursor.stats
+        if stats.plan is None and cursor.parameters is not None:
+            try:
+                async with cursor.connection.execute(
+                    'EXPLAIN QUERY PLAN ' + cursor.sql, cursor.parameters
+                ) as plan_cursor:
+                    stats.plan = [row[3] for row in await plan_cursor.fetchall()]
+            except Exception as e:
+                stats.plan = [f'нет плана: {e}']
+        logger.warning(
+            "Медленный запрос %.1f мс, строк %d (%s): %s\n  план: %s",
+            cursor.elapsed * 1000, cursor.rows, cursor.site, stats.sql, '; '.join(stats.plan or ['-'])
+        )
+
+
+class _ProfiledConnection:
+    """Соединение aiosqlite, замеряющее execute/executemany;
+    остальное передается как есть"""
+
+    def __init__(self, connection: aiosqlite.Connection, profiler: QueryProfiler):
+        self._connection = connection
+        self._profiler = profiler
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._connection, name)
+
+    def execute(self, sql: str, parameters: Optional[Iterable[Any]] = None) -> '_Execution':
+        # Как и у aiosqlite: и await db.execute(...), и async with db.execute(...)
+        return _Execution(self._execute(self._connection.execute, sql, parameters, _call_site()))
+
+    def executemany(self, sql: str, parameters: Iterable[Iterable[Any]]) -> '_Execution':
+        return _Execution(self._execute(self._connection.executemany, sql, parameters, _call_site(), many=True))
+
+    async def _execute(self, method, sql: str, parameters, site: str, many: bool = False) -> '_ProfiledCursor':
+        stats = self._profiler._start(sql, site)
+        started = time.perf_counter()
+        cursor = await method(sql, parameters)
+        cursor = _ProfiledCursor(cursor, self, stats, sql, None if many else parameters, site)
+        cursor._add(time.perf_counter() - started, 0)
+        # У SELECT число строк известно только после выборки
+        if cursor.description is None and cursor._became_slow():
+            await self._profiler._slow(cursor)
+        return cursor
+
+
+class _ProfiledCursor:
+    """Курсор, досчитывающий время и строки запроса при выборке"""
+
+    def __init__(self, cursor: aiosqlite.Cursor, connection: _ProfiledConnection, stats: QueryStats,
+                 sql: str, parameters, site: str):
+        self._cursor = cursor
+        self.connection = connection._connection
+        self.profiler = connection._profiler
+        self.stats = stats
+        self.sql = sql
+        self.parameters = parameters
+        self.site = site
+        self.elapsed = 0.0
+        self.rows = 0
+        self._logged = False
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cursor, name)
+
+    async def fetchone(self):
+        started = time.perf_counter()
+        row = await self._cursor.fetchone()
+        self._add(time.perf_counter() - started, row is not None)
+        if self._became_slow():
+            await self.profiler._slow(self)
+        return row
+
+    async def fetchmany(self, size: Optional[int] = None):
+        started = time.perf_counter()
+        rows = await self._cursor.fetchmany(size)
+        self._add(time.perf_counter() - started, len(rows))
+        if self._became_slow():
+            await self.profiler._slow(self)
+        return rows
+
+    async def fetchall(self):
+        started = time.perf_counter()
+        rows = await self._cursor.fetchall()
+        self._add(time.perf_counter() - started, len(rows))
+        if self._became_slow():
+            await self.profiler._slow(self)
+        return rows
+
+    async def close(self):
+        if self._became_slow():
+            await self.profiler._slow(self)
+        await self._cursor.close()
+
+    async def __aiter__(self):
+        while True:
+            rows = await self.fetchmany(self._cursor.iter_chunk_size)
+            if not rows:
+                return
+            for row in rows:
+                yield row
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _add(self, elapsed: float, rows: int):
+        stats = self.stats
+        self.elapsed += elapsed
+        self.rows += rows
+        stats.total += elapsed
+        stats.rows += rows
+        if self.elapsed > stats.max:
+            stats.max = self.elapsed
+
+    def _became_slow(self) -> bool:
+        """True один раз: когда время запроса впервые превысило порог"""
+        if not self._logged and self.elapsed >= self.profiler.threshold:
+            self._logged = True
+            return True
+        return False
+
+
+class _Execution:
+    """Результат execute: можно дождаться или открыть через async with"""
+
+    __slots__ = ('_coro', '_cursor')
+
+    def __init__(self, coro):
+        self._coro = coro
+
+    def __await__(self):
+        return self._coro.__await__()
+
+    async def __aenter__(self) -> _ProfiledCursor:
+        self._cursor = await self._coro
+        return self._cursor
+
+    async def __aexit__(self, *exc_info):
+        await self._cursor.close()
+
+
+def _call_site() -> str:
+    """Метод Database и строка, откуда выполняется запрос"""
+    frame = sys._getframe(2)
+    return f'{frame.f_code.co_name}:{frame.f_lineno}'
@@ -0,0 +1,214 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Optional, List, Dict, Iterable, Set, Tuple
+
+import numpy as np
+
+from config import COUNTRIES, COUNTRY_REGIONS, POSITIONS, GOALS, RANKING_WEIGHTS
+from database import Database, encode_positions, encode_goals
+
+logger = logging.getLogger(__name__)
+
+# Страна хранится номером в COUNTRIES, последний номер - страна не указана
+_NO_COUNTRY = len(COUNTRIES)
+_COUNTRY_CODES = {country: code for code, country in enumerate(COUNTRIES)}
+# Номер страны -> номер региона (-1 - регион неизвестен)
+_COUNTRY_REGION = np.full(_NO_COUNTRY + 1, -1, dtype=np.int8)
+for _region, _countries in enumerate(COUNTRY_REGIONS.values()):
+    for _country in _countries:
+        _COUNTRY_REGION[_COUNTRY_CODES[_country]] = _region
+
+# Число единичных битов для каждой маски позиций/целей
+_MASK_BITS = max(len(GOALS), *(len(positions) for positions in POSITIONS.values()))
+_POPCOUNT = np.array([bin(mask).count('1') for mask in range(1 << _MASK_BITS)], dtype=np.float32)
+
+# Рейтинг сглаживается к среднему, как будто у каждой анкеты
+# есть еще _PRIOR_COUNT отзывов с оценкой _PRIOR_RATING
+_PRIOR_RATING = 3.0
+_PRIOR_COUNT = 5
+
+
+class _GameIndex:
+    """Поля анкет одной игры в виде массивов NumPy, строка - анкета"""
+
+    def __init__(self, rows: List[Tuple]):
+        self.rows: Dict[int, int] = {}
+        self.user_ids = np.empty(0, dtype=np.int64)
+        self.country = np.empty(0, dtype=np.int16)
+        self.positions = np.empty(0, dtype=np.uint16)
+        self.goals = np.empty(0, dtype=np.uint16)
+        self.rating_sum = np.empty(0, dtype=np.float32)
+        self.review_count = np.empty(0, dtype=np.float32)
+        self.active = np.empty(0, dtype=bool)
+        self._append(rows)
+
+    def update(self, rows: List[Tuple], user_ids: Set[int]):
+        """Применяет свежие строки; анкеты из user_ids без строки - неактивны"""
+        new_rows = []
+        for row in rows:
+            position = self.rows.get(row[0])
+            if position is None:
+                new_rows.append(row)
+                continue
+            (_, country, positions, goals, rating_sum, review_count, active) = row
+            self.country[position] = _COUNTRY_CODES.get(country, _NO_COUNTRY)
+            self.positions[position] = positions or 0
+            self.goals[position] = goals or 0
+            self.rating_sum[position] = rating_sum or 0
+            self.review_count[position] = review_count or 0
+            self.active[position] = bool(active)
+
+        for user_id in user_ids - {row[0] for row in rows}:
+            position = self.rows.get(user_id)
+            if position is not None:
+                self.active[position] = False
+
+        self._append([row for row in new_rows if row[6]])
+
+    def _append(self, rows: List[Tuple]):
+        if not rows:
+            return
+
+        for user_id, *_ in rows:
+            self.rows[user_id] = len(self.rows)
+        columns = list(zip(*rows))
+        self.user_ids = np.concatenate([self.user_ids, np.array(columns[0], dtype=np.int64)])
+        self.country = np.concatenate([self.country, np.array(
+            [_COUNTRY_CODES.get(country, _NO_COUNTRY) for country in columns[1]], dtype=np.int16
+        )])
+        self.positions = np.concatenate([self.positions, np.array(
+            [mask or 0 for mask in columns[2]], dtype=np.uint16
+        )])
+        self.goals = np.concatenate([self.goals, np.array([mask or 0 for mask in columns[3]], dtype=np.uint16)])
+        self.rating_sum = np.concatenate([self.rating_sum, np.array(
+            [value or 0 for value in columns[4]], dtype=np.float32
+        )])
+        self.review_count = np.concatenate([self.review_count, np.array(
+            [value or 0 for value in columns[5]], dtype=np.float32
+        )])
+        self.active = np.concatenate([self.active, np.array(columns[6], dtype=bool)])
+
+
+class CompatibilityRanker:
+    """Кандидаты поиска в порядке совместимости со зрителем.
+
+    Для каждой игры в памяти держится индекс всех активных анкет;
+    изменения анкет дочитываются из БД перед следующим ранжированием.
+    Оценка - взвешенная сумма (веса - config.RANKING_WEIGHTS):
+    позиции кандидата, которых нет у зрителя, общие цели,
+    та же страна (1) или регион (0.5) и сглаженный рейтинг.
+    """
+
+    def __init__(self, db: Database, weights: Optional[Dict[str, float]] = None):
+        self.db = db
+        self.weights = {**RANKING_WEIGHTS, **(weights or {})}
+        self._indexes: Dict[str, _GameIndex] = {}
+        self._dirty: Dict[str, Set[int]] = defaultdict(set)
+        self._locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._rng = np.random.default_rng()
+
+        db.add_profile_listener(self.invalidate)
+
+    def invalidate(self, user_id: int, game: str):
+        self._dirty[game].add(user_id)
+
+    async def get_candidates(self, viewer_id: int, game: str, limit: int,
+                             exclude: Iterable[int] = (), filters: Optional[Dict] = None) -> List[Dict]:
+        """До limit непросмотренных анкет, самые совместимые первыми.
+        Тот же интерфейс, что у Database.get_candidates"""
+        index = await self._index(game)
+        viewer = await self.db.get_profile(viewer_id, game)
+        viewed = np.frombuffer(await self.db.get_viewed_ids(viewer_id, game), dtype=np.int64)
+
+        eligible = index.active & (index.user_ids != viewer_id) & self._matches(index, game, filters)
+        for skipped in (viewed, np.array(sorted(set(exclude)), dtype=np.int64)):
+            if len(skipped):
+                positions = np.searchsorted(skipped, index.user_ids).clip(max=len(skipped) - 1)
+                eligible &= skipped[positions] != index.user_ids
+
+        candidates = np.flatnonzero(eligible)
+        scores = self.score(index, game, viewer)[candidates]
+        if len(candidates) > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            candidates, scores = candidates[top], scores[top]
+        candidates = candidates[np.argsort(-scores, kind='stable')]
+
+        return await self.db.get_profiles(index.user_ids[candidates].tolist(), game)
+
+    def score(self, index: _GameIndex, game: str, viewer: Optional[Dict]) -> np.ndarray:
+        """Оценки совместимости всех анкет индекса со зрителем"""
+        viewer = viewer or {}
+        weights = self.weights
+        scores = np.zeros(len(index.user_ids), dtype=np.float32)
+
+        # Позиции: доля ролей кандидата, которых у зрителя нет
+        if weights['positions']:
+            viewer_positions = encode_positions(game, viewer.get('positions', []))
+            missing = ((1 << len(POSITIONS.get(game, []))) - 1) & ~viewer_positions
+            total = _POPCOUNT[index.positions]
+            complementary = _POPCOUNT[index.positions & missing]
+            scores += weights['positions'] * np.divide(
+                complementary, total, out=np.zeros_like(total), where=total > 0
+            )
+
+        # Цели: коэффициент Жаккара
+        viewer_goals = encode_goals(viewer.get('goals', []))
+        if weights['goals'] and viewer_goals:
+            union = _POPCOUNT[index.goals | viewer_goals]
+            common = _POPCOUNT[index.goals & viewer_goals]
+            scores += weights['goals'] * np.divide(common, union, out=np.zeros_like(union), where=union > 0)
+
+        # Страна: та же - 1, тот же регион - 0.5
+        viewer_country = _COUNTRY_CODES.get(viewer.get('country'), _NO_COUNTRY)
+        if weights['country'] and viewer_country != _NO_COUNTRY:
+            region = _COUNTRY_REGION[viewer_country]
+            nearby = _COUNTRY_REGION[index.country] == region if region >= 0 else False
+            scores += weights['country'] * np.where(
+                index.country == viewer_country, 1.0, np.where(nearby, 0.5, 0.0)
+            ).astype(np.float32)
+
+        # Рейтинг, сглаженный к _PRIOR_RATING: один отзыв на 5 не обгоняет
+        # анкету с двадцатью отзывами на 4.8
+        if weights['rating']:
+            smoothed = (index.rating_sum + _PRIOR_RATING * _PRIOR_COUNT) / (index.review_count + _PRIOR_COUNT)
+            scores += weights['rating'] * smoothed / 5
+
+        if weights['random']:
+            scores += weights['random'] * self._rng.random(len(scores), dtype=np.float32)
+        return scores
+
+    def _matches(self, index: _GameIndex, game: str, filters: Optional[Dict]) -> np.ndarray:
+        """Фильтры поиска, как в database._search_filters"""
+        matches = np.ones(len(index.user_ids), dtype=bool)
+        if not filters:
+            return matches
+
+        if filters.get('country'):
+            matches &= index.country == _COUNTRY_CODES.get(filters['country'], -1)
+        positions = encode_positions(game, filters.get('positions', []))
+        if positions:
+            matches &= (index.positions & positions) != 0
+        goals = encode_goals(filters.get('goals', []))
+        if goals:
+            matches &= (index.goals & goals) != 0
+        if filters.get('min_rating'):
+            average = np.divide(
+                index.rating_sum, index.review_count,
+                out=np.zeros_like(index.rating_sum), where=index.review_count > 0
+            )
+            matches &= average >= filters['min_rating']
+        return matches
+
+    async def _index(self, game: str) -> _GameIndex:
+        async with self._locks[game]:
+            index = self._indexes.get(game)
+            # Изменения во время загрузки попадут в следующий _dirty
+            dirty, self._dirty[game] = self._dirty[game], set()
+
+            if index is None:
+                index = self._indexes[game] = _GameIndex(await self.db.get_ranking_rows(game))
+                logger.info("Индекс ранжирования %s: %d анкет", game, len(index.user_ids))
+            elif dirty:
+                index.update(await self.db.get_ranking_rows(game, dirty), dirty)
+            return index
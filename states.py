@@ -1,3 +1,4 @@
+from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
 
@@ -16,6 +17,7 @@ class ProfileCreation(StatesGroup):
 
 class SearchState(StatesGroup):
     viewing_profiles = State()
+    setting_filters = State()
 
 
 class ReviewState(StatesGroup):
@@ -25,4 +27,12 @@ class ReviewState(StatesGroup):
 
 class ReportState(StatesGroup):
     choosing_reason = State()
-    entering_comment = State()
\ No newline at end of file
+    entering_comment = State()
+
+
+async def clear_state(state: FSMContext):
+    """Сбрасывает состояние и данные, кроме фильтров поиска"""
+    filters = (await state.get_data()).get('search_filters')
+    await state.clear()
+    if filters:
+        await state.update_data(search_filters=filters)
@@ -0,0 +1,64 @@
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from cache import LRUCache
+from config import FSM_CACHE_SIZE, FSM_CACHE_TTL
+from database import Database
+from metrics import timed
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище FSM в таблице fsm_states общей базы.
+
+    Недавно активные пользователи держатся в памяти (LRU с временем жизни),
+    запись в БД идет через очередь групповой записи Database, поэтому
+    шаг анкеты не ждет коммита. Состояние переживает перезапуск бота,
+    а память ограничена числом активных пользователей
+    """
+
+    def __init__(self, db: Database, maxsize: int = FSM_CACHE_SIZE, ttl: float = FSM_CACHE_TTL,
+                 key_builder: Optional[KeyBuilder] = None):
+        self.db = db
+        # (state, data) по ключу хранилища
+        self.cache = LRUCache(maxsize, ttl)
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        _, data = await self._get(key)
+        await self._set(key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._get(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        state, _ = await self._get(key)
+        await self._set(key, state, data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._get(key)
+        return data.copy()
+
+    async def close(self) -> None:
+        # Соединения принадлежат Database, очередь дописывает db.close()
+        self.cache.clear()
+
+    async def _get(self, key: StorageKey) -> tuple:
+        name = self.key_builder.build(key)
+        record = self.cache.get(name)
+        if record is None:
+            with timed('fsm'):
+                # Запись, сделанная пока шло чтение из БД, свежее прочитанного
+                record = self.cache.add(name, await self.db.get_fsm_record(name, key.user_id))
+        return record
+
+    async def _set(self, key: StorageKey, state: Optional[str], data: Dict[str, Any]):
+        name = self.key_builder.build(key)
+        self.cache.set(name, (state, data))
+        with timed('fsm'):
+            await self.db.save_fsm_record(name, key.user_id, state, data)
@@ -0,0 +1,34 @@
+import sys
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import pytest
+
+# Модули бота лежат в корне репозитория
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database import Database  # noqa: E402
+
+
+@pytest.fixture
+def open_database(tmp_path):
+    """Новая база во временной папке: async with open_database() as db.
+    Тесты асинхронные через asyncio.run, поэтому база открывается внутри него"""
+
+    @asynccontextmanager
+    async def open_database(**kwargs):
+        db = Database(str(tmp_path / 'test.db'), **kwargs)
+        await db.connect()
+        await db.create_tables()
+        try:
+            yield db
+        finally:
+            await db.close()
+
+    return open_database
+
+
+async def add_profile(db: Database, user_id: int, game: str, **data):
+    """Пользователь с анкетой; data - поля как в данных состояния ProfileCreation"""
+    await db.add_user(user_id, f'user{user_id}')
+    await db.create_or_update_profile(user_id, game, data)
@@ -0,0 +1,69 @@
+"""Лента кандидатов: анкеты, измененные во время загрузки пачек"""
+import asyncio
+
+from feed import CandidateFeed
+
+
+class FakeDatabase:
+    """Вместо Database: каждый зритель видит одни и те же анкеты,
+    загрузка пачки занимает delays[viewer_id] секунд или delay"""
+
+    def __init__(self, user_ids, delay=0.05, delays=None):
+        self.user_ids = user_ids
+        self.delay = delay
+        self.delays = delays or {}
+        self.listeners = []
+
+    def add_profile_listener(self, listener):
+        self.listeners.append(listener)
+
+    def profile_changed(self, user_id, game):
+        for listener in self.listeners:
+            listener(user_id, game)
+
+    async def get_candidates(self, viewer_id, game, limit, exclude=(), filters=None):
+        await asyncio.sleep(self.delays.get(viewer_id, self.delay))
+        return [{'user_id': user_id, 'game': game} for user_id in self.user_ids if user_id not in exclude][:limit]
+
+    async def mark_viewed(self, viewer_id, viewed_id, game):
+        pass
+
+
+def test_change_during_refill_drops_only_stale_profiles():
+    async def scenario():
+        db = FakeDatabase([42, 43], delays={99: 1})
+        feed = CandidateFeed(db, low_watermark=0)
+        # Долгая загрузка другого зрителя идет все время теста
+        feed._schedule_refill((99, 'cs2'))
+
+        # Отзыв пришел, пока грузилась пачка зрителя 1: анкета 42 устарела
+        first = asyncio.create_task(feed.next(1, 'cs2'))
+        await asyncio.sleep(0.01)
+        db.profile_changed(42, 'cs2')
+        assert (await first)['user_id'] == 43
+
+        # Пачка зрителя 2 начата после изменения и уже прочитала свежую анкету
+        await asyncio.sleep(0.2)
+        assert (await feed.next(2, 'cs2'))['user_id'] == 42
+        await feed.close()
+
+    asyncio.run(scenario())
+
+
+def test_invalidate_removes_profile_from_buffers():
+    async def scenario():
+        db = FakeDatabase([42, 43, 44], delay=0)
+        feed = CandidateFeed(db, low_watermark=0)
+        for viewer_id in (1, 2):
+            await feed.next(viewer_id, 'cs2')
+
+        db.profile_changed(43, 'cs2')
+        assert [profile['user_id'] for profile in feed._buffers[(1, 'cs2')]] == [44]
+        assert [profile['user_id'] for profile in feed._buffers[(2, 'cs2')]] == [44]
+        assert (43, 'cs2') not in feed._viewers
+        # Показанные анкеты уходят из индекса
+        await feed.next(1, 'cs2')
+        assert feed._viewers[(44, 'cs2')] == {(2, 'cs2')}
+        await feed.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,90 @@
+"""Одновременные взаимные лайки: ровно один мэтч и одно уведомление на пару"""
+import asyncio
+from collections import Counter
+
+from database import Database
+from notifications import MatchNotifier
+
+PAIRS = 1000
+
+
+class FakeBot:
+    """Вместо Bot: запоминает отправленные уведомления"""
+
+    def __init__(self):
+        self.sent = Counter()
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent[chat_id] += 1
+
+
+async def seed(db: Database, users: int):
+    async with db._write() as w:
+        await w.executemany('INSERT INTO users (user_id, username) VALUES (?, ?)',
+                            [(user_id, f'user{user_id}') for user_id in range(1, users + 1)])
+        await w.executemany("INSERT INTO profiles (user_id, game) VALUES (?, 'cs2')",
+                            [(user_id,) for user_id in range(1, users + 1)])
+
+
+async def like(db: Database, notifier: MatchNotifier, from_user_id: int, to_user_id: int):
+    # Как handle_like: уведомление только если лайк создал мэтч
+    if await db.add_like(from_user_id, to_user_id, 'cs2'):
+        notifier.notify(from_user_id, to_user_id, 'cs2')
+        return True
+    return False
+
+
+async def count_matches(db: Database) -> int:
+    async with db._read() as r:
+        async with r.execute('SELECT COUNT(*), COUNT(DISTINCT user1_id || ":" || user2_id) FROM matches') as cursor:
+            total, distinct = await cursor.fetchone()
+    assert total == distinct
+    return total
+
+
+def test_concurrent_mutual_likes_make_one_match(open_database):
+    async def scenario():
+        async with open_database() as db:
+            await seed(db, PAIRS * 2)
+            bot = FakeBot()
+            notifier = MatchNotifier(bot, db, batch_delay=0)
+
+            # Пара (2i-1, 2i): оба лайка одновременно, все пары сразу
+            results = await asyncio.gather(*(
+                asyncio.gather(like(db, notifier, a, a + 1), like(db, notifier, a + 1, a))
+                for a in range(1, PAIRS * 2, 2)
+            ))
+            await notifier.close()
+
+            assert all(sorted(pair) == [False, True] for pair in results)
+            assert await count_matches(db) == PAIRS
+            # Каждому игроку - одно уведомление об одном мэтче
+            assert bot.sent == Counter({user_id: 1 for user_id in range(1, PAIRS * 2 + 1)})
+
+    asyncio.run(scenario())
+
+
+def test_mutual_likes_from_separate_connections(open_database):
+    """Два процесса бота на одной базе: гонка решается блокировкой SQLite"""
+    async def scenario():
+        async with open_database() as first:
+            await seed(first, PAIRS * 2)
+            second = Database(first.db_path)
+            await second.connect()
+            try:
+                bot = FakeBot()
+                notifiers = MatchNotifier(bot, first, batch_delay=0), MatchNotifier(bot, second, batch_delay=0)
+                results = await asyncio.gather(*(
+                    asyncio.gather(like(first, notifiers[0], a, a + 1), like(second, notifiers[1], a + 1, a))
+                    for a in range(1, PAIRS * 2, 2)
+                ))
+                for notifier in notifiers:
+                    await notifier.close()
+            finally:
+                await second.close()
+
+            assert all(sorted(pair) == [False, True] for pair in results)
+            assert await count_matches(first) == PAIRS
+            assert bot.sent == Counter({user_id: 1 for user_id in range(1, PAIRS * 2 + 1)})
+
+    asyncio.run(scenario())
@@ -0,0 +1,130 @@
+import asyncio
+import time
+from typing import Optional
+
+import pytest
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.types import Chat, Message
+
+from outbox import INTERACTIVE, NOTIFICATION, Outbox, send_priority
+
+
+class FakeSession(BaseSession):
+    """Bot API без сети: отвечает сразу, а на первые rejections[chat_id]
+    отправок в чат - 429 Too Many Requests с retry_after секунд"""
+
+    def __init__(self, rejections: Optional[dict] = None, retry_after: int = 1):
+        super().__init__()
+        self.rejections = dict(rejections or {})
+        self.retry_after = retry_after
+        # (метод, chat_id, время) успешных запросов
+        self.delivered = []
+        self.rejected = 0
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None):
+        chat_id = getattr(method, 'chat_id', None)
+        if self.rejections.get(chat_id) and method.__api_method__ == 'sendMessage':
+            self.rejections[chat_id] -= 1
+            self.rejected += 1
+            raise TelegramRetryAfter(method=method, message='Too Many Requests', retry_after=self.retry_after)
+        self.delivered.append((method.__api_method__, chat_id, time.monotonic()))
+        if method.__api_method__ == 'sendMessage':
+            return Message(message_id=len(self.delivered), date=0, chat=Chat(id=chat_id, type='private'), text='ok')
+        return True
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b''
+
+
+def make_bot(outbox: Outbox, session: FakeSession) -> Bot:
+    bot = Bot(token='123:test', session=session)
+    bot.session.middleware(outbox)
+    return bot
+
+
+def test_retry_after_429_pauses_only_that_chat():
+    async def scenario():
+        session = FakeSession(rejections={1: 1})
+        outbox = Outbox(global_rate=100, chat_rate=100, chat_burst=10)
+        bot = make_bot(outbox, session)
+
+        started = time.monotonic()
+        await asyncio.gather(bot.send_message(1, 'a'), bot.send_message(2, 'b'))
+        await outbox.close()
+
+        delivered = {chat_id: at - started for _, chat_id, at in session.delivered}
+        assert session.rejected == 1
+        # Сообщение не потеряно, а повторено после паузы
+        assert delivered[1] >= 0.9
+        # Соседний чат паузу не ждал
+        assert delivered[2] < 0.5
+
+    asyncio.run(scenario())
+
+
+def test_gives_up_after_max_retries():
+    async def scenario():
+        session = FakeSession(rejections={1: 100}, retry_after=0)
+        outbox = Outbox(global_rate=100, chat_rate=100, chat_burst=10, max_retries=2)
+        bot = make_bot(outbox, session)
+
+        with pytest.raises(TelegramRetryAfter):
+            await bot.send_message(1, 'a')
+        await outbox.close()
+        assert session.rejected == 3
+
+    asyncio.run(scenario())
+
+
+def test_interactive_lane_goes_before_notifications():
+    async def scenario():
+        session = FakeSession()
+        # Лимит бота - 10 в секунду, сразу можно одно сообщение
+        outbox = Outbox(global_rate=10, chat_rate=100, chat_burst=10)
+        outbox._global.tokens = 1
+        bot = make_bot(outbox, session)
+
+        async def notify(chat_id):
+            with send_priority(NOTIFICATION):
+                await bot.send_message(chat_id, 'digest')
+
+        # Первое уходит сразу, следующие встают в очереди
+        await bot.send_message(100, 'first')
+        notifications = [asyncio.create_task(notify(chat_id)) for chat_id in range(1, 4)]
+        await asyncio.sleep(0)
+        with send_priority(INTERACTIVE):
+            await bot.send_message(200, 'reply')
+        await asyncio.gather(*notifications)
+        await outbox.close()
+
+        order = [chat_id for _, chat_id, _ in session.delivered]
+        assert order[:2] == [100, 200]
+        assert sorted(order[2:]) == [1, 2, 3]
+
+    asyncio.run(scenario())
+
+
+def test_edits_and_deletes_skip_send_limits():
+    async def scenario():
+        session = FakeSession()
+        # Одно сообщение в чат в секунду, подряд - одно
+        outbox = Outbox(global_rate=1, chat_rate=1, chat_burst=1)
+        bot = make_bot(outbox, session)
+
+        started = time.monotonic()
+        message = await bot.send_message(1, 'card')
+        await bot.edit_message_text('card', chat_id=1, message_id=message.message_id)
+        await bot.delete_message(1, message.message_id)
+        elapsed = time.monotonic() - started
+        await outbox.close()
+
+        assert [method for method, _, _ in session.delivered] == ['sendMessage', 'editMessageText', 'deleteMessage']
+        assert elapsed < 0.5
+
+    asyncio.run(scenario())
@@ -0,0 +1,29 @@
+"""Перенос позиций и целей из JSON-колонок старой схемы в битовые маски"""
+import asyncio
+import shutil
+from pathlib import Path
+
+from database import Database
+
+SHIPPED_DB = Path(__file__).resolve().parent.parent / 'teamfinder.db'
+
+
+def test_shipped_database_keeps_positions_and_goals(tmp_path):
+    path = tmp_path / 'teamfinder.db'
+    shutil.copy(SHIPPED_DB, path)
+
+    async def scenario():
+        db = Database(str(path))
+        await db.connect()
+        try:
+            await db.create_tables()
+            return [await db.get_profile(user_id, 'cs2') for user_id in (1197841798, 5268670965, 1273404404)]
+        finally:
+            await db.close()
+
+    profiles = asyncio.run(scenario())
+    # Значения до переименования сопоставлены с текущими из config
+    assert [profile['positions'] for profile in profiles] == [
+        ['Lurker (Скрытный)'], ['IGL (Капитан) '], ['IGL (Капитан) ']
+    ]
+    assert [profile['goals'] for profile in profiles] == [['Рейтинговые игры']] * 3
@@ -0,0 +1,161 @@
+"""EXPLAIN QUERY PLAN для горячих запросов Database: ни один не должен
+читать большие таблицы целиком (SCAN). Планы снимает профилировщик
+запросов (profiler.py) с порогом 0 - на тех же SQL и параметрах,
+с которыми их выполняют методы Database"""
+import asyncio
+import random
+import re
+
+import pytest
+
+from config import COUNTRIES, GOALS, POSITIONS
+from database import Database, encode_goals, encode_positions
+
+# Таблицы, растущие с числом пользователей
+LARGE_TABLES = {'users', 'profiles', 'likes', 'matches', 'reviews', 'viewed_chunks', 'fsm_states'}
+USERS = 3000
+
+_TABLE_ALIAS = re.compile(r'\b(?:FROM|JOIN|INTO|UPDATE)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+_SQL_WORDS = {'WHERE', 'JOIN', 'ON', 'LEFT', 'INNER', 'GROUP', 'ORDER', 'LIMIT', 'UNION', 'AND', 'SET', 'VALUES'}
+
+
+@pytest.fixture(scope='module')
+def seeded_path(tmp_path_factory):
+    """База с USERS пользователями, анкетами, лайками, мэтчами и отзывами"""
+    path = str(tmp_path_factory.mktemp('plans') / 'plans.db')
+    rnd = random.Random(1)
+
+    async def seed():
+        db = Database(path, profile=False)
+        await db.connect()
+        await db.create_tables()
+        countries = list(COUNTRIES)
+        profiles = []
+        for user_id in range(1, USERS + 1):
+            for game in ('cs2', 'dota2')[:1 + user_id % 2]:
+                profiles.append((
+                    user_id, game, rnd.choice(countries),
+                    encode_positions(game, rnd.sample(POSITIONS[game], 2)), encode_goals(rnd.sample(GOALS, 2)),
+                    rnd.uniform(1, 5)
+                ))
+        likes = {(rnd.randint(1, USERS), rnd.randint(1, USERS)) for _ in range(USERS * 10)}
+        matches = {(rnd.randint(1, USERS), rnd.randint(1, USERS)) for _ in range(USERS * 2)}
+
+        async with db._write() as w:
+            await w.executemany('INSERT INTO users (user_id, username) VALUES (?, ?)',
+                                [(user_id, f'user{user_id}') for user_id in range(1, USERS + 1)])
+            await w.executemany('''
+                INSERT INTO profiles (user_id, game, country, positions_mask, goals_mask, avg_rating)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', profiles)
+            await w.executemany("INSERT OR IGNORE INTO likes (from_user_id, to_user_id, game) VALUES (?, ?, 'cs2')",
+                                sorted(likes))
+            await w.executemany("INSERT OR IGNORE INTO matches (user1_id, user2_id, game) VALUES (?, ?, 'cs2')",
+                                sorted(matches))
+            await w.executemany(
+                "INSERT OR IGNORE INTO reviews (from_user_id, to_user_id, game, rating) VALUES (?, ?, 'cs2', 4)",
+                sorted(matches)
+            )
+        for viewer_id in range(1, 200):
+            for viewed_id in rnd.sample(range(1, USERS + 1), 50):
+                await db.mark_viewed(viewer_id, viewed_id, 'cs2')
+        await db.close()
+
+    asyncio.run(seed())
+    return path
+
+
+async def _like_back(db: Database):
+    await db.add_like(10, 11, 'cs2')
+    await db.add_like(11, 10, 'cs2')
+
+
+async def _mark_viewed(db: Database):
+    await db.mark_viewed(5, 42, 'cs2')
+    await db.flush()
+
+
+async def _save_fsm(db: Database):
+    await db.save_fsm_record('123:5:5', 5, 'SearchState:viewing_profiles', {'search_game': 'cs2'})
+    await db.flush()
+    await db.save_fsm_record('123:5:5', 5, None, {})
+    await db.flush()
+
+
+async def _update_profile(db: Database):
+    await db.create_or_update_profile(5, 'dota2', {'positions': [POSITIONS['dota2'][0]], 'country': 'Россия'})
+
+
+async def _page_matches(db: Database):
+    first = await db.get_matches(7, limit=2)
+    await db.get_matches(7, 'cs2', limit=2, after=first[-1]['match_id'] if first else 1)
+    await db.get_matches(7, 'cs2', limit=2, before=1)
+
+
+async def _page_likes(db: Database):
+    first = await db.get_incoming_likes(7, limit=2)
+    await db.get_incoming_likes(7, 'cs2', limit=2, after=first[-1]['like_id'] if first else 1)
+
+
+HOT_QUERIES = {
+    'get_profile': lambda db: db.get_profile(5, 'cs2'),
+    'get_profiles': lambda db: db.get_profiles(range(1, 41), 'cs2'),
+    'get_user_games': lambda db: db.get_user_games(5),
+    'get_candidates': lambda db: db.get_candidates(5, 'cs2', 20),
+    'get_candidates_filters': lambda db: db.get_candidates(5, 'cs2', 20, filters={
+        'positions': POSITIONS['cs2'][:2], 'goals': GOALS[:2], 'min_rating': 3,
+    }),
+    'get_candidates_country': lambda db: db.get_candidates(5, 'cs2', 20, filters={'country': 'Россия'}),
+    'get_ranking_rows_dirty': lambda db: db.get_ranking_rows('cs2', [1, 2, 3]),
+    'get_viewed_ids': lambda db: db.get_viewed_ids(5, 'cs2'),
+    'mark_viewed': _mark_viewed,
+    'reset_viewed_profiles': lambda db: db.reset_viewed_profiles(5, 'cs2'),
+    'add_like': _like_back,
+    'get_matches': lambda db: db.get_matches(7),
+    'get_matches_pages': _page_matches,
+    'get_incoming_likes': lambda db: db.get_incoming_likes(7),
+    'get_incoming_likes_pages': _page_likes,
+    'add_review': lambda db: db.add_review(8, 9, 'cs2', 5),
+    'create_or_update_profile': _update_profile,
+    'fsm_records': _save_fsm,
+    'get_fsm_record': lambda db: db.get_fsm_record('123:5:5', 5),
+}
+
+
+def _tables(sql: str) -> dict:
+    """Псевдоним или имя -> таблица для всех таблиц запроса"""
+    tables = {}
+    for table, alias in _TABLE_ALIAS.findall(sql):
+        tables[table] = table
+        if alias and alias.upper() not in _SQL_WORDS:
+            tables[alias] = table
+    return tables
+
+
+def _scans(sql: str, plan: list) -> list:
+    tables = _tables(sql)
+    scans = []
+    for detail in plan:
+        match = re.match(r'SCAN (\w+)', detail)
+        if match and tables.get(match.group(1), match.group(1)) in LARGE_TABLES:
+            scans.append(detail)
+    return scans
+
+
+@pytest.mark.parametrize('name', list(HOT_QUERIES))
+def test_hot_query_does_not_scan_large_tables(seeded_path, name):
+    async def scenario():
+        db = Database(seeded_path, profile=True)
+        await db.connect()
+        db.profiler.threshold = 0
+        try:
+            await HOT_QUERIES[name](db)
+            await db.flush()
+        finally:
+            await db.close()
+        return [stats for stats in db.profiler.stats.values() if stats.plan]
+
+    statements = asyncio.run(scenario())
+    assert statements, "не выполнено ни одного запроса с планом"
+    scans = {stats.sql: _scans(stats.sql, stats.plan) for stats in statements}
+    assert not {sql: plan for sql, plan in scans.items() if plan}
@@ -0,0 +1,95 @@
+import asyncio
+from types import SimpleNamespace
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from cards import ProfileCards
+from config import POSITIONS
+from conftest import add_profile
+from feed import CandidateFeed
+from handlers.search import show_next_profile
+from ranking import CompatibilityRanker
+
+SUPPORT, SNIPER, LURKER, ENTRY, IGL = POSITIONS['cs2']
+CARRY, MID, OFFLANE, SOFT_SUPPORT, HARD_SUPPORT = POSITIONS['dota2']
+# Без случайной добавки и рейтинга порядок задают только анкеты
+WEIGHTS = {'random': 0, 'rating': 0}
+BOT_ID = 123
+
+
+async def seed(db):
+    # Зрители: закрывают разные роли, ищут разное, из разных регионов
+    await add_profile(db, 1, 'cs2', positions=[SUPPORT], goals=['Паблики'], country='Россия')
+    await add_profile(db, 1, 'dota2', positions=[CARRY], goals=['Турниры'], country='Россия')
+    await add_profile(db, 2, 'cs2', positions=[SNIPER, LURKER, ENTRY, IGL], goals=['Турниры'], country='США')
+    # Кандидаты
+    await add_profile(db, 10, 'cs2', positions=[SUPPORT], goals=['Турниры'], country='США')
+    await add_profile(db, 11, 'cs2', positions=[ENTRY], goals=['Паблики'], country='Беларусь')
+    await add_profile(db, 20, 'dota2', positions=[CARRY], goals=['Турниры'], country='Россия')
+    await add_profile(db, 21, 'dota2', positions=[HARD_SUPPORT], goals=['Турниры'], country='Россия')
+
+
+async def ranked_ids(ranker, viewer_id, game):
+    return [profile['user_id'] for profile in await ranker.get_candidates(viewer_id, game, 10)]
+
+
+def test_order_depends_on_viewer_profile(open_database):
+    async def scenario():
+        async with open_database() as db:
+            await seed(db)
+            ranker = CompatibilityRanker(db, weights=WEIGHTS)
+            # Поддержке нужен открывающий из СНГ с теми же целями,
+            # затем любые другие роли; вторая поддержка - последней
+            assert await ranked_ids(ranker, 1, 'cs2') == [11, 2, 10]
+            # Остальным ролям - поддержка из США, ищущая турниры
+            assert await ranked_ids(ranker, 2, 'cs2') == [10, 1, 11]
+            # В Dota 2 у того же игрока своя анкета: керри ищет саппорта
+            assert await ranked_ids(ranker, 1, 'dota2') == [21, 20]
+
+    asyncio.run(scenario())
+
+
+def test_same_region_ranks_above_other_region(open_database):
+    async def scenario():
+        async with open_database() as db:
+            await add_profile(db, 1, 'cs2', positions=[SUPPORT], country='Россия')
+            await add_profile(db, 10, 'cs2', positions=[ENTRY], country='Бразилия')
+            await add_profile(db, 11, 'cs2', positions=[ENTRY], country='Казахстан')
+            await add_profile(db, 12, 'cs2', positions=[ENTRY], country='Россия')
+            ranker = CompatibilityRanker(db, weights=WEIGHTS)
+            assert await ranked_ids(ranker, 1, 'cs2') == [12, 11, 10]
+
+    asyncio.run(scenario())
+
+
+class FakeMessage:
+    """Сообщение бота с кнопками: from_user - сам бот, как в callback.message"""
+
+    def __init__(self):
+        self.from_user = SimpleNamespace(id=BOT_ID, is_bot=True)
+        self.sent = []
+
+    async def answer(self, text, **kwargs):
+        self.sent.append(text)
+
+    async def answer_photo(self, photo, caption=None, **kwargs):
+        self.sent.append(caption)
+
+
+def test_swipe_ranks_for_user_not_bot(open_database):
+    async def scenario():
+        async with open_database() as db:
+            await seed(db)
+            feed = CandidateFeed(db, ranker=CompatibilityRanker(db, weights=WEIGHTS))
+            shown = {}
+            for viewer_id in (1, 2):
+                state = FSMContext(MemoryStorage(), StorageKey(bot_id=BOT_ID, chat_id=viewer_id, user_id=viewer_id))
+                await state.update_data(search_game='cs2')
+                await show_next_profile(FakeMessage(), viewer_id, state, feed, ProfileCards(db))
+                shown[viewer_id] = (await state.get_data())['current_profile_id']
+            await feed.close()
+            assert shown == {1: 11, 2: 10}
+
+    asyncio.run(scenario())
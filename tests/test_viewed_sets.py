@@ -0,0 +1,67 @@
+"""Множество просмотренных анкет, разбитое на части viewed_chunks"""
+import asyncio
+import random
+import sqlite3
+from array import array
+
+from database import Database, _VIEWED_CHUNK_SIZE, _pack_ids
+
+
+async def chunk_sizes(db: Database, viewer_id: int) -> list:
+    async with db._read() as r:
+        async with r.execute(
+            'SELECT first_id, length(viewed_ids) / 8 FROM viewed_chunks WHERE viewer_id = ? ORDER BY first_id',
+            (viewer_id,)
+        ) as cursor:
+            return await cursor.fetchall()
+
+
+def test_views_split_into_chunks_and_read_back_sorted(open_database):
+    async def scenario():
+        async with open_database() as db:
+            rnd = random.Random(1)
+            viewed = rnd.sample(range(1, 10 ** 9), _VIEWED_CHUNK_SIZE * 4)
+            for i, viewed_id in enumerate(viewed):
+                await db.mark_viewed(1, viewed_id, 'cs2')
+                # Повторный просмотр не дублирует id
+                await db.mark_viewed(1, viewed[i // 2], 'cs2')
+                if i % 50 == 0:
+                    await db.flush()
+            await db.flush()
+
+            assert list(await db.get_viewed_ids(1, 'cs2')) == sorted(viewed)
+            chunks = await chunk_sizes(db, 1)
+            assert len(chunks) > 4
+            assert chunks[0][0] == 0
+            assert all(size <= _VIEWED_CHUNK_SIZE for _, size in chunks)
+
+            await db.reset_viewed_profiles(1, 'cs2')
+            assert list(await db.get_viewed_ids(1, 'cs2')) == []
+
+    asyncio.run(scenario())
+
+
+def test_viewed_sets_migrated_to_chunks(tmp_path):
+    path = str(tmp_path / 'old.db')
+    ids = list(range(1, _VIEWED_CHUNK_SIZE * 3, 2))
+    old = sqlite3.connect(path)
+    old.execute('CREATE TABLE viewed_sets (viewer_id INTEGER, game TEXT, viewed_ids BLOB, PRIMARY KEY (viewer_id, game))')
+    old.execute('INSERT INTO viewed_sets VALUES (1, ?, ?)', ('cs2', _pack_ids(array('q', ids))))
+    old.commit()
+    old.close()
+
+    async def scenario():
+        db = Database(path)
+        await db.connect()
+        try:
+            await db.create_tables()
+            assert list(await db.get_viewed_ids(1, 'cs2')) == ids
+            assert len(await chunk_sizes(db, 1)) > 1
+            # После переноса просмотры дописываются в нужную часть
+            await db.mark_viewed(1, 2, 'cs2')
+            await db.flush()
+            assert list(await db.get_viewed_ids(1, 'cs2')) == sorted(ids + [2])
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,122 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from aiogram import Bot
+from aiogram.types import Chat, Message, Update, User
+
+import bot
+from config import WEBHOOK_PATH
+from handlers import start, profile, search, matches, admin
+from loadtest import FakeSession
+
+SECRET = 'test-secret'
+
+
+class SlowSession(FakeSession):
+    """FakeSession, считающая запросы, на которые уже пришел ответ"""
+
+    def __init__(self, latency: float):
+        super().__init__(latency)
+        self.completed = 0
+
+    async def make_request(self, *args, **kwargs):
+        result = await super().make_request(*args, **kwargs)
+        self.completed += 1
+        return result
+
+
+@pytest.mark.parametrize('host', ['0.0.0.0', '::', '10.0.0.5', 'bot.example.com'])
+def test_public_webhook_requires_secret(monkeypatch, host):
+    monkeypatch.setattr(bot, 'WEBHOOK_SECRET', '')
+    monkeypatch.setattr(bot, 'WEBHOOK_HOST', host)
+    with pytest.raises(RuntimeError, match='WEBHOOK_SECRET'):
+        asyncio.run(bot.run_webhook(None, None))
+
+
+@pytest.mark.parametrize('host', ['127.0.0.1', '::1', 'localhost'])
+def test_loopback_webhook_allowed_without_secret(host):
+    assert bot.is_loopback(host)
+
+
+@pytest.fixture
+def detach_routers():
+    """Роутеры обработчиков - объекты модулей и подключаются к одному
+    диспетчеру: после теста отвязываем их для диспетчера следующего"""
+    yield
+    for module in (start, profile, search, matches, admin):
+        module.router._parent_router = None
+
+
+def start_update(update_id: int, user_id: int) -> str:
+    """Обновление /start в том виде, в каком его присылает Telegram"""
+    user = User(id=user_id, is_bot=False, first_name=f'user{user_id}', username=f'user{user_id}')
+    message = Message(message_id=update_id, date=datetime.now(), chat=Chat(id=user_id, type='private'),
+                      from_user=user, text='/start')
+    return Update(update_id=update_id, message=message).model_dump_json(exclude_none=True)
+
+
+async def post_updates(db, background: bool, users: int, secret: str = SECRET, latency: float = 0):
+    """POST обновлений /start на вебхук; возвращает статусы и сессию бота"""
+    session = SlowSession(latency)
+    telegram_bot = Bot(token='123:test', session=session)
+    dp = bot.create_dispatcher(telegram_bot, db)
+    app, _ = bot.create_webhook_app(dp, telegram_bot, secret=SECRET, background=background)
+    statuses = []
+    # Выход из клиента останавливает приложение, как runner.cleanup() в run_webhook
+    async with TestClient(TestServer(app)) as client:
+        for user_id in range(1, users + 1):
+            response = await client.post(WEBHOOK_PATH, data=start_update(user_id, user_id), headers={
+                'Content-Type': 'application/json', 'X-Telegram-Bot-Api-Secret-Token': secret,
+            })
+            statuses.append(response.status)
+    await bot.shutdown(dp, telegram_bot)
+    return statuses, session
+
+
+async def count_users(path: str) -> int:
+    db = bot.Database(path)
+    await db.connect()
+    try:
+        async with db._read() as r:
+            async with r.execute('SELECT COUNT(*) FROM users') as cursor:
+                return (await cursor.fetchone())[0]
+    finally:
+        await db.close()
+
+
+@pytest.mark.parametrize('background', [False, True])
+def test_posted_update_is_handled(open_database, detach_routers, background):
+    async def scenario():
+        async with open_database() as db:
+            statuses, session = await post_updates(db, background, users=3)
+        assert statuses == [200, 200, 200]
+        assert session.calls['SendMessage'] == 3
+        assert await count_users(db.db_path) == 3
+
+    asyncio.run(scenario())
+
+
+def test_wrong_secret_is_rejected(open_database, detach_routers):
+    async def scenario():
+        async with open_database() as db:
+            statuses, session = await post_updates(db, False, users=1, secret='wrong')
+        assert statuses == [401]
+        assert not session.calls
+
+    asyncio.run(scenario())
+
+
+def test_stop_waits_for_background_updates(open_database, detach_routers):
+    """Остановка приложения дожидается обработчиков, принятых в фоне,
+    до того как shutdown() закроет уведомления, Outbox и базу"""
+    async def scenario():
+        async with open_database() as db:
+            statuses, session = await post_updates(db, True, users=20, latency=0.2)
+        assert statuses == [200] * 20
+        # Все ответы Bot API получены до закрытия, а не брошены на полпути
+        assert session.completed == 20
+        assert await count_users(db.db_path) == 20
+
+    asyncio.run(scenario())
@@ -0,0 +1,36 @@
+"""Очередь групповой записи Database"""
+import asyncio
+
+from conftest import add_profile
+
+
+def test_cancelled_reader_does_not_lose_the_batch(open_database):
+    """Отмена задачи, которая дописывает очередь перед чтением (подгрузка
+    ленты при close()), не откатывает пачку с чужими записями"""
+    async def scenario():
+        async with open_database(write_delay=10) as db:
+            for user_id in (1, 2):
+                await add_profile(db, user_id, 'cs2')
+
+            like = asyncio.create_task(db.add_like(2, 1, 'cs2'))
+            await asyncio.sleep(0)
+            for viewed_id in range(1000, 1300):
+                await db.mark_viewed(1, viewed_id, 'cs2')
+
+            # Медленная операция держит пачку открытой, пока читателя отменяют
+            async def slow(_):
+                await asyncio.sleep(0.2)
+            await db._enqueue(slow, 1)
+
+            refill = asyncio.create_task(db.get_candidates(1, 'cs2', 20))
+            await asyncio.sleep(0.1)
+            refill.cancel()
+            await asyncio.gather(refill, return_exceptions=True)
+
+            assert await asyncio.wait_for(like, timeout=1) is False
+            assert len(await db.get_viewed_ids(1, 'cs2')) == 300
+            async with db._read() as r:
+                async with r.execute('SELECT COUNT(*) FROM likes') as cursor:
+                    assert (await cursor.fetchone())[0] == 1
+
+    asyncio.run(scenario())